@@ -4,6 +4,8 @@
 # Created on: 2019-12-04 09:21:32.00000
 #   (generated by ArcGIS/ModelBuilder)
 # Description:
+# Requirements: Python 3.7 or later (ArcGIS Pro). 'funciones_catalogo.py' uses
+#   'date.fromisoformat', which is not available in ArcMap's Python 2.7
 # ---------------------------------------------------------------------------
 
 # Import arcpy module
@@ -45,29 +47,16 @@ mdt = pathMODIS + 'data/dem.asc'
 coordsMODIS = 'PROJCS["Sinusoidal",GEOGCS["GCS_Undefined",DATUM["D_Undefined",SPHEROID["User_Defined_Spheroid",6371007.181,0.0]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.017453292519943295]],PROJECTION["Sinusoidal"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",0.0],UNIT["Meter",1.0]]'
 coordsOut = 'PROJCS["ETRS89/UTM zone 30N",GEOGCS["ETRS89",DATUM["D_ETRS_1989",SPHEROID["GRS_1980",6378137,298.257222101]],PRIMEM["Greenwich",0],UNIT["Degree",0.017453292519943295]],PROJECTION["Transverse_Mercator"],PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",-3],PARAMETER["scale_factor",0.9996],PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["Meter",1]]'
 
-# convert date limits to datetime
-if dateslim is not None:
-    # convertir fechas límite en datetime.date
-    start = datetime.strptime(dateslim[0], '%Y-%m-%d').date()
-    end = datetime.strptime(dateslim[1], '%Y-%m-%d').date()
-
-# select dates and files
-dates, files = {tile: [] for tile in tiles}, {tile: [] for tile in tiles}
-for tile in tiles:
-    # seleccionar archivos del producto para las hojas y fechas indicadas
-    for file in [f for f in os.listdir(pathData) if (product in f) & (tile in f)]:
-        year = file.split('.')[1][1:5]
-        doy = file.split('.')[1][5:]
-        date = datetime.strptime(' '.join([year, doy]), '%Y %j').date()
-        if dateslim is not None:
-            if (date >= start) & (date <= end):
-                dates[tile].append(date)
-                files[tile].append(file)
-        else:
-            dates[tile].append(date)
-            files[tile].append(file)
+# select dates and files from the catalogue of the data folder (see 'funciones_catalogo.py')
+sys.path.insert(0, pathMODIS + 'py/')
+from funciones_catalogo import Catalogo
+catalogo = Catalogo(pathData)
+catalogo.actualizar()
+start, end = (None, None) if dateslim is None else dateslim
+files = catalogo.archivos(product, tiles, start=start, end=end)
+catalogo.cerrar()
 # create a joined, unique array of dates
-dates = np.sort(np.unique(np.array([date for tile in tiles for date in dates[tile]])))
+dates = np.sort(np.unique(np.array([date for tile in tiles for date in files[tile]])))
 
 # extract and manage data
 for d, date in enumerate(dates):
@@ -84,7 +73,7 @@ for d, date in enumerate(dates):
     for t, tile in enumerate(tiles):
 
         # file of the prescribed date and tile
-        file = [f for f in files[tile] if dateStr in f][0]
+        file = os.path.basename(files[tile][date])
 
         # extract file
         hdfs[tile] = arcpy.ExtractSubDataset_management(pathData + file, pathTemp + 'tile' + str(t), "1")
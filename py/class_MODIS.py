@@ -5,6 +5,8 @@
 
 
 import os
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 import ftputil
@@ -12,191 +14,58 @@ import geopandas as gpd
 from datetime import datetime, timedelta
 import subprocess
 import re
-from pyproj import Transformer
+import hashlib
+from pyproj import Transformer, CRS
 from sklearn.neighbors import KNeighborsRegressor, KNeighborsClassifier
+from scipy import sparse
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap, BoundaryNorm
 import matplotlib.patheffects as pe
 import matplotlib.animation as animation
 from IPython.display import HTML
 
+from funciones_extraccion import extraerMODIS, Mosaico, decodificar
 
 
 
-def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None, extent=None, verbose=True):
+
+def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None, extent=None, out=None, workers=None,
+                  nativo=False, qc=None, verbose=True):
     """Extrae los datos de MODIS para un producto, variable y fechas dadas, transforma las coordenadas y recorta a la zona de estudio.
     
     Entradas:
     ---------
     path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
     product:    string. Nombre del producto MODIS, p.ej. MOD16A2
-    var:        string. Variable de interés dentro de los archivos 'hdf'
-    factor:     float. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés)
+    var:        string o list. Variable de interés dentro de los archivos 'hdf'. Si es una lista, cada archivo se lee una única vez para todas las variables
+    factor:     float o dict. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés). Con varias variables, diccionario {var: factor}
     tiles:      list. Hojas del producto MODIS a tratar
     dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', se extraen los datos para todas las fechas disponibles
-    clip:       string. Ruta y nombre del archivo ASCII que se utilizará como máscara para recortar los datos. Si es 'None', se extraen todos los datos
-    coordsClip: pyproj.CRS. Proj del sistema de coordenadas al que se quieren transformar los datos. Si en 'None', se mantiene el sistema de coordenadas sinusoidal de MODIS
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', se extraen todos los datos
+    out:        array (dates, Y, X). 'Array' (p.ej. un np.memmap) en el que escribir los datos. Con varias variables, diccionario {var: array}. Si es 'None', se crea uno nuevo en memoria
+    workers:    int. Nº de procesos con los que leer los archivos 'hdf' en paralelo. Si es 'None', se leen en serie
+    nativo:     boolean. Si se quiere conservar el tipo de dato original (p.ej. int16) y decodificar los datos sólo al consultarlos. Véanse 'MODIS.decodificar' y 'MODIS.bloques'
+    qc:         boolean o dict. Si es True, se eliminan las celdas que no cumplen la regla de calidad por defecto del producto; un diccionario {campo: valores admitidos} la sustituye. Véase 'funciones_QC.py'
     verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
     
     Salidas:
     --------
-    Como métodos:
-        data:    array (Y, X) o (dates, Y, X). Mapas de la variable de interés. 3D si hay más de un archivo (más de una fecha)
-        Xcoords: array (2D). Coordenadas X de cada celda de los mapas de 'data'
-        Ycoords: array (2D). Coordenadas Y de cada celda de los mapas de 'data'
-        dates:   list. Fechas a las que corresponde cada uno de los maapas de 'data'
+    modis:      class MODIS. Mapas (dates, Y, X) de la variable de interés, con sus coordenadas X e Y y sus fechas. Si 'var' es una lista, diccionario {var: MODIS}
     """    
     
-    if os.path.exists(path + product + '/') is False:
-        os.makedirs(path + product + '/')
-    os.chdir(path + product + '/')
-    
-    # SELECCIÓN DE ARCHIVOS
-    # ---------------------
-    if dateslim is not None:
-        # convertir fechas límite en datetime.date
-        start = datetime.strptime(dateslim[0], '%Y-%m-%d').date()
-        end = datetime.strptime(dateslim[1], '%Y-%m-%d').date()
-    
-    dates, files = {tile: [] for tile in tiles}, {tile: [] for tile in tiles}
-    for tile in tiles:
-        # seleccionar archivos del producto para las hojas y fechas indicadas
-        for file in [f for f in os.listdir() if (product in f) & (tile in f)]:
-            year = file.split('.')[1][1:5]
-            doy = file.split('.')[1][5:]
-            date = datetime.strptime(' '.join([year, doy]), '%Y %j').date()
-            if dateslim is not None:
-                if (date>= start) & (date <= end):
-                    dates[tile].append(date)
-                    files[tile].append(file)
-            else:
-                dates[tile].append(date)
-                files[tile].append(file)
-    # comprobar que el número de archivos es igual en todas las hojas
-    if len(set([len(dates[tile]) for tile in tiles])) > 1:
-        print('¡ERROR! Diferente número de fechas en las diferentes hojas')
-        MODIS_extract.files = files
-        MODIS_extract.dates = dates
-        return 
-    else:
-        dates = np.sort(np.unique(np.array([date for tile in tiles for date in dates[tile]])))
-        if verbose:
-            print('Seleccionar archivos')
-            print('nº de archivos (fechas): {0:>3}'.format(len(dates)), end='\n\n')
-
-    # ATRIBUTOS MODIS
-    # ---------------
-    if verbose:
-        print('Generar atributos globales')
-    # extraer atributos para cada hoja
-    attributes = pd.DataFrame(index=tiles, columns=['ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'])
-    for tile in tiles:
-        attributes.loc[tile,:] = hdfAttrs(files[tile][0])
-
-    # extensión total
-    Xo = np.min(attributes.Xo)
-    Yf = np.max(attributes.Yf)
-    Xf = np.max(attributes.Xf)
-    Yo = np.min(attributes.Yo)
-    # nº total de columnas y filas
-    colsize = np.mean((attributes.Xf - attributes.Xo) / attributes.ncols)
-    ncols = int(round((Xf - Xo) / colsize, 0))
-    rowsize = np.mean((attributes.Yf - attributes.Yo) / attributes.nrows)
-    nrows = int(round((Yf - Yo) / rowsize, 0))
-    if verbose == True:
-        print('dimensión:\t\t({0:}, {1:})'.format(ncols, nrows))
-        print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xo, Yo))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xf, Yf), end='\n\n')
-
-    # coordenadas x de las celdas
-    Xmodis = np.linspace(Xo, Xf, ncols)
-    # coordenadas y de las celdas
-    Ymodis = np.linspace(Yf, Yo, nrows)
-        
-    # CREAR MÁSCARAS
-    # --------------
-    if extent is not None:
-        if verbose == True:
-            print('Crear máscaras')
-            
-        # crear máscara según la extensión
-        left, right, bottom, top =  extent
-        maskCols = (Xmodis >= left) & (Xmodis <= right)
-        maskRows = (Ymodis >= bottom) & (Ymodis <= top)
-        
-        # recortar coordenadas
-        Xmodis = Xmodis[maskCols]
-        Ymodis = Ymodis[maskRows]
-        
-        if verbose == True:
-            print('dimensión:\t\t({0:>4}, {1:>4})'.format(len(Ymodis), len(Xmodis)))
-            print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.min(), Ymodis.min()))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.max(), Ymodis.max()),
-              end='\n\n')
-
-    # IMPORTAR DATOS
-    # --------------
-    if verbose:
-        print('Importar datos')
-        
-    for d, date in enumerate(dates):
-        dateStr = str(date.year) + str(date.timetuple().tm_yday).zfill(3)
-
-        for t, tile in enumerate(tiles):
-            print('Fecha {0:>2} de {1:>2}: {2}\t||\tTile {3:>2} de {4:>2}: {5}'.format(d + 1, len(dates), date,
-                                                                                       t + 1, len(tiles), tile), end='\r')
-            
-            # localización de la hoja dentro del total de hojas
-            nc, nr, xo, yf, xf, yo = attributes.loc[tile, :]
-            i = int(round((Yf - yf) / (rowsize * attributes.nrows[t]), 0))
-            j = int(round((Xf - xf) / (colsize * attributes.ncols[t]), 0))
-
-            # archivo de la fecha y hoja dada
-            file = [f for f in files[tile] if dateStr in f][0]
-            # cargar archivo 'hdf'
-            hdf = Dataset(file, format='hdf4')
-            # extraer datos de la variable
-            tmp = hdf[var][:]
-            tmp = tmp.astype(float)
-            tmp[tmp.mask] = np.nan
-            hdf.close()
-            # guardar datos en un array global de la fecha
-            if t == 0:
-                dataD = tmp.copy()
-            else:
-                if (i == 1) & (j == 0):
-                    dataD = np.concatenate((dataD, tmp), axis=0)
-                elif (i == 0) & (j == 1):
-                    dataD = np.concatenate((dataD, tmp), axis=1)
-            del tmp
-        
-        # recortar array de la fecha con la máscara
-        if extent is not None:
-            dataD = dataD[maskRows, :][:, maskCols]
-            
-        # guardar datos en un array total
-        if d == 0:
-            data = dataD.copy()
-        else:
-            data = np.dstack((data, dataD))
-        del dataD
-    print()
-    
-    # multiplicar por el factor de escala (si existe)
-    if factor is not None:
-        data *= factor
-        
-    # reordenar el array (tiempo, Y, X)
-    if len(data.shape) == 3:
-        tmp = np.ones((data.shape[2], data.shape[0], data.shape[1])) * np.nan
-        for t in range(data.shape[2]):
-            tmp[t,:,:] = data[:,:,t]
-        data = tmp.copy()
-        del tmp
+    extraccion = extraerMODIS(path, product, var, tiles, factor=factor, dateslim=dateslim, extent=extent,
+                              out=out, workers=workers, nativo=nativo, qc=qc, verbose=verbose)
+    if extraccion is None:
+        return
+    data, Xmodis, Ymodis, dates, codificacion = extraccion
 
     # GUARDAR RESULTADOS
     # ------------------
-    modis = MODIS(data, Xmodis, Ymodis, dates, crs=sinusoidal)
+    if isinstance(var, str):
+        modis = MODIS(data, Xmodis, Ymodis, dates, crs=sinusoidal, codificacion=codificacion)
+    else:
+        modis = {v: MODIS(data[v], Xmodis, Ymodis, dates, label=v, crs=sinusoidal, codificacion=codificacion[v])
+                 for v in var}
     
     return modis
 
@@ -208,11 +77,20 @@ def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None, extent=
 # https://spatialreference.org/ref/sr-org/modis-sinusoidal/
 sinusoidal = CRS.from_proj4('+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +a=6371007.181 +b=6371007.181 +units=m +no_defs ')
 
+# carpeta por defecto de los planes de remuestreo guardados, compartida por todos los procesos
+PLANES = os.environ.get('PLANES_MODIS', os.path.join(os.path.expanduser('~'), '.cache', 'planes_MODIS'))
+
+# planes de remuestreo ya cargados en esta sesión: {firma: PlanRemuestreo}
+_planes = {}
+
+# máscaras de polígonos ya rasterizadas en esta sesión: {(hash del polígono, nº de columnas, hash de la malla): mask2D}
+_mascaras = {}
+
 
 
 
 class MODIS:
-    def __init__(self, data, X, Y, times, units=None, variable=None, label=None, crs=sinusoidal):
+    def __init__(self, data, X, Y, times, units=None, variable=None, label=None, crs=sinusoidal, codificacion=None):
         """Clase que contiene la información relevante de las predicciones del modelo HARMONIE para una variable concreta.
         
         Entradas:
@@ -225,6 +103,7 @@ class MODIS:
         variable: string. Descripción de la variable. P.ej. 'precipitación total'
         label:    string. Etiqueta de la variable. P.ej. 'APCP'
         crs:      string o callable. Sistema de coordenadas de referencia. Los datos originales están en 'epsg:4258'
+        codificacion: dict. Atributos de codificación si 'data' contiene los valores originales de MODIS (véase 'codificacionVariable'). Si es 'None', 'data' ya está decodificado
         """
         
         self.data = data
@@ -235,17 +114,79 @@ class MODIS:
         self.variable = variable
         self.label = label
         self.crs = crs
+        self.codificacion = codificacion
+        
+        
+    def decodificar(self, times=None, dtype=np.float32):
+        """Devuelve los datos decodificados (escala, desplazamiento y NaN en los valores nulos) de los pasos temporales indicados. Si los datos ya están decodificados, se devuelven tal cual.
+        
+        Entradas:
+        ---------
+        times:     int, slice o array. Índices de los pasos temporales a decodificar. Si es 'None', todos
+        dtype:     numpy.dtype. Tipo de dato del resultado
+        
+        Salidas:
+        --------
+        data:      array. Datos decodificados
+        """
+        
+        data = self.data if times is None else self.data[times]
+        if self.codificacion is None:
+            return data
+        
+        return decodificar(data, self.codificacion, self.codificacion.get('factor'), dtype)
+        
+        
+    def bloques(self, n=1, dtype=np.float32):
+        """Recorre los datos decodificados en bloques de 'n' pasos temporales, de modo que en memoria sólo hay un bloque en coma flotante a la vez.
+        
+        Entradas:
+        ---------
+        n:         int. Nº de pasos temporales de cada bloque
+        dtype:     numpy.dtype. Tipo de dato del resultado
+        
+        Salidas:
+        --------
+        Genera tuplas (times, data) con las fechas y el array (n, Y, X) decodificado de cada bloque
+        """
+        
+        for i in range(0, len(self.times), n):
+            yield self.times[i:i + n], self.decodificar(slice(i, i + n), dtype)
+        
+        
+    @classmethod
+    def desdeHojas(cls, hojas, attributes, times, units=None, variable=None, label=None):
+        """Genera un objeto MODIS a partir de los mapas de un conjunto cualquiera de hojas. Cada hoja se coloca en su posición de la malla sinusoidal y los huecos quedan como NaN.
+        
+        Entradas:
+        ---------
+        hojas:      dict. Para cada hoja, array (times, Y, X) con sus datos
+        attributes: pd.DataFrame. Atributos de cada hoja: 'ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'. Véanse 'atributosHojas' y 'atributosIndices'
+        times:      array (times,). Fecha de cada uno de los pasos temporales
+        units:      string. Unidades de la variable
+        variable:   string. Descripción de la variable
+        label:      string. Etiqueta de la variable
+        
+        Salidas:
+        --------
+        modis:      class MODIS
+        """
+        
+        mosaico = Mosaico(attributes)
+        data = mosaico.ensamblar(hojas)
+        
+        return cls(data, mosaico.X, mosaico.Y, times, units=units, variable=variable, label=label, crs=sinusoidal)
         
         
     def recortar(self, poligono, buffer=None, inplace=False):
-        """Recorta los datos de MODIS según el polígono.
+        """Recorta los datos de MODIS según el polígono. La máscara 2D de las celdas cuyo centro está dentro del polígono se rasteriza directamente sobre la malla (véase 'rasterizarPoligono') y se aplica a todas las fechas a la vez, sin crear una máscara 3D ni copiar el cubo completo.
 
         Entradas:
         ---------
         self:      class MODIS
         poligono:  geopandas.GeoDataframe. Polígono con el que recortar los mapas
         buffer:    float. Distancia a la que hacer una paralela al polígono antes del recorte
-        inplace:   boolean. Si se quiere sobreescribir el resultado sobre self o no
+        inplace:   boolean. Si se quiere sobreescribir el resultado sobre self o no. En ambos casos, 'mascara' contiene la máscara 2D del recorte, de sólo lectura (véase 'rasterizarPoligono')
         
         Salidas:
         --------
@@ -253,10 +194,6 @@ class MODIS:
             modis: class MODIS
         """
         
-        # extraer información de 'HARMONIE'
-        X, Y = self.X, self.Y
-        data = self.data
-
         # buffer
         if buffer is not None:
             poligono = poligono.buffer(buffer)
@@ -265,126 +202,668 @@ class MODIS:
         if self.crs != poligono.crs:
             poligono = poligono.to_crs(self.crs)
 
-        # extensión de la cuenca
-        Xbo, Ybo, Xbf, Ybf = poligono.bounds.loc[0,:]
-        # buffer
-        if buffer is not None:
-            Xbo -= buffer
-            Ybo -= buffer
-            Xbf += buffer
-            Ybf += buffer
-
-        # recortar según la extensión de la cuenca
-        maskC = (X >= Xbo) & (X <= Xbf)
-        maskR = (Y >= Ybo) & (Y <= Ybf)
-        data = data[:,maskR,:][:,:,maskC]
-        X = X[maskC]
-        Y = Y[maskR]
-
-        # GeoDataFrame de puntos de la malla MODIS
-        XX, YY = np.meshgrid(X.flatten(), Y.flatten())
-        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(XX.flatten(), YY.flatten(), crs=self.crs))
-
-        # máscara del polígono
-        inp, res = poligono.sindex.query_bulk(points.geometry, predicate='intersects')
-        mask = np.isin(np.arange(len(points)), inp)
-        mask2D = mask.reshape(XX.shape)
-
-        # máscara 3D a partir de la anterior
-        mask3D = np.zeros(data.shape, dtype=bool)
-        mask3D[:,:,:] = mask2D[np.newaxis,:,:]
-        
-        # recortar mapa al área del polígono
-    #     data_ma = np.ma.masked_array(data, ~mask3D)
-        data_ma = data.copy()
-        data_ma[~mask3D] = np.nan
-
-        # eliminar filas y columnas sin datos
-        maskR = np.isnan(data_ma.sum(axis=0)).all(axis=1)
-        maskC = np.isnan(data_ma.sum(axis=0)).all(axis=0)
-        data_ma = data_ma[:,~maskR,:][:,:,~maskC]
-    #     data_ma = np.ma.masked_invalid(data_ma)
-        Y = Y[~maskR]
-        X = X[~maskC]
+        # máscara del polígono en la malla MODIS
+        mask2D = rasterizarPoligono(poligono.unary_union, self.X, self.Y)
+
+        # recortar a las filas y columnas con alguna celda dentro del polígono
+        maskR, maskC = mask2D.any(axis=1), mask2D.any(axis=0)
+        if not maskR.any():
+            print('¡ERROR! El polígono no interseca con la malla de MODIS')
+            return
+        r0, r1 = np.argmax(maskR), len(maskR) - np.argmax(maskR[::-1])
+        c0, c1 = np.argmax(maskC), len(maskC) - np.argmax(maskC[::-1])
+        mask2D = mask2D[r0:r1, c0:c1]
+        X, Y = self.X[c0:c1], self.Y[r0:r1]
+
+        # aplicar la máscara a todas las fechas: el único 'array' nuevo es el resultado
+        nulo = np.nan if self.codificacion is None else self.codificacion['_FillValue']
+        data = np.where(mask2D, self.data[:, r0:r1, c0:c1], nulo)
         
         if inplace:
-            self.data = data_ma
+            self.data = data
             self.X = X
             self.Y = Y
-            self.mask3D = mask3D
+            self.mascara = mask2D
         else:
             # crear diccionario con los resultados  
-            modis = MODIS(data_ma, X, Y, self.times, crs=self.crs)
-            modis.mask3D = mask3D
+            modis = MODIS(data, X, Y, self.times, units=self.units, variable=self.variable, label=self.label,
+                          crs=self.crs, codificacion=self.codificacion)
+            modis.mascara = mask2D
             return modis
         
 
-    def reproyectar(self, crsOut, cellsize, n_neighbors=1, weights='distance', p=2, inplace=False):
+    def zonal(self, poligonos, columna=None, estadisticos=['mean', 'sum', 'count', 'min', 'max'], cobertura=False,
+              submuestreo=4, bloque=64):
+        """Series temporales de estadísticos zonales (media, suma, nº de celdas, mínimo y máximo) para muchos polígonos a la vez, p.ej. todas las subcuencas de una cuenca. Los polígonos se rasterizan una única vez en una malla de etiquetas (o, con 'cobertura', en una lista de celdas y pesos) y los estadísticos de todas las zonas se calculan en una sola pasada sobre el cubo con 'np.bincount', por bloques de fechas.
+
+        Entradas:
+        ---------
+        self:         class MODIS
+        poligonos:    geopandas.GeoDataFrame. Polígonos de las zonas
+        columna:      string. Columna de 'poligonos' con el identificador de cada zona. Si es 'None', el índice
+        estadisticos: list. Estadísticos a calcular: 'mean', 'sum', 'count', 'min', 'max'
+        cobertura:    boolean. Si es True, cada celda pondera según la fracción de su superficie dentro de cada polígono (las celdas del contorno cuentan en varias zonas). Si es False, cada celda pertenece a la zona que contiene su centro (si varios polígonos se solapan, a la del último)
+        submuestreo:  int. Con 'cobertura', nº de subdivisiones de cada celda por lado con las que estimar la fracción cubierta
+        bloque:       int. Nº de fechas que se procesan a la vez
+
+        Salidas:
+        --------
+        zonal:        dict. Para cada estadístico, pd.DataFrame (times, zonas). Con 'cobertura', 'sum' es la suma ponderada y 'count' la suma de los pesos de las celdas con dato
+        """
+
+        for estadistico in estadisticos:
+            if estadistico not in ['mean', 'sum', 'count', 'min', 'max']:
+                print('¡ERROR! Estadístico {0} no disponible'.format(estadistico))
+                return
+
+        # definir crs de los polígonos
+        if self.crs != poligonos.crs:
+            poligonos = poligonos.to_crs(self.crs)
+        ids = poligonos.index if columna is None else poligonos[columna]
+        nz = len(poligonos)
+
+        # RASTERIZAR ZONAS
+        # ----------------
+        ncols = len(self.X)
+        if cobertura:
+            # celdas, zonas y pesos de cada polígono
+            celdas, zonas, pesos = [], [], []
+            for z, geometria in enumerate(poligonos.geometry):
+                ventana = coberturaPoligono(geometria, self.X, self.Y, submuestreo)
+                if ventana is None:
+                    continue
+                rows, cols, frac = ventana
+                r, c = np.nonzero(frac)
+                celdas.append((r + rows.start) * ncols + c + cols.start)
+                zonas.append(np.full(len(r), z))
+                pesos.append(frac[r, c])
+            celdas = np.concatenate(celdas) if celdas else np.zeros(0, dtype=int)
+            zonas = np.concatenate(zonas) if zonas else np.zeros(0, dtype=int)
+            pesos = np.concatenate(pesos) if pesos else np.zeros(0)
+        else:
+            # malla de etiquetas: zona de cada celda (-1 fuera de todas)
+            etiquetas = np.full((len(self.Y), ncols), -1, dtype=np.int32)
+            for z, geometria in enumerate(poligonos.geometry):
+                ventana = coberturaPoligono(geometria, self.X, self.Y)
+                if ventana is None:
+                    continue
+                rows, cols, frac = ventana
+                etiquetas[rows, cols][frac > 0] = z
+            celdas = np.flatnonzero(etiquetas >= 0)
+            zonas = etiquetas.ravel()[celdas]
+            pesos = np.ones(len(celdas))
+
+        # ESTADÍSTICOS
+        # ------------
+        resultados = {estadistico: [] for estadistico in estadisticos}
+        for times, data in self.bloques(bloque):
+            T = data.shape[0]
+            valores = data.reshape(T, -1)[:, celdas]
+            validos = ~np.isnan(valores)
+            # índice (fecha, zona) de cada celda de cada fecha
+            idx = (zonas[np.newaxis, :] + nz * np.arange(T)[:, np.newaxis]).ravel()
+            w = np.where(validos, pesos, 0.).ravel()
+            n = np.bincount(idx, weights=w, minlength=T * nz).reshape(T, nz)
+            vacias = n == 0
+            if ('sum' in estadisticos) | ('mean' in estadisticos):
+                suma = np.bincount(idx, weights=w * np.where(validos, valores, 0.).ravel(),
+                                   minlength=T * nz).reshape(T, nz)
+                suma[vacias] = np.nan
+            for estadistico in estadisticos:
+                if estadistico == 'count':
+                    resultados[estadistico].append(n)
+                elif estadistico == 'sum':
+                    resultados[estadistico].append(suma)
+                elif estadistico == 'mean':
+                    resultados[estadistico].append(suma / np.where(vacias, 1, n))
+                else:
+                    ufunc, inicial = (np.minimum, np.inf) if estadistico == 'min' else (np.maximum, -np.inf)
+                    extremo = np.full(T * nz, inicial)
+                    mask = validos.ravel()
+                    ufunc.at(extremo, idx[mask], valores.ravel()[mask])
+                    extremo = extremo.reshape(T, nz)
+                    extremo[vacias] = np.nan
+                    resultados[estadistico].append(extremo)
+
+        return {estadistico: pd.DataFrame(np.concatenate(resultados[estadistico]), index=self.times,
+                                          columns=ids)
+                for estadistico in estadisticos}
+        
+
+    def reproyectar(self, crsOut, cellsize, n_neighbors=1, weights='distance', p=2, inplace=False, plan=None,
+                    bloque=64, planes=PLANES, metodo='knn', categorica=False):
         """Proyecta la malla de MODIS desde su sistema de coordenadas original (sinusoidal) al sistema deseado en una malla regular de tamaño definido.
 
+        Las celdas de origen y sus pesos se calculan una única vez en un plan de remuestreo (véase 'PlanRemuestreo') que se aplica a todas las fechas como un producto de matrices dispersas. En cada fecha los pesos se normalizan con las celdas de origen que tienen dato.
+
         Entradas:
         ---------
         self:        class MODIS
         crsOut:      CRS. Sistema de coordenadas de referencia al que se quieren proyectar los datos. P.ej. 'epsg:25830'
         cellsize:    float. Tamaño de celda de la malla a generar
         n_neighbors: int. Nº de celdas cercanas a utilizar en la interpolación
-        weights:     str. Tipo de ponderación en la interpolación
-        p:           int. Exponente de la ponderación
-        inplace:   boolean. Si se quiere sobreescribir el resultado sobre self o no
+        weights:     str. Tipo de ponderación en la interpolación: 'uniform' o 'distance'
+        p:           int. Parámetro de la distancia de Minkowski con la que buscar los vecinos (2: euclídea)
+        inplace:     boolean. Si se quiere sobreescribir el resultado sobre self o no
+        plan:        class PlanRemuestreo. Plan calculado previamente para la misma malla (p.ej. el atributo 'plan' de otra variable ya reproyectada). Si es 'None', se obtiene con los argumentos anteriores (véase 'PlanRemuestreo.obtener')
+        bloque:      int. Nº de fechas que se remuestrean a la vez
+        planes:      string. Carpeta donde se guardan los planes de remuestreo para reutilizarlos en otros procesos. Si es 'None', el plan se calcula siempre y no se guarda
+        metodo:      string. 'knn': vecinos cercanos de los centros de origen transformados al sistema de destino (véase 'PlanRemuestreo.vecinos'); 'nearest', 'bilinear' o 'cubic': los centros de destino se transforman a la malla de origen y se interpolan con ese núcleo (véase 'PlanRemuestreo.inverso'). 'nearest' conserva los códigos de las variables categóricas (usos del suelo, nieve); 'conservative': media ponderada por el área de solape entre celdas, que conserva el volumen total de las variables de flujo medido en la proyección de origen (véase 'PlanRemuestreo.conservativo')
+        categorica:  boolean. Si la variable es categórica (usos del suelo, clases de nieve). Cada celda de destino toma la clase mayoritaria de las celdas de origen que la alimentan, ponderadas según el plan (véase 'PlanRemuestreo.moda'); con 'metodo="conservative"', la clase que ocupa más superficie. Se trabaja con los códigos originales, sin decodificar, y el resultado conserva su tipo de dato y su codificación
 
         Salida:
         -------
         Si 'inplace == False':
-            harmonie: class HARMONIE
+            modis: class MODIS. Con el plan de remuestreo en el atributo 'plan'
         """
 
-        # extraer información de HARMONIE
-        data = self.data
-        Y = self.Y
-        X = self.X
-        times = self.times
-        crsIn = self.crs
+        if plan is None:
+            plan = PlanRemuestreo.obtener(self.X, self.Y, self.crs, crsOut, cellsize, n_neighbors=n_neighbors,
+                                          weights=weights, p=p, metodo=metodo, planes=planes)
+            if plan is None:
+                return
 
-        # matrices de longitud y latitud de cada una de las celdas
-        XX, YY = np.meshgrid(X, Y)
+        if categorica:
+            # clase mayoritaria con los códigos originales, por bloques
+            if self.codificacion is not None:
+                nulo = self.codificacion['_FillValue']
+            elif np.issubdtype(self.data.dtype, np.integer):
+                nulo = np.iinfo(self.data.dtype).max
+            else:
+                nulo = np.nan
+            data_ = np.empty((len(self.times), len(plan.Y), len(plan.X)), dtype=self.data.dtype)
+            for t in range(0, len(self.times), bloque):
+                data_[t:t + bloque] = plan.moda(self.data[t:t + bloque], nulo, codificacion=self.codificacion)
+            codificacion = self.codificacion
+        else:
+            # remuestrear todas las fechas, por bloques
+            data_ = np.empty((len(self.times), len(plan.Y), len(plan.X)), dtype=float)
+            t = 0
+            for times, data in self.bloques(bloque):
+                data_[t:t + len(times)] = plan.aplicar(data)
+                t += len(times)
+            codificacion = None
+        
+        if inplace:
+            self.data = data_
+            self.X = plan.X
+            self.Y = plan.Y
+            self.crs = plan.crs
+            self.codificacion = codificacion
+            self.plan = plan
+        else:
+            # crear nueva instancia de clase MODIS
+            modis = MODIS(data_, plan.X, plan.Y, self.times, units=self.units, variable=self.variable,
+                          label=self.label, crs=plan.crs, codificacion=codificacion)
+            modis.plan = plan
+            return modis
 
-        # transformar coordendas y reformar en matrices del mismo tamaño que el mapa diario
-        transformer = Transformer.from_crs(crsIn, crsOut) 
-        Xorig, Yorig = transformer.transform(XX.flatten(), YY.flatten())
-        XXorig = Xorig.reshape(XX.shape)
-        YYorig = Yorig.reshape(YY.shape)
 
-        # definir límites de la malla a interpolar
-        xmin, xmax, ymin, ymax = Xorig.min(), Xorig.max(), Yorig.min(), Yorig.max()
-        # redondear según el tamaño de celda
-        xmin = int(np.floor(xmin / cellsize) * cellsize)
-        xmax = int(np.ceil(xmax / cellsize) * cellsize)
-        ymin = int(np.floor(ymin / cellsize) * cellsize)
-        ymax = int(np.ceil(ymax / cellsize) * cellsize)
+
+
+class PlanRemuestreo:
+    def __init__(self, W, X, Y, crs, normalizar=True):
+        """Plan de remuestreo de una malla de origen a una malla regular de destino. Cada celda de destino es una combinación lineal de celdas de origen, de modo que el remuestreo de cualquier nº de mapas se reduce a un producto de matrices dispersas.
+
+        Entradas:
+        ---------
+        W:         scipy.sparse.csr_matrix (Y * X, Yorig * Xorig). Peso de cada celda de origen en cada celda de destino. Cada fila suma 1 (salvo en el remuestreo conservativo, donde suma la fracción de la celda de destino cubierta por la malla de origen)
+        X:         array (X,). Coordenadas X de las columnas de la malla de destino
+        Y:         array (Y,). Coordenadas Y de las filas de la malla de destino
+        crs:       CRS. Sistema de coordenadas de la malla de destino
+        normalizar: boolean. Si en cada mapa los pesos se normalizan con las celdas de origen que tienen dato (interpolación) o las celdas sin dato cuentan como 0 (remuestreo conservativo)
+        """
+
+        self.W = W.tocsr()
+        self.X = X
+        self.Y = Y
+        self.crs = crs
+        self.normalizar = normalizar
+        # celdas de destino sin ninguna celda de origen (fuera de la malla de origen)
+        self.vacias = np.diff(self.W.indptr) == 0
+
+
+    @classmethod
+    def vecinos(cls, X, Y, crsIn, crsOut, cellsize, n_neighbors=1, weights='distance', p=2):
+        """Plan de remuestreo por vecinos cercanos, con los mismos criterios que 'interpolarNN': las coordenadas de origen se transforman al sistema de destino y cada celda de la malla regular toma los 'n_neighbors' centros más cercanos, ponderados por igual o por el inverso de su distancia.
+
+        Entradas:
+        ---------
+        X:           array (Xorig,). Coordenadas X de las columnas de la malla de origen
+        Y:           array (Yorig,). Coordenadas Y de las filas de la malla de origen
+        crsIn:       CRS. Sistema de coordenadas de la malla de origen
+        crsOut:      CRS. Sistema de coordenadas de la malla de destino
+        cellsize:    float. Tamaño de celda de la malla de destino
+        n_neighbors: int. Nº de vecinos de cada celda de destino
+        weights:     str. Tipo de ponderación: 'uniform' o 'distance'
+        p:           int. Parámetro de la distancia de Minkowski
+
+        Salida:
+        -------
+        plan:        class PlanRemuestreo
+        """
+
+        # matrices de coordenadas de cada una de las celdas de origen, transformadas al sistema de destino
+        XX, YY = np.meshgrid(X, Y)
+        transformer = Transformer.from_crs(crsIn, crsOut)
+        Xorig, Yorig = transformer.transform(XX.flatten(), YY.flatten())
 
         # coordenadas X e Y de la malla a interpolar
-        Xgrid = np.arange(xmin, xmax + cellsize, cellsize)
-        Ygrid = np.arange(ymin, ymax + cellsize, cellsize)
+        Xgrid, Ygrid = cls.malla(Xorig, Yorig, cellsize)
+        XXgrid, YYgrid = np.meshgrid(Xgrid, Ygrid)
+
+        # vecinos de cada celda de destino entre todas las celdas de origen
+        neigh = KNeighborsRegressor(n_neighbors=n_neighbors, p=p).fit(np.vstack((Xorig, Yorig)).T,
+                                                                     np.zeros(len(Xorig)))
+        dist, ind = neigh.kneighbors(np.vstack((XXgrid.flatten(), YYgrid.flatten())).T)
+
+        # pesos. Como en 'sklearn', si algún vecino está a distancia 0 sólo cuentan los que están a distancia 0
+        if weights == 'distance':
+            with np.errstate(divide='ignore'):
+                pesos = 1. / dist
+            ceros = (dist == 0).any(axis=1)
+            pesos[ceros] = (dist[ceros] == 0).astype(float)
+        else:
+            pesos = np.ones(dist.shape)
+        pesos /= pesos.sum(axis=1, keepdims=True)
+
+        W = sparse.csr_matrix((pesos.ravel(), ind.ravel(), np.arange(0, ind.size + 1, n_neighbors)),
+                              shape=(len(XXgrid.flatten()), len(Xorig)))
+
+        return cls(W, Xgrid, Ygrid, crsOut)
+
+
+    @classmethod
+    def inverso(cls, X, Y, crsIn, crsOut, cellsize, kernel='nearest'):
+        """Plan de remuestreo por transformación inversa. La malla de destino es la misma que en 'vecinos', pero para definirla sólo se transforma el contorno de la malla de origen. Los centros de las celdas de destino se transforman al sistema de origen, donde su posición en la malla regular de origen da directamente los índices (fraccionarios) de fila y columna; no hace falta buscar vecinos. Las celdas de destino que caen fuera de la malla de origen quedan vacías (NaN).
+
+        Entradas:
+        ---------
+        X:           array (Xorig,). Coordenadas X de las columnas de la malla de origen. Equiespaciadas
+        Y:           array (Yorig,). Coordenadas Y de las filas de la malla de origen. Equiespaciadas
+        crsIn:       CRS. Sistema de coordenadas de la malla de origen
+        crsOut:      CRS. Sistema de coordenadas de la malla de destino
+        cellsize:    float. Tamaño de celda de la malla de destino
+        kernel:      string. Núcleo de interpolación: 'nearest' (celda de origen que contiene el centro de destino), 'bilinear' (4 celdas) o 'cubic' (16 celdas, convolución cúbica de Keys)
+
+        Salida:
+        -------
+        plan:        class PlanRemuestreo
+        """
+
+        if kernel not in ['nearest', 'bilinear', 'cubic']:
+            print('¡ERROR! El núcleo {0} no existe. Núcleos disponibles: nearest, bilinear, cubic'.format(kernel))
+            return
+        X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+        if cls.regular(X, Y) == False:
+            print('¡ERROR! La transformación inversa requiere una malla de origen regular')
+            return
+        Xgrid, Ygrid = cls.mallaContorno(X, Y, crsIn, crsOut, cellsize)
 
-        # matrices de X e Y de cada una de las celdas de la malla a interpolar
+        # centros de las celdas de destino en el sistema de origen, como índices fraccionarios de columna y fila
         XXgrid, YYgrid = np.meshgrid(Xgrid, Ygrid)
+        Xdest, Ydest = Transformer.from_crs(crsOut, crsIn).transform(XXgrid.flatten(), YYgrid.flatten())
+        fx = (np.asarray(Xdest) - X[0]) / (X[1] - X[0])
+        fy = (np.asarray(Ydest) - Y[0]) / (Y[1] - Y[0])
 
-        # interpolar mapas en la malla UTM
-        data_ = np.empty((len(times), len(Ygrid), len(Xgrid)), dtype=float)
-        for t, time in enumerate(times):
-            print('Paso {0} de {1}:\t{2}'.format(t+1, len(times), time), end='\r')
-            data_[t,:,:] = interpolarNN(XXorig, YYorig, data[t,:,:], XXgrid, YYgrid, datatype,
-                                        n_neighbors=n_neighbors,  weights=weights, p=p)
-        
-        if inplace:
-            self.data = data_
-            self.X = Xgrid
-            self.Y = Ygrid
-            self.crs = crsOut
+        # índices y pesos de las celdas de origen en cada eje, y su combinación en 2D
+        ix, wx, dentro_x = cls.nucleo(fx, len(X), kernel)
+        iy, wy, dentro_y = cls.nucleo(fy, len(Y), kernel)
+        dentro = np.where(dentro_x & dentro_y)[0]
+        cols = (iy[dentro, :, None] * len(X) + ix[dentro, None, :]).reshape(len(dentro), -1)
+        pesos = (wy[dentro, :, None] * wx[dentro, None, :]).reshape(len(dentro), -1)
+
+        # los índices repetidos en los bordes se suman al pasar a 'csr'
+        W = sparse.coo_matrix((pesos.ravel(), (np.repeat(dentro, cols.shape[1]), cols.ravel())),
+                              shape=(len(fx), len(X) * len(Y))).tocsr()
+        W.eliminate_zeros()
+
+        return cls(W, Xgrid, Ygrid, crsOut)
+
+
+    @classmethod
+    def conservativo(cls, X, Y, crsIn, crsOut, cellsize, bloque=2**18):
+        """Plan de remuestreo conservativo. El peso de cada celda de origen en cada celda de destino es el área de su intersección dividida entre el área de la celda de destino, de modo que el resultado es la media ponderada por área. Las esquinas de las celdas de destino se transforman al sistema de origen y cada celda de destino se trata como el cuadrilátero que forman; las intersecciones con las celdas de origen se calculan de forma exacta (véase 'areaRecorte'). Las áreas se miden en la malla de origen, que en MODIS (sinusoidal) es de igual área: lo que se conserva es el volumen (valor por área) medido con el área de cada cuadrilátero en la proyección de origen, no con el área nominal de la celda de destino ('cellsize' al cuadrado). Ambas difieren según el factor de escala de área de la proyección de destino (en torno a un 0,75 % en UTM sobre la península ibérica). Las celdas de destino con alguna esquina que no se puede transformar al sistema de origen se descartan.
+
+        La malla de destino es la misma que en 'vecinos' e 'inverso'. Al aplicar el plan, las celdas de origen sin dato cuentan como 0 y las celdas de destino sólo quedan como NaN si no tienen ninguna celda de origen con dato.
+
+        Entradas:
+        ---------
+        X:           array (Xorig,). Coordenadas X de las columnas de la malla de origen. Equiespaciadas
+        Y:           array (Yorig,). Coordenadas Y de las filas de la malla de origen. Equiespaciadas
+        crsIn:       CRS. Sistema de coordenadas de la malla de origen
+        crsOut:      CRS. Sistema de coordenadas de la malla de destino
+        cellsize:    float. Tamaño de celda de la malla de destino
+        bloque:      int. Nº de celdas de destino que se procesan a la vez
+
+        Salida:
+        -------
+        plan:        class PlanRemuestreo
+        """
+
+        X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+        if cls.regular(X, Y) == False:
+            print('¡ERROR! El remuestreo conservativo requiere una malla de origen regular')
+            return
+        Xgrid, Ygrid = cls.mallaContorno(X, Y, crsIn, crsOut, cellsize)
+
+        # esquinas de las celdas de destino, como índices fraccionarios de columna y fila de la malla de origen (cada celda de origen es el cuadrado unidad centrado en su índice)
+        XXe, YYe = np.meshgrid(np.append(Xgrid - cellsize / 2, Xgrid[-1] + cellsize / 2),
+                               np.append(Ygrid - cellsize / 2, Ygrid[-1] + cellsize / 2))
+        Xe, Ye = Transformer.from_crs(crsOut, crsIn).transform(XXe.flatten(), YYe.flatten())
+        fx = ((np.asarray(Xe) - X[0]) / (X[1] - X[0])).reshape(XXe.shape)
+        fy = ((np.asarray(Ye) - Y[0]) / (Y[1] - Y[0])).reshape(XXe.shape)
+
+        # cuadriláteros (Y * X, 4, 2) de las celdas de destino
+        esquinas = lambda f: np.stack((f[:-1, :-1], f[:-1, 1:], f[1:, 1:], f[1:, :-1]), axis=-1).reshape(-1, 4)
+        quads = np.stack((esquinas(fx), esquinas(fy)), axis=-1)
+        # los cuadriláteros con alguna esquina no finita no se cruzan con la malla de origen: sus filas quedan vacías (NaN)
+        finitos = np.isfinite(quads).all(axis=(1, 2))
+        quads[~finitos] = 0
+        xq, yq = quads[..., 0], quads[..., 1]
+        area = .5 * np.abs((xq * np.roll(yq, -1, axis=1) - np.roll(xq, -1, axis=1) * yq).sum(axis=1))
+
+        # celdas de origen candidatas de cada celda de destino: las que cortan su rectángulo envolvente
+        c0 = np.clip(np.floor(xq.min(axis=1) + .5), 0, len(X) - 1).astype(np.int64)
+        c1 = np.clip(np.floor(xq.max(axis=1) + .5), -1, len(X) - 1).astype(np.int64)
+        r0 = np.clip(np.floor(yq.min(axis=1) + .5), 0, len(Y) - 1).astype(np.int64)
+        r1 = np.clip(np.floor(yq.max(axis=1) + .5), -1, len(Y) - 1).astype(np.int64)
+        nc, nr = np.where(finitos, c1 - c0 + 1, 0), np.where(finitos, r1 - r0 + 1, 0)
+
+        filas, columnas, pesos = [], [], []
+        for i in range(0, len(quads), bloque):
+            b = slice(i, i + bloque)
+            for dr in range(max(nr[b].max(), 0)):
+                for dc in range(max(nc[b].max(), 0)):
+                    dest = i + np.where((dr < nr[b]) & (dc < nc[b]))[0]
+                    r, c = r0[dest] + dr, c0[dest] + dc
+                    solape = areaRecorte(quads[dest], c - .5, c + .5, r - .5, r + .5)
+                    positivo = solape > 0
+                    filas.append(dest[positivo])
+                    columnas.append(r[positivo] * len(X) + c[positivo])
+                    pesos.append(solape[positivo] / area[dest[positivo]])
+
+        W = sparse.coo_matrix((np.concatenate(pesos), (np.concatenate(filas), np.concatenate(columnas))),
+                              shape=(len(quads), len(X) * len(Y))).tocsr()
+
+        return cls(W, Xgrid, Ygrid, crsOut, normalizar=False)
+
+
+    @staticmethod
+    def regular(X, Y):
+        """Comprueba si una malla es regular: al menos dos filas y columnas, equiespaciadas."""
+
+        return (len(X) > 1) and (len(Y) > 1) and np.allclose(np.diff(X), X[1] - X[0]) and \
+               np.allclose(np.diff(Y), Y[1] - Y[0])
+
+
+    @classmethod
+    def mallaContorno(cls, X, Y, crsIn, crsOut, cellsize):
+        """Malla de destino (la misma que en 'vecinos') a partir sólo del contorno de la malla de origen transformado al sistema de destino. Los extremos de la malla transformada están siempre en el contorno.
+
+        Entradas:
+        ---------
+        X, Y, crsIn, crsOut, cellsize: véase 'vecinos'
+
+        Salida:
+        -------
+        Xgrid:     array (X,). Coordenadas X de las columnas de la malla de destino
+        Ygrid:     array (Y,). Coordenadas Y de las filas de la malla de destino
+        """
+
+        contorno = np.concatenate([np.stack(np.meshgrid(X, Y[[0, -1]]), axis=-1).reshape(-1, 2),
+                                   np.stack(np.meshgrid(X[[0, -1]], Y), axis=-1).reshape(-1, 2)])
+        Xb, Yb = Transformer.from_crs(crsIn, crsOut).transform(contorno[:, 0], contorno[:, 1])
+
+        return cls.malla(np.asarray(Xb), np.asarray(Yb), cellsize)
+
+
+    @staticmethod
+    def nucleo(f, n, kernel):
+        """Índices y pesos de interpolación en un eje de una malla regular.
+
+        Entradas:
+        ---------
+        f:         array (m,). Posiciones fraccionarias en el eje (0 es el centro de la primera celda)
+        n:         int. Nº de celdas del eje
+        kernel:    string. 'nearest', 'bilinear' o 'cubic'
+
+        Salida:
+        -------
+        idx:       array (m, k). Índices de las 'k' celdas que intervienen en cada posición. Fuera del eje se repite la celda del borde
+        w:         array (m, k). Pesos de cada celda. Suman 1
+        dentro:    array (m,) de booleanos. Posiciones dentro de la extensión de la malla
+        """
+
+        dentro = (f >= -.5) & (f < n - .5)
+        if kernel == 'nearest':
+            idx = np.floor(f + .5)[:, None]
+            w = np.ones(idx.shape)
         else:
-            # crear nueva instancia de clase HARMONIE
-            modis = MODIS(data_, Xgrid, Ygrid, self.times, crs=crsOut)#, self.units, self.variable, self.label, crsOut)
-            return modis
+            i0 = np.floor(f)
+            t = (f - i0)[:, None]
+            if kernel == 'bilinear':
+                idx = i0[:, None] + np.arange(0, 2)
+                w = np.hstack((1 - t, t))
+            else:
+                # convolución cúbica de Keys (a = -0.5) sobre las celdas i0-1, i0, i0+1, i0+2
+                idx = i0[:, None] + np.arange(-1, 3)
+                s = np.abs(np.hstack((t + 1, t, 1 - t, 2 - t)))
+                a = -.5
+                w = np.where(s <= 1, (a + 2) * s**3 - (a + 3) * s**2 + 1, a * s**3 - 5 * a * s**2 + 8 * a * s - 4 * a)
+        idx = np.clip(np.nan_to_num(idx), 0, n - 1).astype(np.int64)
+
+        return idx, w, dentro
+
+
+    @staticmethod
+    def malla(Xorig, Yorig, cellsize):
+        """Coordenadas de la malla regular de destino que cubre unos puntos, con los límites redondeados según el tamaño de celda.
+
+        Entradas:
+        ---------
+        Xorig:     array. Coordenadas X de los puntos en el sistema de destino
+        Yorig:     array. Coordenadas Y de los puntos en el sistema de destino
+        cellsize:  float. Tamaño de celda de la malla de destino
+
+        Salida:
+        -------
+        Xgrid:     array (X,). Coordenadas X de las columnas de la malla
+        Ygrid:     array (Y,). Coordenadas Y de las filas de la malla
+        """
+
+        # definir límites de la malla a interpolar, redondeados según el tamaño de celda
+        xmin = int(np.floor(Xorig.min() / cellsize) * cellsize)
+        xmax = int(np.ceil(Xorig.max() / cellsize) * cellsize)
+        ymin = int(np.floor(Yorig.min() / cellsize) * cellsize)
+        ymax = int(np.ceil(Yorig.max() / cellsize) * cellsize)
+
+        return np.arange(xmin, xmax + cellsize, cellsize), np.arange(ymin, ymax + cellsize, cellsize)
+
+
+    @staticmethod
+    def firma(X, Y, crsIn, crsOut, cellsize, n_neighbors=1, weights='distance', p=2, metodo='knn'):
+        """Huella de los argumentos de 'vecinos', 'inverso' o 'conservativo': dos planes con la misma firma son idénticos.
+
+        Salida:
+        -------
+        firma:     string. 'hash' MD5 en hexadecimal
+        """
+
+        md5 = hashlib.md5()
+        for coords in [X, Y]:
+            coords = np.ascontiguousarray(coords, dtype=float)
+            md5.update(str(len(coords)).encode())
+            md5.update(coords.tobytes())
+        for crs in [crsIn, crsOut]:
+            md5.update(CRS.from_user_input(crs).to_wkt().encode())
+        if metodo == 'knn':
+            md5.update(repr((float(cellsize), int(n_neighbors), weights, p)).encode())
+        else:
+            md5.update(repr((float(cellsize), metodo)).encode())
+
+        return md5.hexdigest()
+
+
+    @classmethod
+    def obtener(cls, X, Y, crsIn, crsOut, cellsize, n_neighbors=1, weights='distance', p=2, metodo='knn',
+                planes=PLANES):
+        """Plan de remuestreo por vecinos cercanos (véase 'vecinos'), por transformación inversa (véase 'inverso') o conservativo (véase 'conservativo'), calculado sólo si no se ha calculado antes. Los planes se guardan en 'planes' en una subcarpeta con su firma; si ya existe, se abre con 'np.memmap', sin transformar coordenadas ni buscar vecinos. En una misma sesión, cada plan se abre una única vez.
+
+        Entradas:
+        ---------
+        X, Y, crsIn, crsOut, cellsize, n_neighbors, weights, p: véase 'vecinos'
+        metodo:      string. 'knn' para 'vecinos'; 'nearest', 'bilinear' o 'cubic' para 'inverso' con ese núcleo; 'conservative' para 'conservativo'
+        planes:      string. Carpeta de los planes guardados. Si es 'None', el plan se calcula y no se guarda
+
+        Salida:
+        -------
+        plan:        class PlanRemuestreo
+        """
+
+        if metodo == 'knn':
+            calcular = lambda: cls.vecinos(X, Y, crsIn, crsOut, cellsize, n_neighbors=n_neighbors, weights=weights,
+                                           p=p)
+        elif metodo == 'conservative':
+            calcular = lambda: cls.conservativo(X, Y, crsIn, crsOut, cellsize)
+        else:
+            calcular = lambda: cls.inverso(X, Y, crsIn, crsOut, cellsize, kernel=metodo)
+        if planes is None:
+            return calcular()
+
+        clave = cls.firma(X, Y, crsIn, crsOut, cellsize, n_neighbors=n_neighbors, weights=weights, p=p,
+                          metodo=metodo)
+        if clave not in _planes:
+            carpeta = os.path.join(planes, clave)
+            if os.path.isdir(carpeta):
+                _planes[clave] = cls.cargar(carpeta)
+            else:
+                plan = calcular()
+                if plan is None:
+                    return
+                plan.guardar(carpeta)
+                _planes[clave] = plan
+
+        return _planes[clave]
+
+
+    def guardar(self, carpeta):
+        """Guarda el plan en una carpeta como archivos '.npy' (los tres vectores de la matriz dispersa y las coordenadas de destino) y el sistema de coordenadas en WKT. Se escribe primero en una carpeta temporal que después se renombra, de modo que otro proceso nunca lee un plan a medio escribir.
+
+        Entradas:
+        ---------
+        carpeta:   string. Carpeta del plan. Si ya existe (p.ej. la ha creado otro proceso a la vez), no se sobreescribe
+        """
+
+        padre = os.path.dirname(os.path.abspath(carpeta))
+        if os.path.isdir(padre) == False:
+            os.makedirs(padre)
+        tmp = tempfile.mkdtemp(dir=padre)
+        for nombre, array in [('data', self.W.data), ('indices', self.W.indices), ('indptr', self.W.indptr),
+                              ('X', np.asarray(self.X)), ('Y', np.asarray(self.Y)),
+                              ('shape', np.array(self.W.shape, dtype=np.int64)),
+                              ('normalizar', np.array(self.normalizar))]:
+            np.save(os.path.join(tmp, nombre + '.npy'), array)
+        with open(os.path.join(tmp, 'crs.wkt'), 'w') as f:
+            f.write(CRS.from_user_input(self.crs).to_wkt())
+        try:
+            os.rename(tmp, carpeta)
+        except OSError:
+            shutil.rmtree(tmp)
+
+
+    @classmethod
+    def cargar(cls, carpeta):
+        """Abre un plan guardado con 'guardar'. Los vectores de la matriz dispersa se abren con 'np.memmap', de modo que sólo se leen del disco las partes que se usan y varios procesos comparten la caché del sistema operativo.
+
+        Entradas:
+        ---------
+        carpeta:   string. Carpeta del plan
+
+        Salida:
+        -------
+        plan:      class PlanRemuestreo
+        """
+
+        leer = lambda nombre: np.load(os.path.join(carpeta, nombre + '.npy'), mmap_mode='r')
+        W = sparse.csr_matrix((leer('data'), leer('indices'), leer('indptr')), shape=tuple(leer('shape')), copy=False)
+        with open(os.path.join(carpeta, 'crs.wkt')) as f:
+            crs = CRS.from_wkt(f.read())
+
+        # los planes guardados antes de existir el remuestreo conservativo se normalizan siempre
+        normalizar = bool(leer('normalizar')) if os.path.exists(os.path.join(carpeta, 'normalizar.npy')) else True
+
+        return cls(W, np.array(leer('X')), np.array(leer('Y')), crs, normalizar=normalizar)
+
+
+    def aplicar(self, data):
+        """Remuestrea un conjunto de mapas con el plan. En cada mapa, los pesos de cada celda de destino se normalizan con las celdas de origen que tienen dato (si 'normalizar') o las celdas sin dato cuentan como 0; las celdas sin ninguna celda de origen con dato quedan como NaN.
+
+        Entradas:
+        ---------
+        data:      array (times, Yorig, Xorig). Mapas en la malla de origen
+
+        Salida:
+        -------
+        data_:     array (times, Y, X). Mapas en la malla de destino
+        """
+
+        T = data.shape[0]
+        V = data.reshape(T, -1).T
+        validos = ~np.isnan(V)
+        if validos.all():
+            data_ = self.W @ V
+        else:
+            # suma de los pesos de los vecinos con dato de cada celda de destino en cada mapa
+            suma = self.W @ validos.astype(float)
+            data_ = self.W @ np.where(validos, V, 0.)
+            if self.normalizar:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    data_ /= suma
+            data_[suma == 0] = np.nan
+        data_[self.vacias] = np.nan
+
+        return data_.T.reshape(T, len(self.Y), len(self.X))
+
+
+    def moda(self, data, nulo, codificacion=None):
+        """Remuestrea un conjunto de mapas de una variable categórica con el plan. Cada celda de destino toma la clase con mayor suma de pesos entre sus celdas de origen; en caso de empate, el código menor. Se hace una votación por clase, como un producto de matrices dispersas en 'float32' para todos los mapas a la vez, de modo que los códigos nunca se promedian ni se convierten a 'float64'.
+
+        Entradas:
+        ---------
+        data:         array (times, Yorig, Xorig) de enteros. Códigos de clase en la malla de origen
+        nulo:         Valor de las celdas de destino sin ninguna celda de origen con clase válida
+        codificacion: dict. Atributos de codificación de la variable (véase 'codificacionVariable'). Si se indica, los códigos nulos o fuera del rango válido no votan
+
+        Salida:
+        -------
+        moda_:        array (times, Y, X), del mismo tipo que 'data'. Clase mayoritaria de cada celda de destino
+        """
+
+        T = data.shape[0]
+        V = np.asarray(data).reshape(T, -1).T
+
+        # clases presentes en los mapas
+        if V.dtype == np.uint8:
+            clases = np.flatnonzero(np.bincount(V.ravel(), minlength=256)).astype(np.uint8)
+        else:
+            clases = np.unique(V)
+        if codificacion is not None:
+            clases = clases[~np.isnan(decodificar(clases, codificacion))]
+        elif np.issubdtype(V.dtype, np.floating):
+            clases = clases[~np.isnan(clases)]
+
+        # votación: peso acumulado de cada clase en cada celda de destino
+        W = self.W.astype(np.float32)
+        mejor = np.zeros((W.shape[0], T), dtype=np.float32)
+        moda_ = np.full((W.shape[0], T), nulo, dtype=V.dtype)
+        for clase in clases:
+            votos = W @ (V == clase).astype(np.float32)
+            gana = votos > mejor
+            mejor[gana] = votos[gana]
+            moda_[gana] = clase
+
+        return moda_.T.reshape(T, len(self.Y), len(self.X))
 
 
 
@@ -438,3 +917,191 @@ def interpolarNN(XXorig, YYorig, mapa, XXgrid, YYgrid, n_neighbors=1, weights='d
 
 
 
+def anillosPoligono(geometria):
+    """Vértices de todos los anillos (contornos exteriores e interiores) de un polígono o multipolígono.
+    
+    Entradas:
+    ---------
+    geometria:   shapely.geometry. Polygon, MultiPolygon o GeometryCollection
+    
+    Salida:
+    -------
+    anillos:     list of np.array (n, 2). Coordenadas X, Y de los vértices de cada anillo, con el primero repetido al final
+    """
+    
+    if geometria.geom_type == 'Polygon':
+        return [np.asarray(geometria.exterior.coords)[:, :2]] + \
+               [np.asarray(interior.coords)[:, :2] for interior in geometria.interiors]
+    elif hasattr(geometria, 'geoms'):
+        return [anillo for parte in geometria.geoms for anillo in anillosPoligono(parte)]
+    return []
+
+
+
+
+def rasterizarPoligono(geometria, X, Y):
+    """Máscara de las celdas de una malla regular cuyo centro está dentro de un polígono (véase 'barridoPoligono'). La máscara se guarda en memoria para cada polígono y malla, de modo que recortar otra vez con el mismo polígono no la recalcula; por eso es de sólo lectura (para modificarla, hágase una copia). Para rasterizar muchos polígonos distintos una sola vez (p.ej. en 'MODIS.zonal') se usa directamente 'barridoPoligono', que no la guarda.
+    
+    Entradas:
+    ---------
+    geometria:   shapely.geometry. Polígono en el sistema de coordenadas de la malla
+    X:           array (X,). Coordenadas X de las columnas de la malla
+    Y:           array (Y,). Coordenadas Y de las filas de la malla
+    
+    Salida:
+    -------
+    mask2D:      array (Y, X) de booleanos, de sólo lectura. True en las celdas dentro del polígono
+    """
+    
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    clave = (hashlib.md5(geometria.wkb).hexdigest(), len(X), hashlib.md5(X.tobytes() + Y.tobytes()).hexdigest())
+    if clave not in _mascaras:
+        # de sólo lectura: la misma máscara (o vistas de ella, como 'MODIS.mascara') se comparte entre llamadas
+        mask2D = barridoPoligono(geometria, X, Y)
+        mask2D.flags.writeable = False
+        _mascaras[clave] = mask2D
+    
+    return _mascaras[clave]
+
+
+
+
+def barridoPoligono(geometria, X, Y):
+    """Máscara de las celdas de una malla regular cuyo centro está dentro de un polígono, calculada por barrido de filas ('scanline') directamente a partir de los vértices: para cada fila se calculan los cortes con las aristas del polígono y se marcan las celdas entre cada par de cortes (regla par-impar, de modo que los huecos y las partes de un multipolígono se tratan igual). Como en la mayoría de rasterizadores, una celda cuyo centro cae exactamente sobre el contorno puede quedar dentro o fuera según la orientación de la arista.
+    
+    Entradas:
+    ---------
+    geometria:   shapely.geometry. Polígono en el sistema de coordenadas de la malla
+    X:           array (X,). Coordenadas X de las columnas de la malla
+    Y:           array (Y,). Coordenadas Y de las filas de la malla
+    
+    Salida:
+    -------
+    mask2D:      array (Y, X) de booleanos. True en las celdas dentro del polígono
+    """
+    
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    
+    # aristas (x0, y0, x1, y1) de todos los anillos; las horizontales no cortan ninguna fila
+    anillos = anillosPoligono(geometria)
+    mask2D = np.zeros((len(Y), len(X)), dtype=bool)
+    if len(anillos) > 0:
+        aristas = np.vstack([np.hstack((anillo[:-1], anillo[1:])) for anillo in anillos])
+        aristas = aristas[aristas[:, 1] != aristas[:, 3]]
+        x0, y0, x1, y1 = aristas.T
+        ymin, ymax = np.minimum(y0, y1), np.maximum(y0, y1)
+        pendiente = (x1 - x0) / (y1 - y0)
+        
+        # columnas ordenadas de forma creciente
+        orden = np.argsort(X)
+        Xs = X[orden]
+        for i in np.where((Y >= ymin.min()) & (Y <= ymax.max()))[0]:
+            y = Y[i]
+            # aristas que cruzan la fila. Intervalo semiabierto: un vértice compartido por dos aristas se cuenta una vez
+            cruzan = (ymin <= y) & (ymax > y)
+            if not cruzan.any():
+                continue
+            cortes = np.sort(x0[cruzan] + (y - y0[cruzan]) * pendiente[cruzan])
+            # columnas entre cada par de cortes, marcadas con sumas acumuladas
+            delta = np.zeros(len(X) + 1, dtype=int)
+            np.add.at(delta, np.searchsorted(Xs, cortes[0::2], side='left'), 1)
+            np.add.at(delta, np.searchsorted(Xs, cortes[1::2], side='right'), -1)
+            mask2D[i, orden] = np.cumsum(delta[:-1]) > 0
+    
+    return mask2D
+
+
+
+
+def coberturaPoligono(geometria, X, Y, submuestreo=None):
+    """Fracción de cada celda de una malla regular cubierta por un polígono, calculada sólo en la ventana de la malla que abarca la extensión del polígono. Las máscaras no se guardan en memoria (véase 'barridoPoligono'), pues cada zona se rasteriza una única vez.
+    
+    Entradas:
+    ---------
+    geometria:   shapely.geometry. Polígono en el sistema de coordenadas de la malla
+    X:           array (X,). Coordenadas X de las columnas de la malla
+    Y:           array (Y,). Coordenadas Y de las filas de la malla
+    submuestreo: int. Nº de subdivisiones de cada celda por lado. La fracción cubierta es la proporción de subceldas con el centro dentro del polígono. Si es 'None', la fracción es 1 en las celdas con el centro dentro del polígono y 0 en el resto
+    
+    Salida:
+    -------
+    rows:        slice. Filas de la ventana dentro de la malla
+    cols:        slice. Columnas de la ventana dentro de la malla
+    frac:        array (rows, cols). Fracción de cada celda de la ventana dentro del polígono
+    Si el polígono no interseca con la malla, devuelve 'None'
+    """
+    
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    dx, dy = np.abs(np.diff(X)).mean(), np.abs(np.diff(Y)).mean()
+    
+    # ventana de la malla que abarca la extensión del polígono
+    xmin, ymin, xmax, ymax = geometria.bounds
+    cols = np.where((X >= xmin - dx / 2) & (X <= xmax + dx / 2))[0]
+    rows = np.where((Y >= ymin - dy / 2) & (Y <= ymax + dy / 2))[0]
+    if (len(cols) == 0) | (len(rows) == 0):
+        return None
+    rows, cols = slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+    Xv, Yv = X[cols], Y[rows]
+    
+    if submuestreo is None:
+        return rows, cols, barridoPoligono(geometria, Xv, Yv).astype(float)
+    
+    # malla de subceldas: 'submuestreo' x 'submuestreo' centros por celda
+    desplazamiento = (np.arange(submuestreo) + .5) / submuestreo - .5
+    Xf = (Xv[:, np.newaxis] + dx * desplazamiento).ravel()
+    Yf = (Yv[:, np.newaxis] + dy * desplazamiento).ravel()
+    fina = barridoPoligono(geometria, Xf, Yf)
+    frac = fina.reshape(len(Yv), submuestreo, len(Xv), submuestreo).mean(axis=(1, 3))
+    
+    return rows, cols, frac
+
+
+
+
+def areaRecorte(poligonos, xmin, xmax, ymin, ymax):
+    """Área de la intersección de polígonos convexos con rectángulos, calculada a la vez para todos ellos recortando cada polígono por los cuatro lados de su rectángulo (algoritmo de Sutherland-Hodgman).
+    
+    Entradas:
+    ---------
+    poligonos:   array (n, k, 2). Vértices X e Y de cada polígono, en orden
+    xmin, xmax:  array (n,). Límites X de cada rectángulo
+    ymin, ymax:  array (n,). Límites Y de cada rectángulo
+    
+    Salida:
+    -------
+    area:        array (n,). Área de cada intersección
+    """
+    
+    # vértices de cada polígono; los huecos tras el último vértice repiten el primero
+    P = np.asarray(poligonos, dtype=float)
+    nv = np.full(len(P), P.shape[1])
+    for eje, limite, signo in [(0, xmin, 1), (0, xmax, -1), (1, ymin, 1), (1, ymax, -1)]:
+        K = P.shape[1]
+        k = np.arange(K)
+        prev = np.roll(P, 1, axis=1)
+        d = signo * (P[..., eje] - np.asarray(limite, dtype=float)[:, np.newaxis])
+        dprev = np.roll(d, 1, axis=1)
+        dentro = d >= 0
+        # cada lado (prev, actual) aporta su corte con el límite, si lo cruza, y el vértice actual, si está dentro
+        cruza = dentro != (dprev >= 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = (dprev / (dprev - d))[..., np.newaxis]
+            corte = prev + t * (P - prev)
+        salida = np.stack((corte, P), axis=2).reshape(len(P), 2 * K, 2)
+        valida = np.stack((cruza, dentro & (k < nv[:, np.newaxis])), axis=2).reshape(len(P), 2 * K)
+        # compactar los vértices válidos al principio
+        nv = valida.sum(axis=1)
+        K = max(nv.max(), 1) if len(P) > 0 else 1
+        posicion = np.where(valida, np.cumsum(valida, axis=1) - 1, K)
+        P = np.zeros((len(P), K + 1, 2))
+        filas = np.broadcast_to(np.arange(len(P))[:, np.newaxis], posicion.shape)
+        P[filas, posicion] = salida
+        P = P[:, :K]
+        relleno = np.arange(K) >= nv[:, np.newaxis]
+        P[relleno] = np.broadcast_to(P[:, :1], P.shape)[relleno]
+    
+    x, y = P[..., 0], P[..., 1]
+    area = .5 * np.abs((x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1))
+    area[nv < 3] = 0
+    
+    return area
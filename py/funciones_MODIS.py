@@ -38,7 +38,7 @@ import matplotlib.pyplot as plt
 #plt.style.use('dark_background')
 #get_ipython().run_line_magic('matplotlib', 'inline')
 
-from netCDF4 import Dataset
+from netCDF4 import Dataset, default_fillvals
 # import h5py
 from datetime import datetime, timedelta
 from calendar import monthrange
@@ -66,6 +66,14 @@ pathOrig = os.getcwd()
 os.chdir(os.path.join(pathOrig, '../../Calibrar/py/'))
 from funciones_raster import *
 os.chdir(pathOrig)
+from queue import Queue
+from threading import Thread, Event
+from funciones_extraccion import extraerMODIS, precargar, Ensamblador
+from funciones_catalogo import Catalogo
+from funciones_descarga import descargarUSGS, descargarMODIS, misionProducto, credencialesEarthdata
+
+# máscaras de cuenca ya calculadas en esta sesión: {(clip, mtime, coordsClip, X[0], X[-1], Y[0], Y[-1], nX, nY): máscaras}
+_mascaras = {}
 
 # DESCARGA DE DATOS MODIS
 # -----------------------
@@ -125,7 +133,7 @@ def extract_dir(url, ext='/'):
 
 
 def descarga_MODIS(username, password, path, product, start=None, end=None, tiles=None,
-                   url='https://e4ftl01.cr.usgs.gov/', format='hdf'):
+                   url='https://e4ftl01.cr.usgs.gov/', format='hdf', workers=None, porHost=4):
     """Descarga los archivos del producto MODIS de interés en las fechas, hojas y formato indicados.
     
     Entradas:
@@ -139,11 +147,18 @@ def descarga_MODIS(username, password, path, product, start=None, end=None, tile
     tiles:   list of strings. Hojas MODIS a descargar. Formato 'h00v00'
     url:     string. URL del servidor de datos; por defecto 'https://e4ftl01.cr.usgs.gov/'
     format:  string. Tipo de archivo a descargar: 'hdf', 'jpg', 'xml'
+    workers: int. Nº de descargas simultáneas. Si es 'None', los archivos se descargan de uno en uno. Véase 'funciones_descarga.descargarUSGS'
+    porHost: int. Nº máximo de peticiones simultáneas al servidor (sólo si se indica 'workers')
     
     Salidas:
     --------
     Se guardan en la carpeta 'path/product' los archivos (hdf, jpg o xml) para la selección indicada."""
     
+    # descarga concurrente con sesiones persistentes
+    if workers is not None:
+        return descargarUSGS(path, product, start=start, end=end, tiles=tiles, username=username,
+                             password=password, url=url, format=format, workers=workers, porHost=porHost)
+    
     # entrar en Earth data con el usuario
     EarthdataLogin('casadoj', 'Chomolungma1619', url=url)
     
@@ -154,21 +169,26 @@ def descarga_MODIS(username, password, path, product, start=None, end=None, tile
     os.chdir(exportpath)
     lsdir = os.listdir()
     
-    # url de cada una de las misiones
-    url_missions = extract_dir(url)
-    # diccionario con las missiones y sus productos
-    mission_products = {}
-    for fd1 in url_missions:
-        mission = fd1.split('/')[-2]
-        url_products = extract_dir(fd1)
-        products = [fd2.split('/')[-2] for fd2 in url_products if fd2.split('/')[-2] != '']
-        mission_products[mission] = products
-
-    # encontrar missión del producto de interés y url del producto
-    for fd, mission in zip(url_missions, mission_products.keys()):
-        if product in mission_products[mission]:
-            urlproduct = fd + product + '/'
-            break
+    # url del producto a partir de su misión (MOLT, MOLA, MOTA)
+    mission = misionProducto(product)
+    if mission is not None:
+        urlproduct = url + mission + '/' + product + '/'
+    else:
+        # url de cada una de las misiones
+        url_missions = extract_dir(url)
+        # diccionario con las missiones y sus productos
+        mission_products = {}
+        for fd1 in url_missions:
+            mission = fd1.split('/')[-2]
+            url_products = extract_dir(fd1)
+            products = [fd2.split('/')[-2] for fd2 in url_products if fd2.split('/')[-2] != '']
+            mission_products[mission] = products
+
+        # encontrar missión del producto de interés y url del producto
+        for fd, mission in zip(url_missions, mission_products.keys()):
+            if product in mission_products[mission]:
+                urlproduct = fd + product + '/'
+                break
     
     # convertir en datetime.date las fechas de inicio y fin de la búsqueda           
     if start != None:
@@ -251,245 +271,75 @@ def ascii2df(pathfile):
 
 
 
-def hdfAttrs(file):
-    """Extrae los atributos de los archivos 'hdf' de MODIS
+def indiceCercano(coords, valores):
+    """Índice del elemento más cercano de un vector ordenado de coordenadas para cada uno de los valores, con una búsqueda binaria ('np.searchsorted') en lugar de recorrer el vector para cada valor. Equivale a 'np.argmin(abs(valor - coords))', incluido el criterio en caso de empate (el primero en el orden de 'coords').
     
-    Parámetros:
-    -----------
-    file:      string. Ruta, nombre y extensión del archivo
+    Entradas:
+    ---------
+    coords:    array (n,). Coordenadas ordenadas de forma creciente (p.ej. columnas de un ASCII) o decreciente (filas)
+    valores:   array. Coordenadas de las que buscar el elemento más cercano, de cualquier dimensión
     
     Salidas:
     --------
-    ncols, nrows, Xtopleft, Ytopleft, Xbottomright, Ybottomright"""
-    
-    # cargar primer archivo 'hdf'
-    f = Dataset(file, format='hdf4')
-    # extraer atributos
-    structure = getattr(f, 'StructMetadata.0').replace('\t', '').split('\n')
-    # nº de columnas
-    ncols = int(structure[5].split('=')[1])
-    # nº de filas
-    nrows = int(structure[6].split('=')[1])
-    # coordenadas esquina superior izquierda
-    Xo, Yf = [float(x) for x in structure[7].split('=')[1][1:-1].split(',')] 
-    # coordenadas esquina inferior derecha
-    Xf, Yo = [float(x) for x in structure[8].split('=')[1][1:-1].split(',')]
-    
-    return ncols, nrows, Xo, Yf, Xf, Yo
+    indices:   array de enteros, de la misma dimensión que 'valores'. Posición en 'coords' del elemento más cercano
+    """
+    
+    coords, valores = np.asarray(coords), np.asarray(valores)
+    n = len(coords)
+    if n == 1:
+        return np.zeros(valores.shape, dtype=int)
+    descendente = coords[0] > coords[-1]
+    ordenadas = coords[::-1] if descendente else coords
+    
+    # vecinos inferior y superior de cada valor
+    i = np.clip(np.searchsorted(ordenadas, valores), 1, n - 1)
+    dInf, dSup = valores - ordenadas[i - 1], ordenadas[i] - valores
+    if descendente:
+        # en el orden original el primero es el superior
+        i = np.where(dInf < dSup, i - 1, i)
+        return n - 1 - i
+    return np.where(dInf <= dSup, i - 1, i)
 
-        
 
 
-def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None,
-                  clip=None, coordsClip='epsg:25830', verbose=True):
-    """Extrae los datos de MODIS para un producto, variable y fechas dadas, transforma las coordenadas y recorta a la zona de estudio.
+
+def mascaraCuenca(clip, XXmodis, YYmodis):
+    """Máscara de las celdas de MODIS fuera de la cuenca definida por un ASCII. Cada celda de MODIS toma el valor de la celda más cercana del ASCII (véase 'indiceCercano'); se calculan todas a la vez.
     
     Entradas:
     ---------
-    path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
-    product:    string. Nombre del producto MODIS, p.ej. MOD16A2
-    var:        string. Variable de interés dentro de los archivos 'hdf'
-    factor:     float. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés)
-    tiles:      list. Hojas del producto MODIS a tratar
-    dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', se extraen los datos para todas las fechas disponibles
-    clip:       string. Ruta y nombre del archivo ASCII que se utilizará como máscara para recortar los datos. Si es 'None', se extraen todos los datos
-    coordsClip: pyproj.CRS. Proj del sistema de coordenadas al que se quieren transformar los datos. Si en 'None', se mantiene el sistema de coordenadas sinusoidal de MODIS
-    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+    clip:      string. Ruta y nombre del archivo ASCII de la cuenca
+    XXmodis:   array (Y, X). Coordenadas X de cada celda de MODIS en el sistema de coordenadas del ASCII
+    YYmodis:   array (Y, X). Coordenadas Y de cada celda de MODIS en el sistema de coordenadas del ASCII
     
     Salidas:
     --------
-    Como métodos:
-        data:    array (Y, X) o (dates, Y, X). Mapas de la variable de interés. 3D si hay más de un archivo (más de una fecha)
-        Xcoords: array (2D). Coordenadas X de cada celda de los mapas de 'data'
-        Ycoords: array (2D). Coordenadas Y de cada celda de los mapas de 'data'
-        dates:   list. Fechas a las que corresponde cada uno de los maapas de 'data'
-    """    
+    maskRows:  array (Y,) de booleanos. Filas de MODIS en la extensión de la cuenca
+    maskCols:  array (X,) de booleanos. Columnas de MODIS en la extensión de la cuenca
+    maskClip:  array (Yb, Xb) de booleanos. True en las celdas del recorte fuera de la cuenca
+    XXb:       array (Yb, Xb). Coordenadas X de las celdas del recorte
+    YYb:       array (Yb, Xb). Coordenadas Y de las celdas del recorte
+    """
     
-    if os.path.exists(path + product + '/') is False:
-        os.makedirs(path + product + '/')
-    os.chdir(path + product + '/')
+    # cargar ascii
+    clipdf = ascii2df(clip)
+    # extensión del ascii
+    Xbo, Xbf = clipdf.columns.min(), clipdf.columns.max()
+    Ybo, Ybf = clipdf.index.min(), clipdf.index.max()
     
-    # SELECCIÓN DE ARCHIVOS
-    # ---------------------
-    if dateslim is not None:
-        # convertir fechas límite en datetime.date
-        start = datetime.strptime(dateslim[0], '%Y-%m-%d').date()
-        end = datetime.strptime(dateslim[1], '%Y-%m-%d').date()
-    
-    dates, files = {tile: [] for tile in tiles}, {tile: [] for tile in tiles}
-    for tile in tiles:
-        # seleccionar archivos del producto para las hojas y fechas indicadas
-        for file in [f for f in os.listdir() if (product in f) & (tile in f)]:
-            year = file.split('.')[1][1:5]
-            doy = file.split('.')[1][5:]
-            date = datetime.strptime(' '.join([year, doy]), '%Y %j').date()
-            if dateslim is not None:
-                if (date>= start) & (date <= end):
-                    dates[tile].append(date)
-                    files[tile].append(file)
-            else:
-                dates[tile].append(date)
-                files[tile].append(file)
-    # comprobar que el número de archivos es igual en todas las hojas
-    if len(set([len(dates[tile]) for tile in tiles])) > 1:
-        print('¡ERROR! Diferente número de fechas en las diferentes hojas')
-        MODIS_extract.files = files
-        MODIS_extract.dates = dates
-#         return 
-    else:
-        dates = np.sort(np.unique(np.array([date for tile in tiles for date in dates[tile]])))
-        if verbose:
-            print('Seleccionar archivos')
-            print('nº de archivos (fechas): {0:>3}'.format(len(dates)), end='\n\n')
-
-    # ATRIBUTOS MODIS
-    # ---------------
-    if verbose: print('Generar atributos globales')
-    # extraer atributos para cada hoja
-    attributes = pd.DataFrame(index=tiles, columns=['ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'])
-    for tile in tiles:
-        attributes.loc[tile,:] = hdfAttrs(files[tile][0])
-
-    # extensión total
-    Xo = np.min(attributes.Xo)
-    Yf = np.max(attributes.Yf)
-    Xf = np.max(attributes.Xf)
-    Yo = np.min(attributes.Yo)
-    # nº total de columnas y filas
-    colsize = np.mean((attributes.Xf - attributes.Xo) / attributes.ncols)
-    ncols = int(round((Xf - Xo) / colsize, 0))
-    rowsize = np.mean((attributes.Yf - attributes.Yo) / attributes.nrows)
-    nrows = int(round((Yf - Yo) / rowsize, 0))
-    if verbose == True:
-        print('dimensión:\t\t({0:}, {1:})'.format(ncols, nrows))
-        print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xo, Yo))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xf, Yf), end='\n\n')
-
-    # coordenadas x de las celdas
-    Xmodis = np.linspace(Xo, Xf, ncols)
-    # coordenadas y de las celdas
-    Ymodis = np.linspace(Yf, Yo, nrows)
-    # matrices 2D con las coordenadas X e Y de cada celda
-    XXmodis, YYmodis = np.meshgrid(Xmodis, Ymodis)
-
-    if coordsClip is not None:
-        ## definir sistemas de referencia de coordenadas
-        # ProjOut = Proj(init=coordsClip)
-        # https://spatialreference.org/ref/sr-org/modis-sinusoidal/
-        sinusoidal = CRS.from_proj4('+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +a=6371007.181 +b=6371007.181 +units=m +no_defs ')
-        #SINUSOIDAL = Proj(projparams='PROJCS["Sinusoidal",GEOGCS["GCS_Undefined",DATUM["D_Undefined",SPHEROID["User_Defined_Spheroid",6371007.181,0.0]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.017453292519943295]],PROJECTION["Sinusoidal"],PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",0.0],UNIT["Meter",1.0]]')
-        project = Transformer.from_crs(sinusoidal, coordsClip)
-
-        # transformar coordenadas
-        Xmodis, Ymodis = project.transform(XXmodis.flatten(), YYmodis.flatten())
-        XXmodis, YYmodis = Xmodis.reshape((nrows, ncols)), Ymodis.reshape((nrows, ncols))
-
-    # CREAR MÁSCARAS
-    # --------------
-    if clip is not None:
-        if verbose == True: print('Crear máscaras')
-        # cargar ascii
-        clipdf = ascii2df(clip)
-        # extensión del ascii
-        Xbo, Xbf = clipdf.columns.min(), clipdf.columns.max()
-        Ybo, Ybf = clipdf.index.min(), clipdf.index.max()
-
-        # mapa auxiliar del tamaño de los hdf
-        aux = np.ones((nrows, ncols))
-        # convertir en NaN celdas fuera del rectángulo de extensión de la cuenca
-        maskExtent = (XXmodis >= Xbo) & (XXmodis <= Xbf) & (YYmodis >= Ybo) & (YYmodis <= Ybf)
-        aux[~maskExtent] = np.nan
-        # filas (maskR) y columnas (masC) en la extensión de la cuenca
-        maskRows = ~np.all(np.isnan(aux), axis=1)
-        maskCols = ~np.all(np.isnan(aux), axis=0)
-
-        # recortar aux
-        aux = aux[maskRows, :][:, maskCols]
-        # extraer coordenadas en el rectángulo de extensión de la cuenca
-        XXb, YYb = XXmodis[maskRows, :][:, maskCols], YYmodis[maskRows, :][:, maskCols]
-
-        # convertir en NaN celdas fuera de la cuenca
-        for c, (y, x) in enumerate(zip(YYb.flatten(), XXb.flatten())):
-            ibasin, jbasin = np.argmin(abs(y - clipdf.index)), np.argmin(abs(x - clipdf.columns))
-            if np.isnan(clipdf.iloc[ibasin, jbasin]):
-                imodis, jmodis = int(c / XXb.shape[1]), c % XXb.shape[1]
-                aux[imodis, jmodis] = np.nan
-                maskClip = np.isnan(aux)
-        if verbose == True:
-            print('dimensión:\t\t({0:>4}, {1:>4})'.format(aux.shape[0], aux.shape[1]))
-            print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(XXb[-1,0], YYb[-1,0]))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(XXb[0,-1], YYb[0,-1]), end='\n\n')
-
-    # IMPORTAR DATOS
-    # --------------
-    if verbose: print('Importar datos')
-        
-    for d, date in enumerate(dates):
-        dateStr = str(date.year) + str(date.timetuple().tm_yday).zfill(3)
-
-        for t, tile in enumerate(tiles):
-            print('Fecha {0:>2} de {1:>2}: {2}\t||\tTile {3:>2} de {4:>2}: {5}'.format(d + 1, len(dates), date,
-                                                                                       t + 1, len(tiles), tile), end='\r')
-            
-            # localización de la hoja dentro del total de hojas
-            nc, nr, xo, yf, xf, yo = attributes.loc[tile, :]
-            i = int(round((Yf - yf) / (rowsize * attributes.nrows[t]), 0))
-            j = int(round((Xf - xf) / (colsize * attributes.ncols[t]), 0))
-
-            # archivo de la fecha y hoja dada
-            file = [f for f in files[tile] if dateStr in f][0]
-            # cargar archivo 'hdf'
-            hdf = Dataset(file, format='hdf4')
-            # extraer datos de la variable
-            tmp = hdf[var][:]
-            tmp = tmp.astype(float)
-            tmp[tmp.mask] = np.nan
-            hdf.close()
-            # guardar datos en un array global de la fecha
-            if t == 0:
-                dataD = tmp.copy()
-            else:
-                if (i == 1) & (j == 0):
-                    dataD = np.concatenate((dataD, tmp), axis=0)
-                elif (i == 0) & (j == 1):
-                    dataD = np.concatenate((dataD, tmp), axis=1)
-            del tmp
-        
-        # recortar array de la fecha con la máscara
-        if clip is not None:
-            dataD = dataD[maskRows, :][:, maskCols]
-            dataD[maskClip] = np.nan
-            
-        # guardar datos en un array total
-        if d == 0:
-            data = dataD.copy()
-        else:
-            data = np.dstack((data, dataD))
-        del dataD
-    print()
+    # filas y columnas en el rectángulo de extensión de la cuenca
+    maskExtent = (XXmodis >= Xbo) & (XXmodis <= Xbf) & (YYmodis >= Ybo) & (YYmodis <= Ybf)
+    maskRows = maskExtent.any(axis=1)
+    maskCols = maskExtent.any(axis=0)
+    maskExtent = maskExtent[maskRows, :][:, maskCols]
+    XXb, YYb = XXmodis[maskRows, :][:, maskCols], YYmodis[maskRows, :][:, maskCols]
     
-    # multiplicar por el factor de escala (si existe)
-    if factor is not None:
-        data *= factor
-        
-    # reordenar el array (tiempo, Y, X)
-    if len(data.shape) == 3:
-        tmp = np.ones((data.shape[2], data.shape[0], data.shape[1])) * np.nan
-        for t in range(data.shape[2]):
-            tmp[t,:,:] = data[:,:,t]
-        data = tmp.copy()
-        del tmp
-
-    # GUARDAR RESULTADOS
-    # ------------------
-    MODIS_extract.data = data
-    MODIS_extract.dates = dates
-    if clip is not None:
-        MODIS_extract.Xcoords = XXb
-        MODIS_extract.Ycoords = YYb
-    else:
-        MODIS_extract.Xcoords = XXmodis
-        MODIS_extract.Ycoords = YYmodis
+    # celda del ascii más cercana a cada celda de MODIS
+    ibasin = indiceCercano(clipdf.index.values, YYb)
+    jbasin = indiceCercano(clipdf.columns.values, XXb)
+    maskClip = (~maskExtent) | np.isnan(clipdf.values[ibasin, jbasin].astype(float))
+    
+    return maskRows, maskCols, maskClip, XXb, YYb
 
 
 
@@ -600,7 +450,74 @@ def animate3Darray(data, dates, minmax, cblabel='', cmap='summer_r', fps=2, dpi=
 
 
 
-def MODISfromASC(path, product, factor=None, fillValue=None):
+def leerASC(file, factor=None, fillValue=None):
+    """Lee un mapa de MODIS en formato ascii (generado mediante pyScripter) y convierte en NaN las celdas nulas.
+    
+    Parámetros:
+    -----------
+    file:      string. Ruta, nombre y extensión del archivo ascii
+    factor:    float. Factor corrector de los datos: https://lpdaac.usgs.gov/products/
+    fillVale:  list. Valor (o dos valores) correspondientes a NaN: https://lpdaac.usgs.gov/products/
+    
+    Salidas:
+    --------
+    data:      array (n,m). Mapa de la variable
+    attrs:     list. Atributos del ascii: ncols, nrows, xllcorner, yllcorner, cellsize
+    """
+    
+    # importar ascii
+    read_ascii(file)
+    aux = read_ascii.data
+    attrs = read_ascii.attributes
+
+    # eliminar celdas con códigos correspondientes a Nan
+    if fillValue is not None:
+        if len(fillValue) == 1:
+            aux[aux == fillValue] = np.nan
+        elif len(fillValue) == 2:
+            aux[(aux >= fillValue[0]) & (aux <= fillValue[1])] = np.nan
+        else:
+            print('¡ERROR! Longitud de "fillValue"')
+
+    # multiplicar por el factor correspondiente
+    if factor is not None:
+        aux *= factor
+
+    # convertir en NaN según la máscara
+    aux[aux.mask] = np.nan
+    
+    return aux.data, attrs
+
+
+def iterarASC(path, product, factor=None, fillValue=None, prefetch=0, registros=None):
+    """Versión en flujo de 'MODISfromASC': genera los mapas ascii de MODIS de uno en uno, en orden de fecha, sin reunirlos en un único 'array'.
+    
+    Parámetros:
+    -----------
+    path:      string. Ruta donde se encuentran los mapas en formato ASCII
+    product:   string. Producto MODIS
+    factor:    float. Factor corrector de los datos: https://lpdaac.usgs.gov/products/
+    fillVale:  list. Valor (o dos valores) correspondientes a NaN: https://lpdaac.usgs.gov/products/
+    prefetch:  int. Nº de mapas a leer en segundo plano por delante del consumidor. Si es 0, no se precargan
+    registros: list. Archivos ascii ya consultados en el catálogo de la carpeta (salida de 'Catalogo.buscar'). Si es 'None', se consultan
+    
+    Salidas:
+    --------
+    Genera tuplas (date, data, attrs) con la fecha, el mapa (n,m) y los atributos del ascii
+    """
+    
+    # archivos ascii (y su fecha) según el catálogo de la carpeta
+    if registros is None:
+        catalogo = Catalogo(path)
+        catalogo.actualizar()
+        registros = catalogo.buscar(product, ext='asc')
+        catalogo.cerrar()
+    
+    mapas = ((date, ) + leerASC(pathfile, factor, fillValue) for tile, date, produccion, pathfile in registros)
+    yield from precargar(mapas, prefetch)
+
+
+def MODISfromASC(path, product, factor=None, fillValue=None, prefetch=0):
     """Lee los mapas de MODIS en formato ascii (generados mediante pyScripter) y genera un array único para todos los datos
     
     Parámetros:
@@ -609,6 +526,7 @@ def MODISfromASC(path, product, factor=None, fillValue=None):
     product:   string. Producto MODIS a descargar
     factor:    float. Factor corrector de los datos: https://lpdaac.usgs.gov/products/
     fillVale:  list. Valor (o dos valores) correspondientes a NaN: https://lpdaac.usgs.gov/products/
+    prefetch:  int. Nº de mapas a leer en segundo plano mientras se copia el actual. Si es 0, no se precargan
     
     Salidas:
     --------
@@ -619,57 +537,34 @@ def MODISfromASC(path, product, factor=None, fillValue=None):
         X:     array (m). Coordenadas X de las columnas
     """
     
-    # archivos ascii
-    ascFiles = [f for f in os.listdir(path) if ('asc' == f[-3:]) & (product.lower() in f)]
+    # archivos ascii según el catálogo de la carpeta
+    catalogo = Catalogo(path)
+    catalogo.actualizar()
+    registros = catalogo.buscar(product, ext='asc')
+    catalogo.cerrar()
+    nFiles = len(registros)
     
     dates = []
-    for f, file in enumerate(ascFiles):
-
-        print('Archivo {0:>3} de {1:>3}: {2}'.format(f + 1, len(ascFiles), file), end='\r')
-
-        # fecha del mapa
-        year = file.split('_')[1][1:5]
-        doy = file.split('_')[1][5:8]
-        dates.append(datetime.strptime(' '.join([year, doy]), '%Y %j').date())
-
-        # importar ascii
-        read_ascii(path + file)
-        aux = read_ascii.data
-        if f == 0:
-            attrs = read_ascii.attributes
-
-        # eliminar celdas con códigos correspondientes a Nan
-        if fillValue is not None:
-            if len(fillValue) == 1:
-                aux[aux == fillValue] = np.nan
-            elif len(fillValue) == 2:
-                for fill in range(fillValue[0], fillValue[1] + 1):
-                    aux[aux == fill] = np.nan
-            else:
-                print('¡ERROR! Longitud de "fillValue"')
-
-        # multiplicar por el factor correspondiente
-        if factor is not None:
-            aux *= factor
+    for f, (date, aux, attrs_) in enumerate(iterarASC(path, product, factor, fillValue, prefetch, registros)):
 
-        # convertir en NaN según la máscara
-        aux[aux.mask] = np.nan
+        print('Archivo {0:>3} de {1:>3}: {2}'.format(f + 1, nFiles, date), end='\r')
 
-        # unir al 'array' con el resto de fechas
+        # reservar el 'array' (fechas, Y, X) con las dimensiones del primer mapa
         if f == 0:
-            data = aux.data
-        else:
-            data = np.dstack((data, aux.data))
+            attrs = attrs_
+            data = np.empty((nFiles,) + aux.shape)
+        data[f] = aux
+        dates.append(date)
 
         del aux
     dates = np.array(dates)
     print()
 
     # calcular media para # eliminar filas y columnas vacías
-    avg = np.nanmean(data, axis=2)
+    avg = np.nanmean(data, axis=0)
     maskCols = np.all(np.isnan(avg), axis=0)
     maskRows = np.all(np.isnan(avg), axis=1)
-    data = data[~maskRows,:][:,~maskCols]
+    data = data[:, ~maskRows, :][:, :, ~maskCols]
 
     # coordenadas x
     x = np.arange(attrs[2], attrs[2] + attrs[0] * attrs[4] - 1, attrs[4])
@@ -678,8 +573,6 @@ def MODISfromASC(path, product, factor=None, fillValue=None):
     y = np.arange(attrs[3], attrs[3] + attrs[1] * attrs[4] - 1, attrs[4])
     y = y[~maskRows]
 
-    # reordenar datos: (fechas, Y, X)
-    data = np.moveaxis(data, 2, 0)
     print('dimensiones (fechas, y, x): {0}'.format(data.shape))
     
     # guardar resultados
@@ -899,180 +792,81 @@ def serieAnual(modis, agg='mean', threshold=40):
 
 
 
-def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None, extent=None, verbose=True):
+def MODIS_extract(path, product, var, tiles, factor=None, dateslim=None, extent=None, out=None, workers=None,
+                  nativo=False, qc=None, clip=None, coordsClip='epsg:25830', verbose=True):
     """Extrae los datos de MODIS para un producto, variable y fechas dadas, transforma las coordenadas y recorta a la zona de estudio.
     
     Entradas:
     ---------
     path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
     product:    string. Nombre del producto MODIS, p.ej. MOD16A2
-    var:        string. Variable de interés dentro de los archivos 'hdf'
-    factor:     float. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés)
+    var:        string o list. Variable de interés dentro de los archivos 'hdf'. Si es una lista, cada archivo se lee una única vez para todas las variables
+    factor:     float o dict. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés). Con varias variables, diccionario {var: factor}
     tiles:      list. Hojas del producto MODIS a tratar
     dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', se extraen los datos para todas las fechas disponibles
-    clip:       string. Ruta y nombre del archivo ASCII que se utilizará como máscara para recortar los datos. Si es 'None', se extraen todos los datos
-    coordsClip: pyproj.CRS. Proj del sistema de coordenadas al que se quieren transformar los datos. Si en 'None', se mantiene el sistema de coordenadas sinusoidal de MODIS
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', se extraen todos los datos
+    out:        array (dates, Y, X). 'Array' (p.ej. un np.memmap) en el que escribir los datos. Con varias variables, diccionario {var: array}. Si es 'None', se crea uno nuevo en memoria
+    workers:    int. Nº de procesos con los que leer los archivos 'hdf' en paralelo. Si es 'None', se leen en serie
+    nativo:     boolean. Si se quiere conservar el tipo de dato original (p.ej. int16). Los atributos para decodificar los datos se guardan en 'modis.codificacion'; véase 'funciones_extraccion.decodificar'
+    qc:         boolean o dict. Si es True, se eliminan las celdas que no cumplen la regla de calidad por defecto del producto; un diccionario {campo: valores admitidos} la sustituye. Véase 'funciones_QC.py'
+    clip:       string. Ruta y nombre del archivo ASCII de la cuenca con el que recortar los datos: se conservan las filas y columnas en su extensión y las celdas fuera de la cuenca quedan sin dato (NaN, o '_FillValue' con 'nativo'). Véase 'mascaraCuenca'. La máscara se guarda en memoria para el mismo ASCII y la misma malla, de modo que en las siguientes llamadas no se vuelve a calcular. Con 'out', el resultado es una copia recortada. Si es 'None', no se recorta
+    coordsClip: pyproj.CRS. Sistema de coordenadas del ASCII de 'clip'. Si es 'None', el sinusoidal de MODIS
     verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
     
     Salidas:
     --------
-    Como métodos:
-        data:    array (Y, X) o (dates, Y, X). Mapas de la variable de interés. 3D si hay más de un archivo (más de una fecha)
-        Xcoords: array (2D). Coordenadas X de cada celda de los mapas de 'data'
-        Ycoords: array (2D). Coordenadas Y de cada celda de los mapas de 'data'
-        dates:   list. Fechas a las que corresponde cada uno de los maapas de 'data'
+    modis:      raster3D. Mapas (dates, Y, X) de la variable de interés, con sus coordenadas X e Y y sus fechas. Si 'var' es una lista, diccionario {var: raster3D}
     """    
     
-    if os.path.exists(path + product + '/') is False:
-        os.makedirs(path + product + '/')
-    os.chdir(path + product + '/')
-    
-    # SELECCIÓN DE ARCHIVOS
+    extraccion = extraerMODIS(path, product, var, tiles, factor=factor, dateslim=dateslim, extent=extent,
+                              out=out, workers=workers, nativo=nativo, qc=qc, verbose=verbose)
+    if extraccion is None:
+        return
+    data, Xmodis, Ymodis, dates, codificacion = extraccion
+
+    # RECORTE CON LA CUENCA
     # ---------------------
-    if dateslim is not None:
-        # convertir fechas límite en datetime.date
-        start = datetime.strptime(dateslim[0], '%Y-%m-%d').date()
-        end = datetime.strptime(dateslim[1], '%Y-%m-%d').date()
-    
-    dates, files = {tile: [] for tile in tiles}, {tile: [] for tile in tiles}
-    for tile in tiles:
-        # seleccionar archivos del producto para las hojas y fechas indicadas
-        for file in [f for f in os.listdir() if (product in f) & (tile in f)]:
-            year = file.split('.')[1][1:5]
-            doy = file.split('.')[1][5:]
-            date = datetime.strptime(' '.join([year, doy]), '%Y %j').date()
-            if dateslim is not None:
-                if (date>= start) & (date <= end):
-                    dates[tile].append(date)
-                    files[tile].append(file)
-            else:
-                dates[tile].append(date)
-                files[tile].append(file)
-    # comprobar que el número de archivos es igual en todas las hojas
-    if len(set([len(dates[tile]) for tile in tiles])) > 1:
-        print('¡ERROR! Diferente número de fechas en las diferentes hojas')
-        MODIS_extract.files = files
-        MODIS_extract.dates = dates
-        return 
-    else:
-        dates = np.sort(np.unique(np.array([date for tile in tiles for date in dates[tile]])))
+    if clip is not None:
+        # máscara de la cuenca ya calculada para este ASCII y esta malla: no hace falta transformar las coordenadas
+        clave = (os.path.abspath(clip), os.path.getmtime(clip), str(coordsClip), Xmodis[0], Xmodis[-1], Ymodis[0],
+                 Ymodis[-1], len(Xmodis), len(Ymodis))
+        if clave not in _mascaras:
+            XXmodis, YYmodis = np.meshgrid(Xmodis, Ymodis)
+            if coordsClip is not None:
+                XXmodis, YYmodis = Transformer.from_crs(sinusoidal, coordsClip).transform(XXmodis.flatten(),
+                                                                                          YYmodis.flatten())
+                XXmodis = np.asarray(XXmodis).reshape(len(Ymodis), len(Xmodis))
+                YYmodis = np.asarray(YYmodis).reshape(len(Ymodis), len(Xmodis))
+            _mascaras[clave] = mascaraCuenca(clip, XXmodis, YYmodis)
+        maskRows, maskCols, maskClip = _mascaras[clave][:3]
         if verbose:
-            print('Seleccionar archivos')
-            print('nº de archivos (fechas): {0:>3}'.format(len(dates)), end='\n\n')
-
-    # ATRIBUTOS MODIS
-    # ---------------
-    if verbose:
-        print('Generar atributos globales')
-    # extraer atributos para cada hoja
-    attributes = pd.DataFrame(index=tiles, columns=['ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'])
-    for tile in tiles:
-        attributes.loc[tile,:] = hdfAttrs(files[tile][0])
-
-    # extensión total
-    Xo = np.min(attributes.Xo)
-    Yf = np.max(attributes.Yf)
-    Xf = np.max(attributes.Xf)
-    Yo = np.min(attributes.Yo)
-    # nº total de columnas y filas
-    colsize = np.mean((attributes.Xf - attributes.Xo) / attributes.ncols)
-    ncols = int(round((Xf - Xo) / colsize, 0))
-    rowsize = np.mean((attributes.Yf - attributes.Yo) / attributes.nrows)
-    nrows = int(round((Yf - Yo) / rowsize, 0))
-    if verbose == True:
-        print('dimensión:\t\t({0:}, {1:})'.format(ncols, nrows))
-        print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xo, Yo))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xf, Yf), end='\n\n')
-
-    # coordenadas x de las celdas
-    Xmodis = np.linspace(Xo, Xf, ncols)
-    # coordenadas y de las celdas
-    Ymodis = np.linspace(Yf, Yo, nrows)
-        
-    # CREAR MÁSCARAS
-    # --------------
-    if extent is not None:
-        if verbose == True:
-            print('Crear máscaras')
-            
-        # crear máscara según la extensión
-        left, right, bottom, top =  extent
-        maskCols = (Xmodis >= left) & (Xmodis <= right)
-        maskRows = (Ymodis >= bottom) & (Ymodis <= top)
-        
-        # recortar coordenadas
-        Xmodis = Xmodis[maskCols]
-        Ymodis = Ymodis[maskRows]
-        
-        if verbose == True:
-            print('dimensión:\t\t({0:>4}, {1:>4})'.format(len(Ymodis), len(Xmodis)))
-            print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.min(), Ymodis.min()))
-        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.max(), Ymodis.max()),
-              end='\n\n')
-
-    # IMPORTAR DATOS
-    # --------------
-    if verbose:
-        print('Importar datos')
+            print('Recorte con la cuenca: ({0:>4}, {1:>4})'.format(*maskClip.shape))
+        Xmodis, Ymodis = Xmodis[maskCols], Ymodis[maskRows]
         
-    for d, date in enumerate(dates):
-        dateStr = str(date.year) + str(date.timetuple().tm_yday).zfill(3)
-
-        for t, tile in enumerate(tiles):
-            print('Fecha {0:>2} de {1:>2}: {2}\t||\tTile {3:>2} de {4:>2}: {5}'.format(d + 1, len(dates), date,
-                                                                                       t + 1, len(tiles), tile), end='\r')
-            
-            # localización de la hoja dentro del total de hojas
-            nc, nr, xo, yf, xf, yo = attributes.loc[tile, :]
-            i = int(round((Yf - yf) / (rowsize * attributes.nrows[t]), 0))
-            j = int(round((Xf - xf) / (colsize * attributes.ncols[t]), 0))
-
-            # archivo de la fecha y hoja dada
-            file = [f for f in files[tile] if dateStr in f][0]
-            # cargar archivo 'hdf'
-            hdf = Dataset(file, format='hdf4')
-            # extraer datos de la variable
-            tmp = hdf[var][:]
-            tmp = tmp.astype(float)
-            tmp[tmp.mask] = np.nan
-            hdf.close()
-            # guardar datos en un array global de la fecha
-            if t == 0:
-                dataD = tmp.copy()
+        def recortar(array, cod):
+            array = array[:, maskRows, :][:, :, maskCols]
+            if nativo:
+                nulo = cod['_FillValue']
+                array[:, maskClip] = default_fillvals[array.dtype.str[1:]] if nulo is None else nulo
             else:
-                if (i == 1) & (j == 0):
-                    dataD = np.concatenate((dataD, tmp), axis=0)
-                elif (i == 0) & (j == 1):
-                    dataD = np.concatenate((dataD, tmp), axis=1)
-            del tmp
+                array[:, maskClip] = np.nan
+            return array
         
-        # recortar array de la fecha con la máscara
-        if extent is not None:
-            dataD = dataD[maskRows, :][:, maskCols]
-            
-        # guardar datos en un array total
-        if d == 0:
-            data = dataD.copy()
+        if isinstance(var, str):
+            data = recortar(data, codificacion)
         else:
-            data = np.dstack((data, dataD))
-        del dataD
-    print()
-    
-    # multiplicar por el factor de escala (si existe)
-    if factor is not None:
-        data *= factor
-        
-    # reordenar el array (tiempo, Y, X)
-    if len(data.shape) == 3:
-        tmp = np.ones((data.shape[2], data.shape[0], data.shape[1])) * np.nan
-        for t in range(data.shape[2]):
-            tmp[t,:,:] = data[:,:,t]
-        data = tmp.copy()
-        del tmp
+            data = {v: recortar(data[v], None if codificacion is None else codificacion[v]) for v in var}
 
     # GUARDAR RESULTADOS
     # ------------------
-    modis = raster3D(data, Xmodis, Ymodis, dates, crs=sinusoidal)
+    if isinstance(var, str):
+        modis = raster3D(data, Xmodis, Ymodis, dates, crs=sinusoidal)
+        modis.codificacion = codificacion
+    else:
+        modis = {}
+        for v in var:
+            modis[v] = raster3D(data[v], Xmodis, Ymodis, dates, label=v, crs=sinusoidal)
+            modis[v].codificacion = codificacion[v]
     
     return modis
 
@@ -1278,42 +1072,72 @@ def MODIS2netCDF(file, raster3D, description=None):
     Archivo netCDF con el nombre indicado
     """
     
+    # definir el netcdf
+    nc = crearNetCDF(file, raster3D.variable, raster3D.units, raster3D.X, raster3D.Y, raster3D.crs,
+                     description=description)
+
+    # variable
+    nc[raster3D.variable][:,:,:] = raster3D.data[:,:,:]
+    # variable 'time'
+    deltas = [date - datetime(1, 1, 1).date() for date in raster3D.times]
+    nc['time'][:] = [delta.days for delta in deltas]
+
+    nc.close()
+
+
+def crearNetCDF(file, variable, units, X, Y, crs, description=None):
+    """Crea un netCDF vacío con la estructura de 'MODIS2netCDF': una variable (time, Y, X) con la dimensión 'time' ilimitada, en la que ir añadiendo fechas.
+    
+    Entradas:
+    ---------
+    file:        string. Archivo (incluye ruta y extensión) a crear
+    variable:    string. Nombre de la variable
+    units:       string. Unidades de la variable
+    X:           array (X,). Coordenadas X de las columnas
+    Y:           array (Y,). Coordenadas Y de las filas
+    crs:         pyproj.CRS. Sistema de coordenadas
+    description: string. Descripción de los datos que se incluirá dentro del netCDF
+    
+    Salida:
+    -------
+    nc:          netCDF4.Dataset. Archivo abierto en modo escritura, sin ninguna fecha
+    """
+    
     # definir el netcdf
     nc = Dataset(file, 'w', format='NETCDF4')
 
     # crear atributos
-    nc.description = description
+    if description is not None:
+        nc.description = description
     nc.history = 'Creado el ' + datetime.now().date().strftime('%Y-%m-%d')
     nc.source = 'https://e4ftl01.cr.usgs.gov/'
-    nc.coordinateSystem = 'epsg:{0}'.format(raster3D.crs.to_epsg())
+    # el sistema de coordenadas se guarda como WKT, porque no todos tienen código EPSG (p.ej. el sinusoidal de MODIS)
+    epsg = crs.to_epsg()
+    nc.coordinateSystem = crs.to_wkt() if epsg is None else 'epsg:{0}'.format(epsg)
+    nc.crs_wkt = crs.to_wkt()
 
-    # crear las dimensiones
-    time = nc.createDimension('time', len(raster3D.times))
-    Y = nc.createDimension('Y', len(raster3D.Y))
-    X = nc.createDimension('X', len(raster3D.X))
+    # crear las dimensiones. 'time' es ilimitada para poder añadir nuevas fechas con 'actualizarMODIS'
+    nc.createDimension('time', None)
+    nc.createDimension('Y', len(Y))
+    nc.createDimension('X', len(X))
 
     # crear variables
-    Var = nc.createVariable(raster3D.variable, 'f4', ('time', 'Y', 'X'))
-    Var.units = raster3D.units
+    Var = nc.createVariable(variable, 'f4', ('time', 'Y', 'X'))
+    Var.units = units
     times = nc.createVariable('time', 'f8', ('time',))
     times.units = 'días desde el 0001-01-01'
     times.calendar = 'Gregoriano'
-    Xs = nc.createVariable('X', 'u4', ('X',))
+    Xs = nc.createVariable('X', 'f8', ('X',))
     Xs.units = 'm'
-    Ys = nc.createVariable('Y', 'u4', ('Y',))
+    Ys = nc.createVariable('Y', 'f8', ('Y',))
     Ys.units = 'm'
 
-    # variable
-    Var[:,:,:] = raster3D.data[:,:,:]
-    # variable 'time'
-    deltas = [date - datetime(1, 1, 1).date() for date in raster3D.times]
-    times[:] = [delta.days for delta in deltas]
     # variable 'X'
-    Xs[:] = raster3D.X # + cellsize / 2
+    Xs[:] = X # + cellsize / 2
     # variable 'Y'
-    Ys[:] = raster3D.Y # + cellsize / 2
+    Ys[:] = Y # + cellsize / 2
 
-    nc.close()
+    return nc
     
     
 def netCDF2MODIS(file, label=None):
@@ -1339,7 +1163,7 @@ def netCDF2MODIS(file, label=None):
     # coordenadas
     X = nc['X'][:].data
     Y = nc['Y'][:].data
-    crs = CRS.from_epsg(nc.coordinateSystem.split(':')[1])
+    crs = crsNetCDF(nc)
 
     # guardar como objeto raster3D
     MODIS = raster3D(data, X, Y, times, variable=variable, label=label, units=units,
@@ -1351,6 +1175,258 @@ def netCDF2MODIS(file, label=None):
     return MODIS
 
 
+def crsNetCDF(nc):
+    """Sistema de coordenadas de un netCDF creado con 'crearNetCDF' o 'MODIS2netCDF'. Se lee del atributo 'crs_wkt' y, en los archivos anteriores a él, del atributo 'coordinateSystem' ('epsg:25830').
+    
+    Entradas:
+    ---------
+    nc:       netCDF4.Dataset. Archivo netCDF abierto
+    
+    Salida:
+    -------
+    crs:      pyproj.CRS. Sistema de coordenadas. 'None' si el archivo no lo indica
+    """
+    
+    if 'crs_wkt' in nc.ncattrs():
+        return CRS.from_user_input(nc.crs_wkt)
+    # los archivos anteriores a 'crs_wkt' de un sistema sin código EPSG se guardaban como 'epsg:None'
+    codigo = nc.coordinateSystem.split(':')[1] if 'coordinateSystem' in nc.ncattrs() else 'None'
+    if codigo == 'None':
+        return None
+    
+    return CRS.from_epsg(codigo)
+
+
+def actualizarMODIS(file, path, product, var, tiles, factor=None, dateslim=None, workers=None, verbose=True):
+    """Añade a un netCDF creado con 'MODIS2netCDF' los mapas de las fechas nuevas disponibles en el catálogo local. Sólo se extraen los gránulos posteriores a la última fecha del netCDF y se escriben al final de la dimensión 'time', sin reescribir los datos anteriores. La extensión se toma de las coordenadas X e Y del propio netCDF, por lo que sólo se pueden actualizar los netCDF en la proyección sinusoidal de MODIS (sin reproyectar); con cualquier otro sistema de coordenadas se devuelve un error antes de extraer nada.
+    
+    Entradas:
+    ---------
+    file:       string. Archivo netCDF (incluida ruta y extensión) a actualizar
+    path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
+    product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+    var:        string. Variable de interés dentro de los archivos 'hdf'
+    tiles:      list. Hojas del producto MODIS a tratar
+    factor:     float. Factor con el que multiplicar los datos para obtener su valor real. Ha de ser el mismo que el usado al crear el netCDF
+    dateslim:   list. Fechas de inicio y fin en formato YYYY-MM-DD entre las que buscar fechas nuevas. Si es 'None', todas las posteriores a la última fecha del netCDF
+    workers:    int. Nº de procesos con los que leer los archivos 'hdf' en paralelo. Si es 'None', se leen en serie
+    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+    
+    Salidas:
+    --------
+    nuevas:     array (dates,). Fechas añadidas al netCDF
+    """
+    
+    # fechas y malla del netCDF
+    nc = Dataset(file, 'a', format='NETCDF4')
+    if not nc.dimensions['time'].isunlimited():
+        print('¡ERROR! La dimensión "time" de {0} no es ilimitada. Vuelva a crear el archivo con "MODIS2netCDF"'.format(file))
+        nc.close()
+        return
+    crs = crsNetCDF(nc)
+    if (crs is None) or (not crs.equals(sinusoidal)):
+        print('¡ERROR! {0} no está en la proyección sinusoidal de MODIS ({1}). Sólo se pueden actualizar los netCDF sin reproyectar'.format(file, 'desconocida' if crs is None else crs.name))
+        nc.close()
+        return
+    times = np.array([datetime(1, 1, 1).date() + timedelta(time) for time in nc['time'][:].data])
+    X, Y = nc['X'][:].data, nc['Y'][:].data
+    
+    # fechas del catálogo que no están en el netCDF
+    catalogo = Catalogo(os.path.join(path, product))
+    catalogo.actualizar()
+    start, end = (None, None) if dateslim is None else dateslim
+    disponibles = np.unique([registro[1] for registro in catalogo.buscar(product, tiles, start, end)])
+    catalogo.cerrar()
+    nuevas = np.setdiff1d(disponibles, times)
+    if len(times) > 0:
+        huecos = nuevas[nuevas <= times.max()]
+        if (len(huecos) > 0) & verbose:
+            print('¡AVISO! {0} fechas anteriores a la última del netCDF no se añaden: {1}'.format(len(huecos), huecos))
+        nuevas = nuevas[nuevas > times.max()]
+    if len(nuevas) == 0:
+        if verbose:
+            print('{0} está actualizado'.format(file))
+        nc.close()
+        return nuevas
+    
+    # extraer sólo las fechas nuevas en la extensión del netCDF (con un margen de media celda)
+    cellsize = np.mean(np.abs(np.diff(X)))
+    extent = [X.min() - cellsize / 2, X.max() + cellsize / 2, Y.min() - cellsize / 2, Y.max() + cellsize / 2]
+    dateslim = [nuevas.min().strftime('%Y-%m-%d'), nuevas.max().strftime('%Y-%m-%d')]
+    extraccion = extraerMODIS(path, product, var, tiles, factor=factor, dateslim=dateslim, extent=extent,
+                              workers=workers, verbose=verbose)
+    if extraccion is None:
+        nc.close()
+        return
+    data, Xmodis, Ymodis, dates, codificacion = extraccion
+    if (data.shape[1:] != (len(Y), len(X))) or (not np.allclose(Xmodis, X)) or (not np.allclose(Ymodis, Y)):
+        print('¡ERROR! La malla de los datos nuevos no coincide con la de {0}'.format(file))
+        nc.close()
+        return
+    
+    # añadir al final de la dimensión 'time'
+    for variable in nc.variables:
+        if variable not in ['time', 'X', 'Y']:
+            break
+    n = len(times)
+    nc[variable][n:n + len(dates), :, :] = data
+    nc['time'][n:n + len(dates)] = [(date - datetime(1, 1, 1).date()).days for date in dates]
+    nc.history = nc.history + '. Actualizado el ' + datetime.now().date().strftime('%Y-%m-%d')
+    nc.close()
+    
+    if verbose:
+        print('{0} fechas añadidas a {1}: {2} a {3}'.format(len(dates), file, dates[0], dates[-1]))
+    
+    return dates
+
+
+def canalizarMODIS(file, path, product, var, tiles, start=None, end=None, extent=None, factor=None, qc=None,
+                   units='', description=None, username=None, password=None, workers=8, verbose=True, **kwargs):
+    """Descarga y extracción encadenadas: cada gránulo se lee, se recorta y se coloca en su fecha en cuanto termina su descarga, y cada fecha se escribe en el netCDF en cuanto están todas sus hojas. Las descargas (en hilos, véase 'descargarMODIS') y la lectura de los 'hdf' se solapan, de modo que una fecha nueva está disponible poco después de descargarse su último gránulo, sin esperar al resto del periodo.
+    
+    Si 'file' ya existe (creado con 'MODIS2netCDF', 'actualizarMODIS' o esta misma función), sólo se descargan y se leen los gránulos posteriores a la última fecha que contiene y la extensión se toma de sus coordenadas X e Y. Ha de estar en la proyección sinusoidal de MODIS, como los que crea esta función.
+    
+    Los gránulos locales que no se pueden leer (p.ej. archivos truncados) se tratan como no disponibles: su hoja queda sin datos en esa fecha. Si la extracción se detiene por un error, las descargas pendientes se cancelan.
+    
+    Entradas:
+    ---------
+    file:        string. Archivo netCDF (incluida ruta y extensión) a crear o actualizar
+    path:        string. Carpeta donde guardar los datos descargados. Se crea una subcarpeta por producto
+    product:     string. Producto MODIS con su versión. P.ej.: 'MOD16A2.006'
+    var:         string. Variable de interés dentro de los archivos 'hdf'
+    tiles:       list of strings. Hojas MODIS a descargar y extraer. Formato 'h00v00'
+    start:       string. Fecha a partir de la que descargar datos. Formato 'YYYY-MM-DD'
+    end:         string. Fecha hasta la que descargar datos. Formato 'YYYY-MM-DD'
+    extent:      list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', las hojas completas
+    factor:      float. Factor con el que multiplicar los datos para obtener su valor real
+    qc:          boolean o dict. Regla de calidad a aplicar. Véase 'extraerMODIS'
+    units:       string. Unidades de la variable en el netCDF nuevo
+    description: string. Descripción de los datos en el netCDF nuevo
+    username:    string. Nombre de usuario en Earthdata. Si es 'None', se busca en '.netrc' o se pide por pantalla antes de empezar (véase 'credencialesEarthdata')
+    password:    string. Contraseña en Earthdata. Si es 'None', se pide por pantalla antes de empezar
+    workers:     int. Nº de descargas simultáneas
+    verbose:     boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+    kwargs:      Argumentos adicionales de 'descargarMODIS', p.ej. 'url', 'porHost', 'verificar' o 'inventario'
+    
+    Salidas:
+    --------
+    nuevas:      list. Fechas añadidas al netCDF
+    """
+    
+    short_name = product.split('.')[0]
+    
+    # netCDF existente: fechas y malla
+    nc, ultima = None, None
+    existia = os.path.exists(file)
+    if existia:
+        nc = Dataset(file, 'a', format='NETCDF4')
+        if not nc.dimensions['time'].isunlimited():
+            print('¡ERROR! La dimensión "time" de {0} no es ilimitada. Vuelva a crear el archivo con "MODIS2netCDF"'.format(file))
+            nc.close()
+            return
+        crs = crsNetCDF(nc)
+        if (crs is None) or (not crs.equals(sinusoidal)):
+            print('¡ERROR! {0} no está en la proyección sinusoidal de MODIS ({1}). Sólo se pueden actualizar los netCDF sin reproyectar'.format(file, 'desconocida' if crs is None else crs.name))
+            nc.close()
+            return
+        for variable in nc.variables:
+            if variable not in ['time', 'X', 'Y']:
+                break
+        if len(nc['time']) > 0:
+            ultima = datetime(1, 1, 1).date() + timedelta(nc['time'][:].data.max())
+        X, Y = nc['X'][:].data, nc['Y'][:].data
+        cellsize = np.mean(np.abs(np.diff(X)))
+        extent = [X.min() - cellsize / 2, X.max() + cellsize / 2, Y.min() - cellsize / 2, Y.max() + cellsize / 2]
+        # sólo interesan los gránulos posteriores a la última fecha del netCDF
+        if ultima is not None:
+            siguiente = ultima + timedelta(days=1)
+            if (start is None) or (datetime.strptime(start, '%Y-%m-%d').date() < siguiente):
+                start = siguiente.strftime('%Y-%m-%d')
+            if (end is not None) and (datetime.strptime(end, '%Y-%m-%d').date() < siguiente):
+                if verbose:
+                    print('{0} ya contiene todas las fechas hasta {1}'.format(file, end))
+                nc.close()
+                return []
+    else:
+        variable = var
+    
+    # DESCARGA
+    # --------
+    # las credenciales se piden aquí, en el hilo principal, y no en el hilo de las descargas (p.ej. en Jupyter)
+    username, password = credencialesEarthdata(username, password)
+    # las descargas avisan en una cola del estado de cada gránulo; si la extracción se detiene, se cancelan
+    avisos, cancelar = Queue(), Event()
+    def productor():
+        try:
+            descargarMODIS(path, product, start=start, end=end, tiles=tiles, username=username, password=password,
+                           workers=workers, avisos=avisos, cancelar=cancelar, verbose=False, **kwargs)
+        finally:
+            avisos.put(None)
+    hilo = Thread(target=productor, daemon=True)
+    hilo.start()
+    
+    # EXTRACCIÓN
+    # ----------
+    if os.path.isdir(os.path.join(path, short_name)) == False:
+        os.makedirs(os.path.join(path, short_name))
+    catalogo = Catalogo(os.path.join(path, short_name))
+    ensamblador = Ensamblador(short_name, var, tiles, extent=extent, factor=factor, qc=qc, catalogo=catalogo)
+    nuevas = []
+    
+    def escribir(date, data):
+        nonlocal nc
+        if (ultima is not None) and (date <= ultima):
+            return
+        if nc is None:
+            nc = crearNetCDF(file, variable, units, ensamblador.X, ensamblador.Y, sinusoidal, description=description)
+        elif (len(nuevas) == 0) and ((data.shape != (len(Y), len(X))) or (not np.allclose(ensamblador.X, X))
+                                     or (not np.allclose(ensamblador.Y, Y))):
+            raise ValueError('La malla de los datos nuevos no coincide con la de {0}'.format(file))
+        # añadir al final de la dimensión 'time'
+        n = len(nc['time'])
+        nc[variable][n, :, :] = data
+        nc['time'][n] = (date - datetime(1, 1, 1).date()).days
+        nc.sync()
+        nuevas.append(date)
+        if verbose:
+            print('Fecha {0:>4}: {1}'.format(len(nuevas), date), end='\r')
+    
+    try:
+        while True:
+            aviso = avisos.get()
+            if aviso is None:
+                break
+            granulo, estado = aviso
+            if estado is None:
+                ensamblador.programar(granulo)
+                continue
+            try:
+                completas = ensamblador.añadir(granulo, estado)
+            except (OSError, RuntimeError) as e:
+                print('¡AVISO! No se pudo leer {0}: {1}'.format(granulo, e))
+                completas = ensamblador.añadir(granulo, False)
+            for date, data in completas:
+                escribir(date, data)
+        for date, data in ensamblador.completas(final=True):
+            escribir(date, data)
+    except ValueError as e:
+        print('¡ERROR! {0}'.format(e))
+    finally:
+        # detener las descargas que queden y esperar a que terminen
+        cancelar.set()
+        hilo.join()
+        catalogo.cerrar()
+        if nc is not None:
+            if existia & (len(nuevas) > 0):
+                nc.history = nc.history + '. Actualizado el ' + datetime.now().date().strftime('%Y-%m-%d')
+            nc.close()
+    if verbose:
+        print()
+        print('{0} fechas añadidas a {1}'.format(len(nuevas), file))
+    
+    return nuevas
+
+
 def missingMaps(Terra, Aqua, verbose=True):
     """Encuentra mapas que falten en la serie temporal de cada uno de los satélites. En caso de encontrarlos, los intenta rellenar con los datos del otro satélite. Si el otro satélite tampoco dipusiera de datos para esa fecha, se crea un mapa vacío en esa fecha.
     
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Decodificación de las capas de calidad (QA/QC) de los productos MODIS. Cada capa de calidad es un entero (uint8 o uint16) en el que distintos grupos de bits codifican un campo (calidad general 'MODLAND_QC', estado de nubosidad, algoritmo empleado...). Las reglas se escriben de forma declarativa para cada producto como los valores admitidos de cada campo, p.ej. {'MODLAND_QC': [0], 'CloudState': [0]}.
+#
+# Una regla se compila una única vez en una tabla de consulta ('lookup table') con un booleano por cada código posible de la capa de calidad (256 ó 65536), de modo que la máscara de un mapa o de un cubo completo se obtiene en una sola pasada: 'tabla[qc]'.
+#
+# ***
+# INDICE
+# ------
+# productoQC
+# reglaQC
+# compilarQC
+# mascaraQC
+
+
+
+import numpy as np
+
+
+# campos de la capa de calidad de los productos de LAI/FPAR (MOD15A2H) y evapotranspiración (MOD16A2, misma codificación): {campo: (bit inicial, nº de bits)}
+# https://lpdaac.usgs.gov/documents/624/MOD15_User_Guide_V6.pdf
+CAMPOS_MOD15 = {'MODLAND_QC': (0, 1),     # 0: buena calidad; 1: otra calidad
+                'Sensor': (1, 1),         # 0: Terra; 1: Aqua
+                'DeadDetector': (2, 1),   # 0: sin detectores defectuosos; 1: detectores defectuosos
+                'CloudState': (3, 2),     # 0: despejado; 1: nubes; 2: nubes parciales; 3: no definido (se supone despejado)
+                'SCF_QC': (5, 3)}         # 0: algoritmo principal; 1: principal con saturación; 2-3: algoritmo empírico; 4: sin dato
+
+# campos de la capa de calidad de los índices de vegetación (MOD13)
+# https://lpdaac.usgs.gov/documents/103/MOD13_User_Guide_V6.pdf
+CAMPOS_MOD13 = {'MODLAND_QC': (0, 2),     # 0: buena calidad; 1: revisar otros campos; 2: nubes; 3: sin dato
+                'VIUsefulness': (2, 4),   # 0: máxima calidad ... 15: no útil
+                'Aerosol': (6, 2),        # 0: climatología; 1: bajo; 2: medio; 3: alto
+                'AdjacentCloud': (8, 1),  # 1: nubes adyacentes
+                'BRDF': (9, 1),           # 1: corrección BRDF
+                'MixedClouds': (10, 1),   # 1: nubes parciales
+                'LandWater': (11, 3),     # 1: tierra; 0, 2-7: agua, costa...
+                'Snow': (14, 1),          # 1: nieve o hielo
+                'Shadow': (15, 1)}        # 1: sombra
+
+# el producto de nieve (MOD10A2) no tiene capa de calidad: los códigos de la propia variable indican su validez
+# https://nsidc.org/sites/nsidc.org/files/files/MODIS-snow-user-guide-C6.pdf
+CAMPOS_MOD10 = {'Codigo': (0, 8)}         # 25: sin nieve; 37: lago; 39: océano; 100: hielo; 200: nieve; 1, 11, 50, 254, 255: sin dato, noche, nubes...
+
+# reglas de calidad por defecto de cada producto: capa de calidad de cada variable, tipo de dato de la capa, campos y valores admitidos de cada campo
+CALIDAD = {'MOD15A2H': {'capas': {'Lai_500m': 'FparLai_QC', 'Fpar_500m': 'FparLai_QC'},
+                        'dtype': np.uint8,
+                        'campos': CAMPOS_MOD15,
+                        'regla': {'MODLAND_QC': [0], 'CloudState': [0]}},
+           'MOD16A2': {'capas': {'ET_500m': 'ET_QC_500m', 'LE_500m': 'ET_QC_500m',
+                                 'PET_500m': 'ET_QC_500m', 'PLE_500m': 'ET_QC_500m'},
+                       'dtype': np.uint8,
+                       'campos': CAMPOS_MOD15,
+                       'regla': {'MODLAND_QC': [0], 'CloudState': [0]}},
+           'MOD13Q1': {'capas': {'250m 16 days NDVI': '250m 16 days VI Quality',
+                                 '250m 16 days EVI': '250m 16 days VI Quality'},
+                       'dtype': np.uint16,
+                       'campos': CAMPOS_MOD13,
+                       'regla': {'MODLAND_QC': [0, 1], 'MixedClouds': [0], 'Shadow': [0]}},
+           'MOD13A1': {'capas': {'500m 16 days NDVI': '500m 16 days VI Quality',
+                                 '500m 16 days EVI': '500m 16 days VI Quality'},
+                       'dtype': np.uint16,
+                       'campos': CAMPOS_MOD13,
+                       'regla': {'MODLAND_QC': [0, 1], 'MixedClouds': [0], 'Shadow': [0]}},
+           'MOD10A2': {'capas': {'Maximum_Snow_Extent': 'Maximum_Snow_Extent'},
+                       'dtype': np.uint8,
+                       'campos': CAMPOS_MOD10,
+                       'regla': {'Codigo': [25, 37, 39, 100, 200]}}}
+
+# tablas ya compiladas en esta sesión: {(dtype, campos, regla): tabla}
+_tablas = {}
+
+
+
+
+def productoQC(product):
+    """Nombre con el que buscar un producto en 'CALIDAD'. Los productos de Aqua (MYD) y combinados (MCD) comparten las reglas de los de Terra (MOD).
+
+    Entradas:
+    ---------
+    product:   string. Nombre del producto MODIS, p.ej. MYD15A2H
+
+    Salidas:
+    --------
+    product:   string. Nombre del producto de Terra, p.ej. MOD15A2H
+    """
+
+    return 'MOD' + product.upper()[3:]
+
+
+
+
+def reglaQC(product, var, regla=None):
+    """Capa de calidad y tabla de consulta compilada para una variable de un producto.
+
+    Entradas:
+    ---------
+    product:   string. Nombre del producto MODIS, p.ej. MOD16A2
+    var:       string. Variable de interés dentro de los archivos 'hdf'
+    regla:     dict. Valores admitidos de cada campo de calidad, p.ej. {'MODLAND_QC': [0], 'CloudState': [0, 3]}. Si es 'None' o True, la regla por defecto del producto en 'CALIDAD'
+
+    Salidas:
+    --------
+    capa:      string. Variable del 'hdf' con la calidad de 'var'
+    tabla:     array (256,) o (65536,) de booleanos. True para los códigos de calidad admitidos. Véase 'compilarQC'
+    Si el producto o la variable no tienen reglas de calidad, devuelve 'None'
+    """
+
+    calidad = CALIDAD.get(productoQC(product))
+    if (calidad is None) or (var not in calidad['capas']):
+        print('¡AVISO! No hay reglas de calidad para la variable {0} del producto {1}'.format(var, product))
+        return None
+    if (regla is None) or (regla is True):
+        regla = calidad['regla']
+
+    tabla = compilarQC(calidad['campos'], regla, calidad['dtype'])
+    if tabla is None:
+        return None
+
+    return calidad['capas'][var], tabla
+
+
+
+
+def compilarQC(campos, regla, dtype=np.uint8):
+    """Compila una regla de calidad en una tabla de consulta con un booleano por cada código posible de la capa de calidad. Un código es válido si el valor de todos los campos de la regla está entre los admitidos.
+
+    Entradas:
+    ---------
+    campos:    dict. Posición de cada campo dentro de la capa de calidad: {campo: (bit inicial, nº de bits)}
+    regla:     dict. Valores admitidos de cada campo: {campo: lista de valores}
+    dtype:     numpy.dtype. Tipo de dato de la capa de calidad (np.uint8 o np.uint16)
+
+    Salidas:
+    --------
+    tabla:     array (2**bits,) de booleanos. 'tabla[qc]' es la máscara de celdas válidas
+    """
+
+    clave = (np.dtype(dtype).str, tuple(sorted(campos.items())),
+             tuple(sorted((campo, tuple(valores)) for campo, valores in regla.items())))
+    if clave not in _tablas:
+        codigos = np.arange(2 ** (8 * np.dtype(dtype).itemsize), dtype=np.uint32)
+        tabla = np.ones(len(codigos), dtype=bool)
+        for campo, valores in regla.items():
+            if campo not in campos:
+                print('¡ERROR! El campo {0} no existe. Campos disponibles: {1}'.format(campo, list(campos)))
+                return
+            inicio, nbits = campos[campo]
+            tabla &= np.isin((codigos >> inicio) & (2 ** nbits - 1), valores)
+        _tablas[clave] = tabla
+
+    return _tablas[clave]
+
+
+
+
+def mascaraQC(qc, tabla):
+    """Máscara de celdas válidas de una capa de calidad, en una sola pasada sobre el 'array'.
+
+    Entradas:
+    ---------
+    qc:        array. Valores originales (enteros) de la capa de calidad, de cualquier dimensión (mapa o cubo)
+    tabla:     array de booleanos. Tabla de consulta. Salida de 'compilarQC' o 'reglaQC'
+
+    Salidas:
+    --------
+    mask:      array de booleanos, de la misma dimensión que 'qc'. True en las celdas válidas
+    """
+
+    return tabla[np.asarray(qc)]
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Catálogo persistente de los archivos MODIS de una carpeta local y de la geometría de sus hojas. Los nombres de los archivos se analizan una única vez y se guardan en una base de datos 'sqlite' (producto, colección, hoja, fecha de adquisición, fecha de producción, ruta) en una carpeta de caché del usuario, con un archivo por carpeta catalogada, de modo que las carpetas de datos pueden ser de sólo lectura o compartidas. En las siguientes llamadas sólo se revisan las carpetas cuya fecha de modificación ha cambiado y las consultas por producto, hoja y periodo se resuelven mediante un índice. Los atributos de la malla de cada producto y hoja (extraídos de 'StructMetadata.0') se guardan en la misma base de datos, de modo que sólo se leen de un archivo la primera vez.
+#
+# Se reconocen dos tipos de archivo:
+# * Gránulos originales: 'MOD16A2.A2001001.h17v04.006.2017068145916.hdf'
+# * Mapas ASCII generados con los 'Extract_MODIS_pyScripter_*.py': 'MOD16A2_A2001001.asc', 'MCD12Q1_A2001001_PFT.asc'
+#
+# ***
+# INDICE
+# ------
+# analizarNombre
+# Catalogo
+
+
+
+import os
+import re
+import hashlib
+import sqlite3
+from datetime import datetime, date
+
+
+# carpeta por defecto de las bases de datos de los catálogos, una por carpeta catalogada
+CATALOGOS = os.environ.get('CATALOGOS_MODIS', os.path.join(os.path.expanduser('~'), '.cache', 'catalogos_MODIS'))
+
+# atributos de las hojas ya consultados en esta sesión: {(db, product, tile, var): (ncols, nrows, Xo, Yf, Xf, Yo)}
+_atributos = {}
+
+# patrones de los nombres de archivo
+PATRON_HDF = re.compile(r'^(?P<product>M[OYC]D\w+)\.A(?P<year>\d{4})(?P<doy>\d{3})\.(?P<tile>h\d{2}v\d{2})\.'
+                        r'(?P<collection>\d{3})\.(?P<produccion>\d{13})\.(?P<ext>hdf)$')
+PATRON_ASC = re.compile(r'^(?P<product>M[OYC]D\w+?)_A(?P<year>\d{4})(?P<doy>\d{3})(_(?P<var>\w+))?\.(?P<ext>asc)$',
+                        re.IGNORECASE)
+
+
+
+
+def analizarNombre(file):
+    """Extrae la información de un archivo MODIS a partir de su nombre.
+
+    Entradas:
+    ---------
+    file:      string. Nombre del archivo (sin ruta)
+
+    Salidas:
+    --------
+    info:      dict. Producto, colección, hoja, fecha de adquisición, fecha de producción, variable y extensión. 'None' si el nombre no corresponde a un archivo MODIS
+    """
+
+    for patron in [PATRON_HDF, PATRON_ASC]:
+        match = patron.match(file)
+        if match is not None:
+            break
+    else:
+        return None
+
+    info = match.groupdict()
+    fecha = datetime.strptime(info['year'] + info['doy'], '%Y%j').date()
+    produccion = info.get('produccion')
+    if produccion is not None:
+        produccion = datetime.strptime(produccion, '%Y%j%H%M%S').isoformat()
+
+    return {'product': info['product'].upper(),
+            'collection': info.get('collection'),
+            'tile': info.get('tile'),
+            'fecha': fecha.isoformat(),
+            'produccion': produccion,
+            'variable': info.get('var'),
+            'ext': info['ext'].lower()}
+
+
+
+
+class Catalogo:
+    def __init__(self, carpeta, db=None):
+        """Catálogo de los archivos MODIS de una carpeta.
+
+        Entradas:
+        ---------
+        carpeta:   string. Carpeta donde se encuentran los archivos
+        db:        string. Ruta de la base de datos. Por defecto, un archivo en 'CATALOGOS' (variable de entorno 'CATALOGOS_MODIS') con el 'hash' de la ruta de 'carpeta'. No conviene que esté dentro de 'carpeta': al escribir en ella cambiaría la fecha de modificación de la carpeta
+        """
+
+        self.carpeta = os.path.abspath(carpeta)
+        if db is None:
+            if os.path.isdir(CATALOGOS) == False:
+                os.makedirs(CATALOGOS)
+            db = os.path.join(CATALOGOS, hashlib.md5(self.carpeta.encode()).hexdigest() + '.sqlite')
+        self.db = db
+        self.conn = sqlite3.connect(self.db)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS carpetas (carpeta TEXT PRIMARY KEY, mtime REAL);
+            CREATE TABLE IF NOT EXISTS granulos (path TEXT PRIMARY KEY, carpeta TEXT, file TEXT,
+                                                 product TEXT, collection TEXT, tile TEXT, fecha TEXT,
+                                                 produccion TEXT, variable TEXT, ext TEXT,
+                                                 mtime REAL, size INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_granulos ON granulos (product, tile, fecha);
+            CREATE INDEX IF NOT EXISTS idx_carpetas ON granulos (carpeta);
+            CREATE TABLE IF NOT EXISTS atributos (product TEXT, tile TEXT, var TEXT,
+                                                  ncols INTEGER, nrows INTEGER, Xo REAL, Yf REAL, Xf REAL, Yo REAL,
+                                                  PRIMARY KEY (product, tile, var));
+            """)
+        self.conn.commit()
+
+
+    def actualizar(self, carpeta=None, forzar=False, verbose=False):
+        """Actualiza el catálogo con los archivos nuevos, modificados o eliminados de la carpeta. Sólo se vuelven a analizar los archivos cuya fecha de modificación o tamaño han cambiado. Si la fecha de modificación de la propia carpeta no ha cambiado desde la última actualización (no se han añadido ni eliminado archivos), no se revisa su contenido.
+
+        Entradas:
+        ---------
+        carpeta:   string. Carpeta a revisar. Por defecto, la carpeta del catálogo
+        forzar:    boolean. Si se quiere revisar el contenido aunque la carpeta no haya cambiado (p.ej. si se han sobreescrito archivos)
+        verbose:   boolean. Si se quiere mostrar en pantalla el resultado
+
+        Salidas:
+        --------
+        n:         int. Nº de archivos añadidos o modificados
+        """
+
+        carpeta = self.carpeta if carpeta is None else os.path.abspath(carpeta)
+        mtime = os.stat(carpeta).st_mtime
+        fila = self.conn.execute('SELECT mtime FROM carpetas WHERE carpeta = ?', (carpeta,)).fetchone()
+        if (not forzar) and (fila is not None) and (fila[0] == mtime):
+            return 0
+
+        # archivos ya catalogados en la carpeta
+        previos = {path: (mt, size) for path, mt, size in
+                   self.conn.execute('SELECT path, mtime, size FROM granulos WHERE carpeta = ?', (carpeta,))}
+
+        nuevos, vistos = [], set()
+        for entry in os.scandir(carpeta):
+            if not entry.is_file():
+                continue
+            info = analizarNombre(entry.name)
+            if info is None:
+                continue
+            vistos.add(entry.path)
+            stat = entry.stat()
+            if previos.get(entry.path) == (stat.st_mtime, stat.st_size):
+                continue
+            nuevos.append((entry.path, carpeta, entry.name, info['product'], info['collection'], info['tile'],
+                           info['fecha'], info['produccion'], info['variable'], info['ext'],
+                           stat.st_mtime, stat.st_size))
+        eliminados = [(path,) for path in previos if path not in vistos]
+
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO granulos VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', nuevos)
+            self.conn.executemany('DELETE FROM granulos WHERE path = ?', eliminados)
+            self.conn.execute('INSERT OR REPLACE INTO carpetas VALUES (?,?)', (carpeta, mtime))
+
+        if verbose:
+            print('Catálogo {0}: {1} archivos nuevos o modificados, {2} eliminados'.format(carpeta, len(nuevos),
+                                                                                          len(eliminados)))
+
+        return len(nuevos)
+
+
+    def buscar(self, product, tiles=None, start=None, end=None, collection=None, ext='hdf'):
+        """Consulta los archivos de un producto para unas hojas y un periodo.
+
+        Entradas:
+        ---------
+        product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+        tiles:      list. Hojas a buscar. Si es 'None', todas
+        start:      datetime.date o string 'YYYY-MM-DD'. Fecha inicial (incluida). Si es 'None', sin límite
+        end:        datetime.date o string 'YYYY-MM-DD'. Fecha final (incluida). Si es 'None', sin límite
+        collection: string. Colección del producto, p.ej. '006'. Si es 'None', cualquiera
+        ext:        string. Tipo de archivo: 'hdf' o 'asc'
+
+        Salidas:
+        --------
+        registros: list of tuples. (tile, fecha, produccion, path) ordenados por hoja, fecha y fecha de producción
+        """
+
+        sql = 'SELECT tile, fecha, produccion, path FROM granulos WHERE product = ? AND ext = ?'
+        params = [product.upper(), ext]
+        if tiles is not None:
+            sql += ' AND tile IN ({0})'.format(','.join('?' * len(tiles)))
+            params += list(tiles)
+        if start is not None:
+            sql += ' AND fecha >= ?'
+            params.append(str(start))
+        if end is not None:
+            sql += ' AND fecha <= ?'
+            params.append(str(end))
+        if collection is not None:
+            sql += ' AND collection = ?'
+            params.append(collection)
+        sql += ' ORDER BY tile, fecha, produccion'
+
+        return [(tile, date.fromisoformat(fecha), produccion, path)
+                for tile, fecha, produccion, path in self.conn.execute(sql, params)]
+
+
+    def archivos(self, product, tiles, start=None, end=None, collection=None):
+        """Archivos 'hdf' de un producto para cada hoja y fecha. Si hay varias versiones de un mismo gránulo, se toma la de producción más reciente.
+
+        Entradas:
+        ---------
+        product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+        tiles:      list. Hojas a buscar
+        start:      datetime.date o string 'YYYY-MM-DD'. Fecha inicial (incluida). Si es 'None', sin límite
+        end:        datetime.date o string 'YYYY-MM-DD'. Fecha final (incluida). Si es 'None', sin límite
+        collection: string. Colección del producto, p.ej. '006'. Si es 'None', cualquiera
+
+        Salidas:
+        --------
+        files:      dict. Para cada hoja, diccionario {fecha: ruta del archivo}
+        """
+
+        files = {tile: {} for tile in tiles}
+        for tile, fecha, produccion, path in self.buscar(product, tiles, start, end, collection):
+            files[tile][fecha] = path
+
+        return files
+
+
+    def leerAtributos(self, product, tile, var=None):
+        """Atributos de la malla de una hoja de un producto guardados en el catálogo.
+
+        Entradas:
+        ---------
+        product:   string. Nombre del producto MODIS, p.ej. MOD16A2
+        tile:      string. Hoja, p.ej. 'h17v04'
+        var:       string. Variable de la que se extrajeron los atributos (productos con varias mallas)
+
+        Salidas:
+        --------
+        attrs:     tuple. (ncols, nrows, Xo, Yf, Xf, Yo). 'None' si no están en el catálogo
+        """
+
+        clave = (self.db, product.upper(), tile, var or '')
+        if clave not in _atributos:
+            fila = self.conn.execute('SELECT ncols, nrows, Xo, Yf, Xf, Yo FROM atributos '
+                                     'WHERE product = ? AND tile = ? AND var = ?', clave[1:]).fetchone()
+            if fila is None:
+                return None
+            _atributos[clave] = fila
+
+        return _atributos[clave]
+
+
+    def guardarAtributos(self, product, tile, var, attrs):
+        """Guarda en el catálogo los atributos de la malla de una hoja de un producto.
+
+        Entradas:
+        ---------
+        product:   string. Nombre del producto MODIS, p.ej. MOD16A2
+        tile:      string. Hoja, p.ej. 'h17v04'
+        var:       string. Variable de la que se extrajeron los atributos (productos con varias mallas)
+        attrs:     tuple. (ncols, nrows, Xo, Yf, Xf, Yo). Salida de 'hdfAttrs'
+        """
+
+        clave = (self.db, product.upper(), tile, var or '')
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO atributos VALUES (?,?,?,?,?,?,?,?,?)', clave[1:] + tuple(attrs))
+        _atributos[clave] = tuple(attrs)
+
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+
+        self.conn.close()
@@ -0,0 +1,1201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Descarga concurrente de archivos MODIS. Las peticiones HTTP se hacen con un conjunto acotado de sesiones persistentes ('requests.Session'), que reutilizan las conexiones y las 'cookies' de Earthdata entre archivos. El nº de descargas simultáneas contra un mismo servidor está limitado y las peticiones fallidas (errores de conexión, 429 y 5xx) se repiten con una espera que se duplica en cada intento.
+#
+# La dirección del servidor es siempre un argumento, de modo que las funciones pueden probarse contra un servidor HTTP local que reproduzca la estructura de carpetas de https://e4ftl01.cr.usgs.gov/.
+#
+# 'descargarMODIS' es el punto de entrada único para cualquier producto: los de LP DAAC se descargan del servidor de USGS ('descargarUSGS') y los de nieve y hielo de NSIDC, o cualquiera filtrado por recuadro o polígono, a partir de una búsqueda en el CMR ('descargarCMR'). Varios productos se descargan a la vez compartiendo las sesiones, el límite por servidor, la caché de listados y los reintentos.
+#
+# ***
+# INDICE
+# ------
+# SesionEarthdata
+# Sesiones
+# peticion
+# listarDirectorio
+# enlaces
+# misionProducto
+# Inventario
+# tablaCRC
+# desplazamientoCRC
+# cksum
+# leerXML
+# leerUMM
+# verificarArchivo
+# descargarArchivo
+# descargarArchivos
+# descargarUSGS
+# versionCMR
+# consultaCMR
+# granulosUMM
+# buscarCMR
+# canalizarCMR
+# ejecutar
+# descargarCMR
+# proveedorProducto
+# credencialesEarthdata
+# descargarMODIS
+
+
+
+import os
+import netrc
+import getpass
+import time
+import random
+import shutil
+import hashlib
+import subprocess
+import json
+import asyncio
+import sqlite3
+import threading
+import numpy as np
+from datetime import datetime
+from queue import Queue
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.etree import ElementTree
+import requests
+from bs4 import BeautifulSoup
+
+
+# servidor de autenticación de Earthdata
+URS = 'urs.earthdata.nasa.gov'
+
+# carpeta del servidor de USGS de cada misión según el prefijo del producto
+MISIONES = {'MOD': 'MOLT', 'MYD': 'MOLA', 'MCD': 'MOTA'}
+
+# Common Metadata Repository de Earthdata
+CMR = 'https://cmr.earthdata.nasa.gov'
+
+# nombre por defecto de la caché de listados remotos dentro de la carpeta de descarga
+INVENTARIO = 'inventario_MODIS.sqlite'
+
+# prefijos de los productos distribuidos por NSIDC (nieve y hielo marino); el resto se distribuyen por LP DAAC
+NSIDC = ('MOD10', 'MYD10', 'MOD29', 'MYD29')
+
+# códigos HTTP tras los que se repite la petición
+REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+
+
+class SesionEarthdata(requests.Session):
+    """Sesión de 'requests' que mantiene el usuario y la contraseña en las redirecciones hacia y desde el servidor de autenticación de Earthdata. Por defecto 'requests' los elimina al cambiar de servidor.
+
+    Modificado de https://wiki.earthdata.nasa.gov/display/EL/How+To+Access+Data+With+Python
+    """
+
+    def rebuild_auth(self, prepared_request, response):
+        headers = prepared_request.headers
+        if 'Authorization' in headers:
+            original = urlparse(response.request.url).hostname
+            redirect = urlparse(prepared_request.url).hostname
+            if (original != redirect) and (redirect != URS) and (original != URS):
+                del headers['Authorization']
+
+
+
+
+class Sesiones:
+    def __init__(self, n=4, username=None, password=None, porHost=4, timeout=60):
+        """Conjunto acotado de sesiones HTTP persistentes compartidas por varios hilos, con un límite de peticiones simultáneas por servidor.
+
+        Entradas:
+        ---------
+        n:         int. Nº de sesiones (conexiones persistentes)
+        username:  string. Nombre de usuario en Earthdata. Si es 'None', las peticiones no se autentican
+        password:  string. Contraseña en Earthdata
+        porHost:   int. Nº máximo de peticiones simultáneas a un mismo servidor
+        timeout:   float. Segundos de espera máxima de conexión y lectura de cada petición
+        """
+
+        self.porHost = porHost
+        self.timeout = timeout
+        self.libres = Queue()
+        for i in range(n):
+            sesion = SesionEarthdata()
+            if username is not None:
+                sesion.auth = (username, password)
+            self.libres.put(sesion)
+        self.n = n
+        self.semaforos = {}
+        self.candado = threading.Lock()
+
+
+    @contextmanager
+    def sesion(self, url):
+        """Presta una sesión libre para hacer una petición a 'url', respetando el límite de peticiones simultáneas a su servidor.
+
+        Entradas:
+        ---------
+        url:       string. Dirección a la que se va a hacer la petición
+
+        Salidas:
+        --------
+        sesion:    requests.Session. Se devuelve al conjunto al salir del bloque 'with'
+        """
+
+        host = urlparse(url).netloc
+        with self.candado:
+            if host not in self.semaforos:
+                self.semaforos[host] = threading.BoundedSemaphore(self.porHost)
+        with self.semaforos[host]:
+            sesion = self.libres.get()
+            try:
+                yield sesion
+            finally:
+                self.libres.put(sesion)
+
+
+    def cerrar(self):
+        """Cierra las conexiones de todas las sesiones."""
+
+        for i in range(self.n):
+            self.libres.get().close()
+
+
+
+
+def peticion(sesion, url, reintentos=5, espera=1., timeout=60, **kwargs):
+    """Petición GET que se repite si falla la conexión o el servidor responde con un error temporal (429 o 5xx). Entre intentos se espera 'espera', 2 * 'espera', 4 * 'espera'... segundos, con una pequeña variación aleatoria para que los hilos no se sincronicen.
+
+    Entradas:
+    ---------
+    sesion:     requests.Session. Sesión con la que hacer la petición
+    url:        string. Dirección
+    reintentos: int. Nº máximo de intentos
+    espera:     float. Segundos de espera antes del segundo intento
+    timeout:    float. Segundos de espera máxima de conexión y lectura
+    kwargs:     Argumentos adicionales de 'requests.Session.get', p.ej. 'stream' o 'headers'
+
+    Salidas:
+    --------
+    response:   requests.Response. Respuesta del servidor. Si tras todos los intentos no hay respuesta válida, se lanza la última excepción
+    """
+
+    for intento in range(reintentos):
+        try:
+            response = sesion.get(url, timeout=timeout, **kwargs)
+            if response.status_code not in REINTENTABLES:
+                response.raise_for_status()
+                return response
+            response.close()
+            error = requests.HTTPError('{0} {1}'.format(response.status_code, response.reason), response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if intento < reintentos - 1:
+            time.sleep(espera * 2 ** intento * random.uniform(.8, 1.2))
+    raise error
+
+
+
+
+def listarDirectorio(sesiones, url, ext='/', reintentos=5):
+    """Extrae los enlaces de una página de índice (p.ej. una carpeta de https://e4ftl01.cr.usgs.gov/) terminados en 'ext'. Equivale a 'extract_dir' de 'funciones_MODIS.py', pero con una sesión persistente y reintentos.
+
+    Entradas:
+    ---------
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP
+    url:        string. Dirección de la carpeta (terminada en '/')
+    ext:        string. Caracter a buscar al final de cada enlace para seleccionarlo
+    reintentos: int. Nº máximo de intentos de la petición
+
+    Salidas:
+    --------
+    list_dir:   list. Direcciones completas de los enlaces seleccionados
+    """
+
+    with sesiones.sesion(url) as sesion:
+        page = peticion(sesion, url, reintentos=reintentos, timeout=sesiones.timeout).text
+    list_dir = [url + href for href in enlaces(page) if href.endswith(ext)]
+
+    return list_dir
+
+
+
+
+def enlaces(page):
+    """Enlaces ('href') de una página HTML de índice.
+
+    Entradas:
+    ---------
+    page:      string. Texto HTML de la página
+
+    Salidas:
+    --------
+    hrefs:     list. Enlaces, tal cual aparecen en la página
+    """
+
+    soup = BeautifulSoup(page, 'html.parser')
+
+    return [node.get('href') for node in soup.find_all('a') if node.get('href') is not None]
+
+
+
+
+def misionProducto(product):
+    """Carpeta de la misión en la que el servidor de USGS publica un producto, a partir del prefijo de su nombre.
+
+    Entradas:
+    ---------
+    product:   string. Producto MODIS. P.ej.: 'MOD16A2.006'
+
+    Salidas:
+    --------
+    mision:    string. Carpeta de la misión, p.ej. 'MOLT'. 'None' si el prefijo no es conocido
+    """
+
+    return MISIONES.get(product[:3].upper())
+
+
+
+
+class Inventario:
+    def __init__(self, db):
+        """Caché persistente de los listados de las carpetas remotas. Cada listado se guarda con su fecha de consulta y sus cabeceras 'ETag' y 'Last-Modified'. Mientras no ha pasado su tiempo de validez ('ttl') se usa sin consultar el servidor; después se revalida con una petición condicional, que sólo descarga la página si ha cambiado (si no, el servidor responde 304).
+
+        Entradas:
+        ---------
+        db:        string. Ruta de la base de datos 'sqlite'
+        """
+
+        self.db = db
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        self.candado = threading.Lock()
+        with self.candado, self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS listados (url TEXT PRIMARY KEY, enlaces TEXT, '
+                              'etag TEXT, modificado TEXT, consulta REAL)')
+
+
+    def listar(self, sesiones, url, ext='/', ttl=86400, reintentos=5):
+        """Listado de una carpeta remota, desde la caché si es posible. Equivale a 'listarDirectorio'.
+
+        Entradas:
+        ---------
+        sesiones:   class Sesiones. Conjunto de sesiones HTTP
+        url:        string. Dirección de la carpeta (terminada en '/')
+        ext:        string. Caracter a buscar al final de cada enlace para seleccionarlo
+        ttl:        float. Segundos durante los que el listado guardado es válido sin revalidarlo. Si es 'None', no caduca (p.ej. las carpetas de fechas pasadas, que no cambian)
+        reintentos: int. Nº máximo de intentos de la petición
+
+        Salidas:
+        --------
+        list_dir:   list. Direcciones completas de los enlaces seleccionados
+        """
+
+        with self.candado:
+            fila = self.conn.execute('SELECT enlaces, etag, modificado, consulta FROM listados WHERE url = ?',
+                                     (url,)).fetchone()
+        ahora = time.time()
+        if (fila is not None) and ((ttl is None) or (ahora - fila[3] < ttl)):
+            hrefs = json.loads(fila[0])
+        else:
+            # petición condicional
+            headers = {}
+            if fila is not None:
+                if fila[1] is not None:
+                    headers['If-None-Match'] = fila[1]
+                if fila[2] is not None:
+                    headers['If-Modified-Since'] = fila[2]
+            with sesiones.sesion(url) as sesion:
+                response = peticion(sesion, url, reintentos=reintentos, timeout=sesiones.timeout, headers=headers)
+            if (response.status_code == 304) and (fila is not None):
+                hrefs = json.loads(fila[0])
+                etag, modificado = fila[1], fila[2]
+            else:
+                hrefs = enlaces(response.text)
+                etag, modificado = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            with self.candado, self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO listados VALUES (?,?,?,?,?)',
+                                  (url, json.dumps(hrefs), etag, modificado, ahora))
+
+        return [url + href for href in hrefs if href.endswith(ext)]
+
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+
+        self.conn.close()
+
+
+
+
+def tablaCRC():
+    """Tabla del CRC de 32 bits (polinomio 0x04C11DB7, sin reflejar) usado por la orden POSIX 'cksum'."""
+
+    tabla = []
+    for i in range(256):
+        crc = i << 24
+        for j in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        tabla.append(crc & 0xFFFFFFFF)
+
+    return np.array(tabla, dtype=np.uint32)
+
+
+
+
+def desplazamientoCRC(n):
+    """Tablas para encadenar CRC calculados por separado. El CRC de 'cksum' (sin valor inicial) es lineal: crc(A + B) = crc(A + n bytes nulos) ^ crc(B), con n = len(B); y el CRC de un valor seguido de n bytes nulos es la suma (XOR) de la contribución de cada uno de sus 4 bytes.
+
+    Entradas:
+    ---------
+    n:         int. Nº de bytes nulos
+
+    Salidas:
+    --------
+    tablas:    array (4, 256) uint32. Contribución del byte 'k' (0 el menos significativo) de un CRC con cada valor
+    """
+
+    crc = np.arange(256, dtype=np.uint32)[None, :] << (8 * np.arange(4, dtype=np.uint32)[:, None])
+    for i in range(n):
+        crc = (crc << 8) ^ TABLA_CRC[crc >> 24]
+
+    return crc
+
+
+# tabla del CRC de 'cksum' y tablas para encadenar los CRC de filas de 'FILA_CRC' bytes
+TABLA_CRC = tablaCRC()
+FILA_CRC = 1024
+DESPLAZAMIENTO_CRC = desplazamientoCRC(FILA_CRC)
+
+
+
+
+def cksum(file, chunk=2**20):
+    """Suma de control POSIX 'cksum' de un archivo, la que indican los XML de metadatos de LP DAAC ('ChecksumType' CKSUM). Si el sistema dispone de la orden 'cksum' se usa ésta; si no, se calcula con numpy: cada bloque se divide en filas de 'FILA_CRC' bytes, se calcula a la vez el CRC de todas las filas y se encadenan con 'desplazamientoCRC'. Así cuesta unos 15 ms por MB, frente a unos 0,2 s por MB (reteniendo el GIL) de recorrer los bytes uno a uno en Python.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+    chunk:     int. Tamaño (bytes) de los bloques de lectura. Al menos 64 filas ('FILA_CRC' bytes cada una)
+
+    Salidas:
+    --------
+    crc:       int. Suma de control
+    """
+
+    if shutil.which('cksum') is not None:
+        salida = subprocess.run(['cksum', file], capture_output=True, check=True, text=True).stdout
+        return int(salida.split()[0])
+
+    chunk = max(chunk, 64 * FILA_CRC)
+    tabla, d0, d1, d2, d3 = TABLA_CRC.tolist(), *DESPLAZAMIENTO_CRC.tolist()
+    crc, n, resto = 0, 0, b''
+    with open(file, 'rb') as f:
+        for bloque in iter(lambda: f.read(chunk), b''):
+            n += len(bloque)
+            datos = resto + bloque
+            m = len(datos) // FILA_CRC
+            resto = datos[m * FILA_CRC:]
+            # CRC de las 'm' filas a la vez, recorriendo sus columnas
+            columnas = np.frombuffer(datos, dtype=np.uint8, count=m * FILA_CRC).reshape(m, FILA_CRC).T.copy()
+            filas = np.zeros(m, dtype=np.uint32)
+            for columna in columnas:
+                filas = (filas << 8) ^ TABLA_CRC[(filas >> 24) ^ columna]
+            # se encadenan con el CRC acumulado
+            for fila in filas.tolist():
+                crc = d0[crc & 0xFF] ^ d1[(crc >> 8) & 0xFF] ^ d2[(crc >> 16) & 0xFF] ^ d3[crc >> 24] ^ fila
+    # los últimos bytes (menos de una fila) y la longitud del archivo
+    for byte in resto + n.to_bytes((n.bit_length() + 7) // 8, 'little'):
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ tabla[(crc >> 24) ^ byte]
+
+    return ~crc & 0xFFFFFFFF
+
+
+
+
+def leerXML(texto):
+    """Extrae el tamaño y la suma de control de los archivos descritos en un XML de metadatos de LP DAAC (p.ej. 'MOD16A2.A2001001.h17v04.006.2017068145916.hdf.xml').
+
+    Entradas:
+    ---------
+    texto:     string o bytes. Contenido del XML
+
+    Salidas:
+    --------
+    esperado:  dict. Para cada archivo, diccionario con 'size' (bytes), 'checksum' y 'algoritmo' (p.ej. 'CKSUM' o 'MD5')
+    """
+
+    raiz = ElementTree.fromstring(texto)
+    esperado = {}
+    for contenedor in raiz.iter('DataFileContainer'):
+        nombre = contenedor.findtext('DistributedFileName')
+        if nombre is None:
+            continue
+        size = contenedor.findtext('FileSize')
+        esperado[nombre.strip()] = {'size': None if size is None else int(size),
+                                    'checksum': contenedor.findtext('Checksum'),
+                                    'algoritmo': contenedor.findtext('ChecksumType')}
+
+    return esperado
+
+
+
+
+def leerUMM(umm):
+    """Extrae el tamaño y la suma de control de los archivos de un gránulo a partir de sus metadatos UMM-G del CMR ('search/granules.umm_json').
+
+    Entradas:
+    ---------
+    umm:       dict. Campo 'umm' de un elemento de la respuesta del CMR
+
+    Salidas:
+    --------
+    esperado:  dict. Para cada archivo, diccionario con 'size' (bytes), 'checksum' y 'algoritmo'
+    """
+
+    esperado = {}
+    for info in umm.get('DataGranule', {}).get('ArchiveAndDistributionInformation', []):
+        checksum = info.get('Checksum', {})
+        size = info.get('SizeInBytes')
+        if (size is None) and (info.get('SizeUnit') == 'B'):
+            size = info.get('Size')
+        esperado[info['Name']] = {'size': None if size is None else int(size),
+                                  'checksum': checksum.get('Value'),
+                                  'algoritmo': checksum.get('Algorithm')}
+
+    return esperado
+
+
+
+
+def verificarArchivo(file, esperado):
+    """Comprueba el tamaño y la suma de control de un archivo.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+    esperado:  dict. 'size', 'checksum' y 'algoritmo' esperados (véanse 'leerXML' y 'leerUMM'). Las claves ausentes o 'None' no se comprueban
+
+    Salidas:
+    --------
+    error:     string. Descripción de la discrepancia. 'None' si el archivo es correcto
+    """
+
+    size = esperado.get('size')
+    if (size is not None) and (os.path.getsize(file) != size):
+        return 'tamaño {0} en lugar de {1}'.format(os.path.getsize(file), size)
+
+    checksum, algoritmo = esperado.get('checksum'), (esperado.get('algoritmo') or '').upper().replace('-', '')
+    if (checksum is None) or (algoritmo == ''):
+        return None
+    if algoritmo == 'CKSUM':
+        calculado = str(cksum(file))
+    elif algoritmo.lower() in hashlib.algorithms_available:
+        h = hashlib.new(algoritmo.lower())
+        with open(file, 'rb') as f:
+            for bloque in iter(lambda: f.read(2**20), b''):
+                h.update(bloque)
+        calculado = h.hexdigest()
+    else:
+        print('¡AVISO! Algoritmo de suma de control desconocido: {0}'.format(algoritmo))
+        return None
+    if calculado.lower() != checksum.strip().lower():
+        return 'suma de control {0} {1} en lugar de {2}'.format(algoritmo, calculado, checksum)
+
+    return None
+
+
+
+
+def descargarArchivo(sesiones, url, file, reintentos=5, chunk=2**20, esperado=None, cancelar=None):
+    """Descarga un archivo por bloques, sin cargarlo completo en memoria. Los datos se escriben en 'file.part'; si la descarga se interrumpe, el siguiente intento (o la siguiente ejecución) la reanuda desde el último byte recibido mediante una petición HTTP 'Range'. Sólo cuando el archivo está completo y verificado se renombra a 'file', de modo que nunca queda un archivo truncado con el nombre definitivo.
+
+    Entradas:
+    ---------
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP
+    url:        string. Dirección del archivo
+    file:       string. Ruta, nombre y extensión donde guardar el archivo
+    reintentos: int. Nº máximo de intentos de la descarga
+    chunk:      int. Tamaño (bytes) de los bloques de escritura
+    esperado:   dict o string. Tamaño y suma de control esperados (véase 'verificarArchivo'), o dirección del XML de metadatos de LP DAAC de la que leerlos. Si es 'None', sólo se comprueba el tamaño indicado por el servidor
+    cancelar:   threading.Event. Si se activa, la descarga se interrumpe en el siguiente bloque (con 'RuntimeError') y conserva su '.part'
+
+    Salidas:
+    --------
+    n:          int. Tamaño del archivo (bytes)
+    """
+
+    if (cancelar is not None) and cancelar.is_set():
+        raise RuntimeError('descarga cancelada')
+    if isinstance(esperado, str):
+        with sesiones.sesion(esperado) as sesion:
+            esperado = leerXML(peticion(sesion, esperado, reintentos=reintentos, timeout=sesiones.timeout).content)
+        esperado = esperado.get(os.path.basename(file), {})
+    esperado = {} if esperado is None else dict(esperado)
+
+    parcial = file + '.part'
+    for intento in range(reintentos):
+        inicio = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+        headers = {'Range': 'bytes={0}-'.format(inicio)} if inicio > 0 else {}
+        try:
+            with sesiones.sesion(url) as sesion:
+                with peticion(sesion, url, reintentos=reintentos, timeout=sesiones.timeout, stream=True,
+                              headers=headers) as response:
+                    if response.status_code == 206:
+                        # el servidor continúa desde 'inicio'
+                        modo = 'ab'
+                        total = int(response.headers['Content-Range'].split('/')[-1])
+                    else:
+                        # el servidor no admite 'Range': se descarga completo
+                        modo = 'wb'
+                        total = response.headers.get('Content-Length')
+                        total = None if total is None else int(total)
+                    with open(parcial, modo) as f:
+                        for bloque in response.iter_content(chunk_size=chunk):
+                            if (cancelar is not None) and cancelar.is_set():
+                                raise RuntimeError('descarga cancelada')
+                            f.write(bloque)
+            break
+        except requests.HTTPError as e:
+            # 416: el archivo parcial ya estaba completo
+            if (e.response is not None) and (e.response.status_code == 416) and (inicio > 0):
+                total = None
+                break
+            raise
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if intento == reintentos - 1:
+                raise
+            time.sleep(2 ** intento * random.uniform(.8, 1.2))
+
+    # comprobar tamaño y suma de control
+    if esperado.get('size') is None:
+        esperado['size'] = total
+    error = verificarArchivo(parcial, esperado)
+    if error is not None:
+        os.remove(parcial)
+        raise ValueError('{0}: {1}'.format(os.path.basename(file), error))
+    os.replace(parcial, file)
+
+    return os.path.getsize(file)
+
+
+
+
+def descargarArchivos(sesiones, tareas, workers=8, reintentos=5, avisos=None, cancelar=None, verbose=True):
+    """Descarga en paralelo una lista de archivos con un conjunto de hilos que comparten las sesiones HTTP. Los archivos que fallan conservan su '.part' para reanudarlos en la siguiente ejecución.
+
+    Entradas:
+    ---------
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP
+    tareas:     list of tuples. (url, file) o (url, file, esperado) de cada archivo a descargar. Véase 'descargarArchivo'
+    workers:    int. Nº de hilos de descarga
+    reintentos: int. Nº máximo de intentos de cada archivo
+    avisos:     queue.Queue. Cola en la que avisar de cada archivo terminado: (file, True) si se ha descargado, (file, False) si ha fallado. Si es 'None', no se avisa
+    cancelar:   threading.Event. Si se activa, no se empiezan más descargas y las que están en curso se interrumpen (conservan su '.part'). Las tareas canceladas no se avisan ni se cuentan como fallidas
+    verbose:    boolean. Si se quiere mostrar en pantalla el progreso
+
+    Salidas:
+    --------
+    fallidos:   list of tuples. Tareas de los archivos que no se pudieron descargar
+    """
+
+    fallidos = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(descargarArchivo, sesiones, tarea[0], tarea[1], reintentos,
+                               esperado=tarea[2] if len(tarea) > 2 else None, cancelar=cancelar): tarea
+                   for tarea in tareas}
+        for i, futuro in enumerate(as_completed(futuros)):
+            if (cancelar is not None) and cancelar.is_set():
+                for pendiente in futuros:
+                    pendiente.cancel()
+                break
+            tarea = futuros[futuro]
+            try:
+                futuro.result()
+            except Exception as e:
+                print('¡ERROR! No se pudo descargar {0}: {1}'.format(tarea[0], e))
+                fallidos.append(tarea)
+            if avisos is not None:
+                avisos.put((tarea[1], tarea not in fallidos))
+            if verbose:
+                print('Archivo {0:>4} de {1:>4}: {2}'.format(i + 1, len(tareas), os.path.basename(tarea[1])), end='\r')
+    if verbose:
+        print()
+
+    return fallidos
+
+
+
+
+def descargarUSGS(path, product, start=None, end=None, tiles=None, username=None, password=None,
+                  url='https://e4ftl01.cr.usgs.gov/', format='hdf', workers=8, porHost=4, reintentos=5, verificar=True,
+                  inventario=None, ttl=86400, sesiones=None, avisos=None, cancelar=None, verbose=True):
+    """Versión concurrente de 'descarga_MODIS': descarga los archivos de un producto MODIS del servidor de USGS en las fechas, hojas y formato indicados. Los listados de las carpetas y las descargas se reparten entre 'workers' hilos que comparten un conjunto de sesiones persistentes.
+
+    Entradas:
+    ---------
+    path:       string. Carpeta donde guardar los datos descargados. Se crea una subcarpeta por producto
+    product:    string. Producto MODIS. P.ej.: 'MOD16A2.006', 'MYD16A2.006'
+    start:      string. Fecha a partir de la que descargar datos. Formato 'YYYY-MM-DD'
+    end:        string. Fecha hasta la que descargar datos. Formato 'YYYY-MM-DD'
+    tiles:      list of strings. Hojas MODIS a descargar. Formato 'h00v00'. Si es 'None', todas
+    username:   string. Nombre de usuario en Earthdata
+    password:   string. Contraseña en Earthdata
+    url:        string. URL del servidor de datos; por defecto 'https://e4ftl01.cr.usgs.gov/'
+    format:     string. Tipo de archivo a descargar: 'hdf', 'jpg', 'xml'
+    workers:    int. Nº de hilos (y de sesiones HTTP)
+    porHost:    int. Nº máximo de peticiones simultáneas al servidor
+    reintentos: int. Nº máximo de intentos de cada petición
+    verificar:  boolean. Si se quiere comprobar el tamaño y la suma de control de cada archivo con su XML de metadatos ('.hdf.xml'). Si el sistema no dispone de la orden 'cksum', la suma se calcula con numpy, unos 15 ms por MB (véase 'cksum')
+    inventario: string, boolean o class Inventario. Base de datos con la caché de listados remotos (véase 'Inventario'). Si es 'None', 'inventario_MODIS.sqlite' dentro de 'path'; si es False, no se usa caché
+    ttl:        float. Segundos de validez de los listados guardados antes de revalidarlos. Las carpetas de fechas con más de 30 días no caducan
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP compartido con otras descargas (véase 'descargarMODIS'). Si es 'None', se crea uno de 'workers' sesiones con 'username' y 'password'
+    avisos:     queue.Queue. Cola en la que avisar del estado de cada archivo para procesarlo en cuanto esté disponible (véase 'funciones_MODIS.canalizarMODIS'): (file, None) al programar su descarga, (file, True) al terminarla o si ya existía, (file, False) si falla. Si es 'None', no se avisa
+    cancelar:   threading.Event. Si se activa, se dejan de listar carpetas y de descargar archivos. Véase 'descargarArchivos'
+    verbose:    boolean. Si se quiere mostrar en pantalla el progreso
+
+    Salidas:
+    --------
+    fallidos:   list of tuples. Tareas (url, file, esperado) de los archivos que no se pudieron descargar
+    """
+
+    # definir carpeta donde guardar los datos
+    exportpath = os.path.join(path, product.split('.')[0])
+    if os.path.isdir(exportpath) == False:
+        os.makedirs(exportpath)
+    lsdir = set(os.listdir(exportpath))
+
+    # convertir en datetime.date las fechas de inicio y fin de la búsqueda
+    start = datetime(1950, 1, 1).date() if start is None else datetime.strptime(start, '%Y-%m-%d').date()
+    end = datetime.now().date() if end is None else datetime.strptime(end, '%Y-%m-%d').date()
+
+    # las sesiones y la caché recibidas se comparten con otras descargas: sólo se cierran las creadas aquí
+    propias = []
+    if sesiones is None:
+        sesiones = Sesiones(workers, username, password, porHost=porHost)
+        propias.append(sesiones)
+    if inventario is False:
+        cache = None
+        listar = lambda u, ext='/', ttl=None: listarDirectorio(sesiones, u, ext=ext, reintentos=reintentos)
+    else:
+        if isinstance(inventario, Inventario):
+            cache = inventario
+        else:
+            cache = Inventario(os.path.join(path, INVENTARIO) if inventario in [None, True] else inventario)
+            propias.append(cache)
+        listar = lambda u, ext='/', ttl=ttl: cache.listar(sesiones, u, ext=ext, ttl=ttl, reintentos=reintentos)
+
+    try:
+        cancelado = lambda: (cancelar is not None) and cancelar.is_set()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # url del producto: directamente a partir de su misión o, si no se conoce, buscándolo en todas ellas
+            mision = misionProducto(product)
+            if mision is not None:
+                urlproduct = url + mision + '/' + product + '/'
+            else:
+                url_missions = listar(url)
+                urlproduct = None
+                for fd, url_products in zip(url_missions, pool.map(listar, url_missions)):
+                    if fd + product + '/' in url_products:
+                        urlproduct = fd + product + '/'
+                        break
+            if urlproduct is None:
+                print('¡ERROR! No se encuentra el producto {0} en {1}'.format(product, url))
+                return
+
+            # seleccionar fechas dentro del periodo de interés
+            urldates, cerradas = [], []
+            for fd in listar(urlproduct):
+                try:
+                    date = datetime.strptime(fd.split('/')[-2], '%Y.%m.%d').date()
+                except ValueError:
+                    continue
+                if (start <= date) & (end >= date):
+                    urldates.append(fd)
+                    # las carpetas de fechas pasadas ya no cambian: su listado guardado no caduca
+                    cerradas.append((datetime.now().date() - date).days > 30)
+            if verbose:
+                print('{0}: {1} fechas entre {2} y {3}'.format(product, len(urldates), start, end))
+
+            # listar en paralelo los archivos de cada fecha. Los archivos ya descargados se omiten: sólo tienen su
+            # nombre definitivo cuando están completos y verificados. Los avisos se dan en orden cronológico
+            tareas = []
+            listados = pool.map(lambda u, cerrada: [] if cancelado() else
+                                listar(u, ext='', ttl=None if cerrada else ttl), urldates, cerradas)
+            for urldate, urlfiles in zip(urldates, listados):
+                urlfiles = set(urlfiles)
+                for urlfile in sorted(urlfiles):
+                    file = urlfile.split('/')[-1]
+                    if not file.endswith('.' + format):
+                        continue
+                    if (tiles is not None) and (not any(tile in file for tile in tiles)):
+                        continue
+                    if file in lsdir:
+                        if avisos is not None:
+                            avisos.put((os.path.join(exportpath, file), None))
+                            avisos.put((os.path.join(exportpath, file), True))
+                        continue
+                    # XML de metadatos con el tamaño y la suma de control del archivo
+                    esperado = urlfile + '.xml' if verificar and (urlfile + '.xml' in urlfiles) else None
+                    tareas.append((urlfile, os.path.join(exportpath, file), esperado))
+                    if avisos is not None:
+                        avisos.put((os.path.join(exportpath, file), None))
+        if verbose:
+            print('{0}: {1} archivos por descargar'.format(product, len(tareas)))
+
+        # descargar archivos
+        fallidos = descargarArchivos(sesiones, tareas, workers=workers, reintentos=reintentos, avisos=avisos,
+                                     cancelar=cancelar, verbose=verbose)
+    finally:
+        for propia in propias:
+            propia.cerrar()
+
+    return fallidos
+
+
+
+
+def versionCMR(version):
+    """Parámetros de la consulta al CMR para una versión de producto con todas sus formas ('006', '06', '6'), como en los scripts de descarga de NSIDC.
+
+    Entradas:
+    ---------
+    version:   string. Versión del producto, p.ej. '6' o '006'
+
+    Salidas:
+    --------
+    params:    string. Parámetros 'version' de la consulta
+    """
+
+    version = str(int(version))
+    params = ''
+    for n in range(3, len(version) - 1, -1):
+        params += '&version={0}'.format(version.zfill(n))
+
+    return params
+
+
+
+
+def consultaCMR(short_name, version, start=None, end=None, bounding_box=None, polygon=None, filename_filter=None,
+                provider='NSIDC_ECS', cmr=CMR, page_size=2000):
+    """Dirección de la búsqueda de gránulos en el CMR ('Common Metadata Repository') de Earthdata, en formato UMM-G. Falta añadir el número de página ('&page_num=').
+
+    Entradas:
+    ---------
+    short_name:      string. Nombre del producto, p.ej. 'MOD10A2'
+    version:         string. Versión del producto, p.ej. '6'
+    start:           string. Fecha inicial 'YYYY-MM-DD'. Si es 'None', sin límite
+    end:             string. Fecha final 'YYYY-MM-DD'. Si es 'None', sin límite
+    bounding_box:    string. Recuadro 'W,S,E,N' en grados
+    polygon:         string. Polígono 'lon1,lat1,lon2,lat2,...' en grados. Tiene prioridad sobre 'bounding_box'
+    filename_filter: string. Patrón del nombre de los gránulos, p.ej. '*h17v04*'
+    provider:        string. Proveedor de los datos en el CMR, p.ej. 'NSIDC_ECS' o 'LPCLOUD'
+    cmr:             string. Dirección del CMR
+    page_size:       int. Nº de gránulos por página
+
+    Salidas:
+    --------
+    url:             string. Dirección de la consulta
+    """
+
+    url = ('{0}/search/granules.umm_json?provider={1}&sort_key[]=start_date&sort_key[]=producer_granule_id'
+           '&page_size={2}'.format(cmr, provider, page_size))
+    url += '&short_name={0}'.format(short_name)
+    url += versionCMR(version)
+    url += '&temporal[]={0},{1}'.format('' if start is None else start + 'T00:00:00Z',
+                                        '' if end is None else end + 'T23:59:59Z')
+    if polygon:
+        url += '&polygon={0}'.format(polygon)
+    elif bounding_box:
+        url += '&bounding_box={0}'.format(bounding_box)
+    if filename_filter:
+        url += '&producer_granule_id[]={0}&options[producer_granule_id][pattern]=true'.format(filename_filter)
+
+    return url
+
+
+
+
+def granulosUMM(pagina):
+    """Direcciones de descarga de los gránulos de una página de resultados del CMR en formato UMM-G, con su tamaño y suma de control. Se excluyen los enlaces OPeNDAP y los que no son de datos.
+
+    Entradas:
+    ---------
+    pagina:    dict. Respuesta JSON del CMR
+
+    Salidas:
+    --------
+    granulos:  list of tuples. (url, esperado) de cada archivo. Véase 'leerUMM'
+    """
+
+    granulos = []
+    for item in pagina.get('items', []):
+        umm = item.get('umm', {})
+        esperado = leerUMM(umm)
+        for enlace in umm.get('RelatedUrls', []):
+            if (enlace.get('Type') != 'GET DATA') or ('opendap' in enlace.get('URL', '').lower()):
+                continue
+            url = enlace['URL']
+            granulos.append((url, esperado.get(url.split('/')[-1])))
+
+    return granulos
+
+
+
+
+async def buscarCMR(sesiones, consulta, pool, page_size=2000, workers=4, reintentos=5):
+    """Generador asíncrono con los gránulos de una búsqueda en el CMR. La primera página indica el nº total de resultados; el resto de páginas se piden a la vez (como máximo 'workers' simultáneas) y sus gránulos se generan en el orden de las páginas (cronológico) en cuanto llega cada una, sin esperar a que termine la búsqueda.
+
+    Entradas:
+    ---------
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP
+    consulta:   string. Dirección de la búsqueda. Salida de 'consultaCMR'
+    pool:       concurrent.futures.Executor. Hilos en los que se hacen las peticiones
+    page_size:  int. Nº de gránulos por página (el mismo de 'consulta')
+    workers:    int. Nº máximo de páginas pedidas a la vez
+    reintentos: int. Nº máximo de intentos de cada petición
+
+    Salidas:
+    --------
+    Genera tuplas (url, esperado) de cada archivo, sin repetir nombres de archivo
+    """
+
+    loop = asyncio.get_running_loop()
+
+    def pagina(k):
+        url = consulta + '&page_num={0}'.format(k)
+        with sesiones.sesion(url) as sesion:
+            return peticion(sesion, url, reintentos=reintentos, timeout=sesiones.timeout).json()
+
+    semaforo = asyncio.Semaphore(workers)
+
+    async def paginaAsync(k):
+        async with semaforo:
+            return await loop.run_in_executor(pool, pagina, k)
+
+    # la primera página da el nº de resultados; el resto se lanzan a la vez antes de procesarla
+    primera = await paginaAsync(1)
+    hits = int(primera.get('hits', 0))
+    tareas = [asyncio.ensure_future(paginaAsync(k)) for k in range(2, -(-hits // page_size) + 1)]
+
+    vistos = set()
+    try:
+        for siguiente in [primera] + tareas:
+            if not isinstance(siguiente, dict):
+                siguiente = await siguiente
+            for url, esperado in granulosUMM(siguiente):
+                file = url.split('/')[-1]
+                if file not in vistos:
+                    vistos.add(file)
+                    yield url, esperado
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+
+
+
+async def canalizarCMR(sesiones, consulta, exportpath, page_size=2000, workers=8, paginas=4, tiles=None, reintentos=5,
+                       verificar=True, avisos=None, cancelar=None, verbose=True):
+    """Búsqueda y descarga encadenadas: los gránulos de cada página del CMR pasan por una cola a 'workers' tareas de descarga en cuanto llegan, de modo que las descargas empiezan antes de terminar la búsqueda.
+
+    Entradas:
+    ---------
+    sesiones:   class Sesiones. Conjunto de sesiones HTTP
+    consulta:   string. Dirección de la búsqueda. Salida de 'consultaCMR'
+    exportpath: string. Carpeta donde guardar los archivos
+    page_size:  int. Nº de gránulos por página (el mismo de 'consulta')
+    workers:    int. Nº de descargas simultáneas
+    paginas:    int. Nº máximo de páginas de la búsqueda pedidas a la vez
+    tiles:      list of strings. Hojas MODIS a descargar. Si es 'None', todas
+    reintentos: int. Nº máximo de intentos de cada petición
+    verificar:  boolean. Si se quiere comprobar el tamaño y la suma de control de los metadatos del CMR
+    avisos:     queue.Queue. Cola en la que avisar del estado de cada archivo. Véase 'descargarUSGS'
+    cancelar:   threading.Event. Si se activa, se deja de buscar y de descargar. Véase 'descargarArchivos'
+    verbose:    boolean. Si se quiere mostrar en pantalla el progreso
+
+    Salidas:
+    --------
+    fallidos:   list of tuples. Tareas (url, file, esperado) de los archivos que no se pudieron descargar
+    """
+
+    loop = asyncio.get_running_loop()
+    cancelado = lambda: (cancelar is not None) and cancelar.is_set()
+    cola = asyncio.Queue(maxsize=2 * workers)
+    lsdir = set(os.listdir(exportpath))
+    fallidos, contador = [], {'buscados': 0, 'descargados': 0}
+
+    with ThreadPoolExecutor(max_workers=workers + paginas) as pool:
+
+        async def buscar():
+            try:
+                async for url, esperado in buscarCMR(sesiones, consulta, pool, page_size, workers=paginas,
+                                                     reintentos=reintentos):
+                    if cancelado():
+                        break
+                    file = url.split('/')[-1]
+                    if (tiles is not None) and (not any(tile in file for tile in tiles)):
+                        continue
+                    if file in lsdir:
+                        if avisos is not None:
+                            avisos.put((os.path.join(exportpath, file), None))
+                            avisos.put((os.path.join(exportpath, file), True))
+                        continue
+                    contador['buscados'] += 1
+                    if avisos is not None:
+                        avisos.put((os.path.join(exportpath, file), None))
+                    await cola.put((url, os.path.join(exportpath, file), esperado if verificar else None))
+            finally:
+                for i in range(workers):
+                    await cola.put(None)
+
+        async def descargar():
+            while True:
+                tarea = await cola.get()
+                if tarea is None:
+                    break
+                if cancelado():
+                    continue
+                try:
+                    await loop.run_in_executor(pool, descargarArchivo, sesiones, tarea[0], tarea[1], reintentos,
+                                               2**20, tarea[2], cancelar)
+                except Exception as e:
+                    if cancelado():
+                        continue
+                    print('¡ERROR! No se pudo descargar {0}: {1}'.format(tarea[0], e))
+                    fallidos.append(tarea)
+                if avisos is not None:
+                    avisos.put((tarea[1], tarea not in fallidos))
+                contador['descargados'] += 1
+                if verbose:
+                    print('Archivo {0:>4} de {1:>4}: {2}'.format(contador['descargados'], contador['buscados'],
+                                                                  os.path.basename(tarea[1])), end='\r')
+
+        await asyncio.gather(buscar(), *[descargar() for i in range(workers)])
+    if verbose:
+        print()
+
+    return fallidos
+
+
+
+
+def ejecutar(corrutina):
+    """Ejecuta una corrutina hasta el final. Si ya hay un bucle 'asyncio' en marcha (p.ej. en un 'notebook' de Jupyter), se ejecuta en un hilo aparte.
+
+    Entradas:
+    ---------
+    corrutina: coroutine. Corrutina a ejecutar
+
+    Salidas:
+    --------
+    El resultado de la corrutina
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corrutina)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, corrutina).result()
+
+
+
+
+def descargarCMR(path, short_name, version, start=None, end=None, bounding_box=None, polygon=None,
+                 filename_filter=None, tiles=None, username=None, password=None, provider='NSIDC_ECS', cmr=CMR,
+                 page_size=2000, workers=8, paginas=4, porHost=4, reintentos=5, verificar=True, sesiones=None, avisos=None,
+                 cancelar=None, verbose=True):
+    """Busca en el CMR de Earthdata los gránulos de un producto y los descarga a medida que llegan los resultados (véase 'canalizarCMR'). Sustituye a 'cmr_search' y 'cmr_download' de los scripts de descarga de NSIDC.
+
+    Entradas:
+    ---------
+    path:            string. Carpeta donde guardar los datos descargados. Se crea una subcarpeta por producto
+    short_name:      string. Nombre del producto, p.ej. 'MOD10A2'
+    version:         string. Versión del producto, p.ej. '6'
+    start:           string. Fecha inicial 'YYYY-MM-DD'. Si es 'None', sin límite
+    end:             string. Fecha final 'YYYY-MM-DD'. Si es 'None', sin límite
+    bounding_box:    string. Recuadro 'W,S,E,N' en grados
+    polygon:         string. Polígono 'lon1,lat1,lon2,lat2,...' en grados
+    filename_filter: string. Patrón del nombre de los gránulos, p.ej. '*h17v04*'
+    tiles:           list of strings. Hojas MODIS a descargar. Si es 'None', todas
+    username:        string. Nombre de usuario en Earthdata
+    password:        string. Contraseña en Earthdata
+    provider:        string. Proveedor de los datos en el CMR
+    cmr:             string. Dirección del CMR
+    page_size:       int. Nº de gránulos por página de la búsqueda
+    workers:         int. Nº de descargas simultáneas
+    paginas:         int. Nº máximo de páginas de la búsqueda pedidas a la vez
+    porHost:         int. Nº máximo de peticiones simultáneas a un mismo servidor
+    reintentos:      int. Nº máximo de intentos de cada petición
+    verificar:       boolean. Si se quiere comprobar el tamaño y la suma de control de cada archivo
+    sesiones:        class Sesiones. Conjunto de sesiones HTTP compartido con otras descargas (véase 'descargarMODIS'). Si es 'None', se crea uno con 'username' y 'password'
+    avisos:          queue.Queue. Cola en la que avisar del estado de cada archivo. Véase 'canalizarCMR'
+    cancelar:        threading.Event. Si se activa, se deja de buscar y de descargar. Véase 'canalizarCMR'
+    verbose:         boolean. Si se quiere mostrar en pantalla el progreso
+
+    Salidas:
+    --------
+    fallidos:        list of tuples. Tareas (url, file, esperado) de los archivos que no se pudieron descargar
+    """
+
+    exportpath = os.path.join(path, short_name)
+    if os.path.isdir(exportpath) == False:
+        os.makedirs(exportpath)
+
+    consulta = consultaCMR(short_name, version, start=start, end=end, bounding_box=bounding_box, polygon=polygon,
+                           filename_filter=filename_filter, provider=provider, cmr=cmr, page_size=page_size)
+    if verbose:
+        print('Consulta al CMR:\n\t{0}\n'.format(consulta))
+
+    propia = sesiones is None
+    if propia:
+        sesiones = Sesiones(workers + paginas, username, password, porHost=porHost)
+    try:
+        fallidos = ejecutar(canalizarCMR(sesiones, consulta, exportpath, page_size=page_size, workers=workers,
+                                         paginas=paginas, tiles=tiles, reintentos=reintentos, verificar=verificar,
+                                         avisos=avisos, cancelar=cancelar, verbose=verbose))
+    finally:
+        if propia:
+            sesiones.cerrar()
+
+    return fallidos
+
+
+
+
+def proveedorProducto(product):
+    """Proveedor de un producto MODIS en el CMR de Earthdata.
+
+    Entradas:
+    ---------
+    product:   string. Nombre del producto, p.ej. 'MOD10A2' o 'MOD16A2.006'
+
+    Salidas:
+    --------
+    provider:  string. 'NSIDC_ECS' para los productos de nieve y hielo; 'LPDAAC_ECS' para el resto
+    """
+
+    return 'NSIDC_ECS' if product.upper().startswith(NSIDC) else 'LPDAAC_ECS'
+
+
+
+
+def credencialesEarthdata(username=None, password=None):
+    """Usuario y contraseña de Earthdata. Si no se indican, se buscan en el archivo '.netrc' del usuario ('machine urs.earthdata.nasa.gov login usuario password contraseña') y, si no están, se piden por pantalla, como en los scripts de descarga de NSIDC.
+
+    Entradas:
+    ---------
+    username:  string. Nombre de usuario en Earthdata
+    password:  string. Contraseña en Earthdata
+
+    Salidas:
+    --------
+    username:  string. Nombre de usuario en Earthdata
+    password:  string. Contraseña en Earthdata
+    """
+
+    if username is None:
+        try:
+            info = netrc.netrc().authenticators(URS)
+        except (IOError, netrc.NetrcParseError):
+            info = None
+        if info is not None:
+            username, _, password = info
+        else:
+            username = input('Usuario de Earthdata: ')
+    if password is None:
+        password = getpass.getpass('Contraseña de Earthdata para {0}: '.format(username))
+
+    return username, password
+
+
+
+
+def descargarMODIS(path, products, start=None, end=None, tiles=None, bounding_box=None, polygon=None,
+                   filename_filter=None, username=None, password=None, url='https://e4ftl01.cr.usgs.gov/', cmr=CMR,
+                   format='hdf', workers=8, paginas=4, porHost=4, paralelos=None, reintentos=5, verificar=True,
+                   inventario=None, ttl=86400, avisos=None, cancelar=None, verbose=True):
+    """Descarga uno o varios productos MODIS en un mismo proceso. Cada producto se descarga de su fuente:
+
+    * Productos de LP DAAC (MOD16A2, MOD13Q1...): listado de carpetas del servidor de USGS, con la caché de listados remotos. Véase 'descargarUSGS'
+    * Productos de NSIDC (MOD10A2, MYD10A2...) o búsquedas por 'bounding_box', 'polygon' o 'filename_filter': búsqueda de gránulos en el CMR. Véase 'descargarCMR'
+
+    Los productos se descargan en paralelo compartiendo un único conjunto de sesiones HTTP (con el límite de peticiones simultáneas por servidor), la caché de listados y la política de reintentos.
+
+    Entradas:
+    ---------
+    path:            string. Carpeta donde guardar los datos descargados. Se crea una subcarpeta por producto
+    products:        string o list. Producto(s) MODIS con su versión. P.ej.: 'MOD16A2.006', ['MOD10A2.006', 'MYD10A2.006']
+    start:           string. Fecha a partir de la que descargar datos. Formato 'YYYY-MM-DD'
+    end:             string. Fecha hasta la que descargar datos. Formato 'YYYY-MM-DD'
+    tiles:           list of strings. Hojas MODIS a descargar. Formato 'h00v00'. Si es 'None', todas
+    bounding_box:    string. Recuadro 'W,S,E,N' en grados
+    polygon:         string. Polígono 'lon1,lat1,lon2,lat2,...' en grados. Tiene prioridad sobre 'bounding_box'
+    filename_filter: string. Patrón del nombre de los gránulos, p.ej. '*h17v04*'
+    username:        string. Nombre de usuario en Earthdata. Si es 'None', véase 'credencialesEarthdata'
+    password:        string. Contraseña en Earthdata
+    url:             string. URL del servidor de datos de USGS
+    cmr:             string. Dirección del CMR
+    format:          string. Tipo de archivo a descargar del servidor de USGS: 'hdf', 'jpg', 'xml'
+    workers:         int. Nº de descargas simultáneas de cada producto
+    paginas:         int. Nº máximo de páginas de cada búsqueda en el CMR pedidas a la vez
+    porHost:         int. Nº máximo de peticiones simultáneas a un mismo servidor, sumando todos los productos
+    paralelos:       int. Nº de productos descargados a la vez. Si es 'None', todos
+    reintentos:      int. Nº máximo de intentos de cada petición
+    verificar:       boolean. Si se quiere comprobar el tamaño y la suma de control de cada archivo. En LP DAAC la suma es 'cksum': sin la orden del sistema se calcula con numpy, unos 15 ms por MB (véase 'cksum')
+    inventario:      string o boolean. Base de datos con la caché de listados remotos. Si es 'None', 'inventario_MODIS.sqlite' dentro de 'path'; si es False, no se usa caché
+    ttl:             float. Segundos de validez de los listados guardados antes de revalidarlos
+    avisos:          queue.Queue. Cola en la que avisar del estado de cada archivo de todos los productos. Véase 'descargarUSGS'
+    cancelar:        threading.Event. Si se activa, todos los productos dejan de buscar y de descargar (p.ej. cuando quien procesa los avisos se detiene)
+    verbose:         boolean. Si se quiere mostrar en pantalla el progreso
+
+    Salidas:
+    --------
+    fallidos:        dict. Para cada producto, tareas (url, file, esperado) de los archivos que no se pudieron descargar. 'None' si la descarga del producto falló por completo
+    """
+
+    if isinstance(products, str):
+        products = [products]
+    if os.path.isdir(path) == False:
+        os.makedirs(path)
+    username, password = credencialesEarthdata(username, password)
+
+    # sesiones y caché comunes a todos los productos
+    sesiones = Sesiones(workers + paginas, username, password, porHost=porHost)
+    cache = False if inventario is False else Inventario(os.path.join(path, INVENTARIO)
+                                                         if inventario in [None, True] else inventario)
+
+    def descargar(product):
+        short_name, version = (product.split('.') + ['006'])[:2]
+        provider = proveedorProducto(short_name)
+        if (provider == 'NSIDC_ECS') or bounding_box or polygon or filename_filter:
+            return descargarCMR(path, short_name, version, start=start, end=end, bounding_box=bounding_box,
+                                polygon=polygon, filename_filter=filename_filter, tiles=tiles, provider=provider,
+                                cmr=cmr, workers=workers, paginas=paginas, reintentos=reintentos, verificar=verificar,
+                                sesiones=sesiones, avisos=avisos, cancelar=cancelar, verbose=verbose)
+        else:
+            return descargarUSGS(path, short_name + '.' + version, start=start, end=end, tiles=tiles, url=url,
+                                 format=format, workers=workers, reintentos=reintentos, verificar=verificar,
+                                 inventario=cache, ttl=ttl, sesiones=sesiones, avisos=avisos, cancelar=cancelar,
+                                 verbose=verbose)
+
+    fallidos = {}
+    try:
+        with ThreadPoolExecutor(max_workers=paralelos or len(products)) as pool:
+            futuros = {pool.submit(descargar, product): product for product in products}
+            for futuro in as_completed(futuros):
+                product = futuros[futuro]
+                try:
+                    fallidos[product] = futuro.result()
+                except Exception as e:
+                    print('¡ERROR! No se pudo descargar el producto {0}: {1}'.format(product, e))
+                    fallidos[product] = None
+                if verbose:
+                    print('{0}: descarga terminada'.format(product))
+    finally:
+        sesiones.cerrar()
+        if cache is not False:
+            cache.cerrar()
+
+    return fallidos
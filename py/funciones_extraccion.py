@@ -0,0 +1,1049 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Funciones comunes a las diferentes versiones de 'MODIS_extract' (en 'funciones_MODIS.py' y 'class_MODIS.py'): selección de archivos, atributos de las hojas y lectura de los 'hdf' en un 'array' 3D (tiempo, Y, X) reservado de antemano.
+#
+# ***
+# INDICE
+# ------
+# seleccionarArchivos
+# leerODL
+# structMetadata
+# hdfAttrs
+# atributosHojas
+# atributosIndices
+# Mosaico
+# codificacionVariable
+# decodificar
+# leerHDF
+# leerHojas
+# precargar
+# recortarMosaico
+# prepararExtraccion
+# extraerMODIS
+# iterarMODIS
+# Ensamblador
+
+
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Full
+from threading import Thread, Event
+from netCDF4 import Dataset, default_fillvals
+
+from funciones_catalogo import Catalogo, analizarNombre
+from funciones_QC import reglaQC, mascaraQC
+
+# malla sinusoidal de MODIS: tamaño de las hojas y esquina superior izquierda de la hoja h00v00
+TILESIZE = 1111950.519667
+XOMALLA = -20015109.354
+YFMALLA = 10007554.677
+
+
+
+
+def seleccionarArchivos(path, product, tiles, dateslim=None, catalogo=None):
+    """Selecciona los archivos 'hdf' de un producto para las hojas y fechas indicadas a partir del catálogo de la carpeta (véase 'funciones_catalogo.py'), que se actualiza antes de la consulta.
+
+    Entradas:
+    ---------
+    path:      string. Carpeta donde se encuentran los archivos del producto
+    product:   string. Nombre del producto MODIS, p.ej. MOD16A2
+    tiles:     list. Hojas del producto MODIS a tratar
+    dateslim:  list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', se seleccionan todas las fechas disponibles
+    catalogo:  class Catalogo. Catálogo ya abierto de la carpeta. Si es 'None', se abre (y se cierra) el de 'path'
+
+    Salidas:
+    --------
+    files:     dict. Para cada hoja, diccionario {fecha: ruta del archivo}
+    """
+
+    start, end = (None, None) if dateslim is None else dateslim
+
+    cerrar = catalogo is None
+    if cerrar:
+        catalogo = Catalogo(path)
+    catalogo.actualizar()
+    files = catalogo.archivos(product, tiles, start=start, end=end)
+    if cerrar:
+        catalogo.cerrar()
+
+    return files
+
+
+
+
+def leerODL(texto):
+    """Interpreta un texto en formato ODL ('Object Description Language'), como el atributo 'StructMetadata.0' de los 'hdf' de MODIS.
+
+    Entradas:
+    ---------
+    texto:     string. Texto ODL
+
+    Salidas:
+    --------
+    odl:       dict. Diccionario anidado: cada GROUP u OBJECT es un diccionario dentro de su grupo padre; cada par clave=valor es un elemento del diccionario. Los valores se convierten a int, float, string o tuple según corresponda
+    """
+
+    def valor(v):
+        v = v.strip()
+        if v.startswith('(') and v.endswith(')'):
+            return tuple(valor(x) for x in re.findall(r'"[^"]*"|[^,]+', v[1:-1]))
+        if v.startswith('"') and v.endswith('"'):
+            return v[1:-1]
+        for tipo in [int, float]:
+            try:
+                return tipo(v)
+            except ValueError:
+                pass
+        return v
+
+    odl = {}
+    pila = [odl]
+    clave, acumulado = None, ''
+    for linea in texto.replace('\x00', '').split('\n'):
+        linea = linea.strip()
+        if (linea == '') | (linea == 'END'):
+            continue
+        # continuación de un valor repartido en varias líneas
+        if clave is not None:
+            acumulado += linea
+            if acumulado.count('(') == acumulado.count(')'):
+                pila[-1][clave] = valor(acumulado)
+                clave = None
+            continue
+        k, _, v = linea.partition('=')
+        k, v = k.strip(), v.strip()
+        if k in ['GROUP', 'OBJECT']:
+            grupo = {}
+            pila[-1][v] = grupo
+            pila.append(grupo)
+        elif k in ['END_GROUP', 'END_OBJECT']:
+            pila.pop()
+        elif v.count('(') != v.count(')'):
+            clave, acumulado = k, v
+        else:
+            pila[-1][k] = valor(v)
+
+    return odl
+
+
+
+
+def structMetadata(file):
+    """Extrae la geometría de las mallas ('grids') de un archivo 'hdf' de MODIS a partir de su atributo 'StructMetadata.0'.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+
+    Salidas:
+    --------
+    grids:     dict. Para cada malla, diccionario con 'ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo', 'projection', 'projParams', 'sphereCode', 'gridOrigin' y 'fields' (para cada variable, su tipo de dato y dimensiones)
+    """
+
+    # cargar archivo 'hdf'
+    f = Dataset(file, format='hdf4')
+    # unir las partes del atributo ('StructMetadata.0', 'StructMetadata.1'...)
+    texto = ''.join(getattr(f, attr) for attr in sorted(f.ncattrs()) if attr.startswith('StructMetadata'))
+    f.close()
+    odl = leerODL(texto)
+
+    grids = {}
+    for grid in odl.get('GridStructure', {}).values():
+        if not isinstance(grid, dict):
+            continue
+        Xo, Yf = grid['UpperLeftPointMtrs']
+        Xf, Yo = grid['LowerRightMtrs']
+        fields = {}
+        for field in grid.get('DataField', {}).values():
+            if isinstance(field, dict):
+                fields[field['DataFieldName']] = {'dataType': field.get('DataType'),
+                                                  'dimList': list(field.get('DimList', ()))}
+        grids[grid['GridName']] = {'ncols': grid['XDim'], 'nrows': grid['YDim'],
+                                   'Xo': Xo, 'Yf': Yf, 'Xf': Xf, 'Yo': Yo,
+                                   'projection': grid.get('Projection'),
+                                   'projParams': list(grid.get('ProjParams', ())),
+                                   'sphereCode': grid.get('SphereCode'),
+                                   'gridOrigin': grid.get('GridOrigin'),
+                                   'fields': fields}
+
+    return grids
+
+
+
+
+def hdfAttrs(file, var=None):
+    """Extrae los atributos de los archivos 'hdf' de MODIS
+
+    Parámetros:
+    -----------
+    file:      string. Ruta, nombre y extensión del archivo
+    var:       string. Variable de interés. Si el archivo tiene varias mallas, se toma la que contiene la variable. Si es 'None', la primera malla
+
+    Salidas:
+    --------
+    ncols, nrows, Xtopleft, Ytopleft, Xbottomright, Ybottomright"""
+
+    grids = structMetadata(file)
+    grid = next(iter(grids.values()))
+    if var is not None:
+        for g in grids.values():
+            if var in g['fields']:
+                grid = g
+                break
+
+    return grid['ncols'], grid['nrows'], grid['Xo'], grid['Yf'], grid['Xf'], grid['Yo']
+
+
+
+
+def atributosHojas(files, tiles, product=None, var=None, catalogo=None):
+    """Genera la tabla de atributos de cada hoja a partir del primer archivo disponible de cada una. Los atributos de las hojas sin archivos se calculan a partir de su índice h/v.
+
+    La geometría de una hoja de un producto no cambia, así que si se indica un catálogo los atributos se guardan en él la primera vez y en adelante se leen de ahí sin abrir ningún archivo.
+
+    Entradas:
+    ---------
+    files:     dict. Para cada hoja, diccionario {fecha: ruta del archivo}. Salida de 'seleccionarArchivos'
+    tiles:     list. Hojas del producto MODIS a tratar
+    product:   string. Nombre del producto MODIS. Necesario si se usa 'catalogo'
+    var:       string. Variable de interés. Véase 'hdfAttrs'
+    catalogo:  class Catalogo. Catálogo en el que guardar los atributos. Si es 'None', se leen siempre de los archivos
+
+    Salidas:
+    --------
+    attributes: pd.DataFrame. Atributos de cada hoja: 'ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'
+    """
+
+    # extraer atributos para cada hoja
+    attributes = pd.DataFrame(index=tiles, columns=['ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'])
+    for tile in tiles:
+        attrs = None
+        if catalogo is not None:
+            attrs = catalogo.leerAtributos(product, tile, var)
+        if (attrs is None) & (len(files[tile]) > 0):
+            attrs = hdfAttrs(next(iter(files[tile].values())), var)
+            if catalogo is not None:
+                catalogo.guardarAtributos(product, tile, var, attrs)
+        if attrs is not None:
+            attributes.loc[tile,:] = attrs
+    attributes = attributes.astype(float)
+
+    # hojas sin archivos
+    vacias = attributes.ncols.isnull()
+    if vacias.any():
+        nc, nr = attributes.loc[~vacias, ['ncols', 'nrows']].iloc[0]
+        attributes.loc[vacias,:] = atributosIndices(attributes.index[vacias], nc, nr).values
+
+    return attributes
+
+
+
+
+def atributosIndices(tiles, ncols, nrows):
+    """Calcula los atributos de las hojas a partir de su índice h/v en la malla sinusoidal de MODIS.
+
+    Entradas:
+    ---------
+    tiles:     list. Hojas en formato 'h00v00'
+    ncols:     int. Nº de columnas de cada hoja (p.ej. 2400 para los productos de 500 m)
+    nrows:     int. Nº de filas de cada hoja
+
+    Salidas:
+    --------
+    attributes: pd.DataFrame. Atributos de cada hoja: 'ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'
+    """
+
+    attributes = pd.DataFrame(index=tiles, columns=['ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'], dtype=float)
+    for tile in tiles:
+        h, v = int(tile[1:3]), int(tile[4:6])
+        Xo = XOMALLA + h * TILESIZE
+        Yf = YFMALLA - v * TILESIZE
+        attributes.loc[tile,:] = [ncols, nrows, Xo, Yf, Xo + TILESIZE, Yf - TILESIZE]
+
+    return attributes
+
+
+
+
+class Mosaico:
+    def __init__(self, attributes):
+        """Malla total formada por un conjunto cualquiera de hojas MODIS. Cada hoja se coloca en la posición (fila, columna) que le corresponde según sus esquinas; las celdas no cubiertas por ninguna hoja quedan como NaN.
+
+        Entradas:
+        ---------
+        attributes: pd.DataFrame. Atributos de cada hoja: 'ncols', 'nrows', 'Xo', 'Yf', 'Xf', 'Yo'. Salida de 'atributosHojas' o 'atributosIndices'
+        """
+
+        self.attributes = attributes
+
+        # extensión total
+        self.Xo = np.min(attributes.Xo)
+        self.Yf = np.max(attributes.Yf)
+        self.Xf = np.max(attributes.Xf)
+        self.Yo = np.min(attributes.Yo)
+        # nº total de columnas y filas
+        self.colsize = np.mean((attributes.Xf - attributes.Xo) / attributes.ncols)
+        self.ncols = int(round((self.Xf - self.Xo) / self.colsize, 0))
+        self.rowsize = np.mean((attributes.Yf - attributes.Yo) / attributes.nrows)
+        self.nrows = int(round((self.Yf - self.Yo) / self.rowsize, 0))
+
+        # coordenadas x de las celdas
+        self.X = np.linspace(self.Xo, self.Xf, self.ncols)
+        # coordenadas y de las celdas
+        self.Y = np.linspace(self.Yf, self.Yo, self.nrows)
+
+        # fila y columna de la esquina superior izquierda de cada hoja
+        self.posiciones = {}
+        for tile in attributes.index:
+            nc, nr, xo, yf, xf, yo = attributes.loc[tile, :]
+            self.posiciones[tile] = (int(round((self.Yf - yf) / self.rowsize, 0)),
+                                     int(round((xo - self.Xo) / self.colsize, 0)))
+
+
+    def ventanas(self, rows=None, cols=None):
+        """Convierte un rango de filas y columnas de la malla total en la ventana a leer de cada hoja.
+
+        Entradas:
+        ---------
+        rows:      tuple. Fila inicial y final (no incluida) de la malla total. Si es 'None', todas las filas
+        cols:      tuple. Columna inicial y final (no incluida) de la malla total. Si es 'None', todas las columnas
+
+        Salidas:
+        --------
+        ventanas:  dict. Para cada hoja, ventana (fila inicial, fila final, columna inicial, columna final) en las coordenadas de la propia hoja. Es 'None' si la hoja no interseca con el rango
+        """
+
+        rows = (0, self.nrows) if rows is None else rows
+        cols = (0, self.ncols) if cols is None else cols
+
+        ventanas = {}
+        for tile, (r0, c0) in self.posiciones.items():
+            nr, nc = int(self.attributes.nrows[tile]), int(self.attributes.ncols[tile])
+            # intersección con el rango
+            ri, rf = max(rows[0], r0), min(rows[1], r0 + nr)
+            ci, cf = max(cols[0], c0), min(cols[1], c0 + nc)
+            if (ri >= rf) | (ci >= cf):
+                ventanas[tile] = None
+            else:
+                ventanas[tile] = (ri - r0, rf - r0, ci - c0, cf - c0)
+
+        return ventanas
+
+
+    def colocar(self, lienzo, tile, mapa, ventana, rows=None, cols=None):
+        """Copia el mapa de una hoja (o de su ventana) en su posición del lienzo.
+
+        Entradas:
+        ---------
+        lienzo:    array (..., Y, X). Array de la malla total (o del rango 'rows', 'cols' de ella) sobre el que escribir
+        tile:      string. Hoja a la que corresponde 'mapa'
+        mapa:      array (..., y, x). Datos de la ventana de la hoja
+        ventana:   tuple. Ventana de la hoja a la que corresponde 'mapa'. Salida de 'ventanas'
+        rows:      tuple. Fila inicial y final de la malla total que abarca 'lienzo'. Si es 'None', todas las filas
+        cols:      tuple. Columna inicial y final de la malla total que abarca 'lienzo'. Si es 'None', todas las columnas
+        """
+
+        rows = (0, self.nrows) if rows is None else rows
+        cols = (0, self.ncols) if cols is None else cols
+        r0, c0 = self.posiciones[tile]
+        ri, rf, ci, cf = ventana
+        lienzo[..., r0 + ri - rows[0]:r0 + rf - rows[0], c0 + ci - cols[0]:c0 + cf - cols[0]] = mapa
+
+
+    def ensamblar(self, mapas, rows=None, cols=None):
+        """Genera el mosaico a partir de los mapas completos de cada hoja.
+
+        Entradas:
+        ---------
+        mapas:     dict. Para cada hoja, array (Y, X) o (times, Y, X) con sus datos. Las hojas que falten quedan como NaN
+        rows:      tuple. Fila inicial y final (no incluida) de la malla total a ensamblar. Si es 'None', todas las filas
+        cols:      tuple. Columna inicial y final (no incluida) de la malla total a ensamblar. Si es 'None', todas las columnas
+
+        Salidas:
+        --------
+        lienzo:    array (Y, X) o (times, Y, X). Mosaico de las hojas
+        """
+
+        rows = (0, self.nrows) if rows is None else rows
+        cols = (0, self.ncols) if cols is None else cols
+        ventanas = self.ventanas(rows, cols)
+
+        lead = next(iter(mapas.values())).shape[:-2]
+        lienzo = np.full((*lead, rows[1] - rows[0], cols[1] - cols[0]), np.nan)
+        for tile, mapa in mapas.items():
+            if ventanas[tile] is None:
+                continue
+            ri, rf, ci, cf = ventanas[tile]
+            self.colocar(lienzo, tile, mapa[..., ri:rf, ci:cf], ventanas[tile], rows, cols)
+
+        return lienzo
+
+
+
+
+def codificacionVariable(file, var):
+    """Extrae el tipo de dato y los atributos de codificación (factor de escala, desplazamiento, valores nulos y rango válido) de una variable de un archivo 'hdf' de MODIS.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+    var:       string. Variable de interés dentro del archivo 'hdf'
+
+    Salidas:
+    --------
+    codificacion: dict. 'dtype', 'scale_factor', 'add_offset', '_FillValue', 'missing_value' y 'valid_range' de la variable
+    """
+
+    hdf = Dataset(file, format='hdf4')
+    variable = hdf[var]
+    attrs = {attr: variable.getncattr(attr) for attr in variable.ncattrs()}
+    dtype = variable.dtype
+    hdf.close()
+
+    # rango válido
+    validRange = attrs.get('valid_range')
+    if (validRange is None) & (('valid_min' in attrs) | ('valid_max' in attrs)):
+        validRange = (attrs.get('valid_min', -np.inf), attrs.get('valid_max', np.inf))
+    # valor nulo. Si no está definido, el valor por defecto de netCDF para el tipo de dato
+    fillValue = attrs.get('_FillValue', default_fillvals.get(dtype.str[1:]))
+
+    codificacion = {'dtype': dtype,
+                    'scale_factor': attrs.get('scale_factor', 1.),
+                    'add_offset': attrs.get('add_offset', 0.),
+                    '_FillValue': fillValue,
+                    'missing_value': attrs.get('missing_value'),
+                    'valid_range': validRange}
+
+    return codificacion
+
+
+
+
+def decodificar(raw, codificacion, factor=None, dtype=np.float32):
+    """Convierte los valores enteros originales de una variable MODIS en valores reales: se aplican el factor de escala y el desplazamiento, y los valores nulos o fuera del rango válido se convierten en NaN.
+
+    Entradas:
+    ---------
+    raw:          array. Valores originales (p.ej. int16 o uint8)
+    codificacion: dict. Atributos de codificación de la variable. Salida de 'codificacionVariable'
+    factor:       float. Factor adicional con el que multiplicar los datos
+    dtype:        numpy.dtype. Tipo de dato del resultado
+
+    Salidas:
+    --------
+    data:         array. Valores decodificados, del mismo tamaño que 'raw'
+    """
+
+    raw = np.asarray(raw)
+
+    # máscara de valores nulos
+    mask = np.zeros(raw.shape, dtype=bool)
+    if codificacion['_FillValue'] is not None:
+        mask |= raw == codificacion['_FillValue']
+    if codificacion['missing_value'] is not None:
+        mask |= np.isin(raw, np.atleast_1d(codificacion['missing_value']))
+    if codificacion['valid_range'] is not None:
+        vmin, vmax = codificacion['valid_range']
+        mask |= (raw < vmin) | (raw > vmax)
+
+    # escala y desplazamiento
+    data = raw.astype(dtype)
+    if codificacion['scale_factor'] != 1:
+        data *= dtype(codificacion['scale_factor'])
+    if codificacion['add_offset'] != 0:
+        data += dtype(codificacion['add_offset'])
+    if factor is not None:
+        data *= dtype(factor)
+    data[mask] = np.nan
+
+    return data
+
+
+
+
+def leerHDF(file, var, ventana=None, nativo=False, calidad=None):
+    """Lee una o varias variables de un archivo 'hdf' de MODIS. Las celdas enmascaradas se convierten en NaN.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+    var:       string o list. Variable (o lista de variables) de interés dentro del archivo 'hdf'. Con una lista, el archivo se abre una única vez para todas ellas
+    ventana:   tuple. Filas y columnas (fila inicial, fila final, columna inicial, columna final) a leer. Si es 'None', se lee la hoja completa
+    nativo:    boolean. Si es True, se devuelven los valores originales en su tipo de dato (sin aplicar la escala ni convertir los nulos en NaN)
+    calidad:   dict. Para cada variable, tupla (capa de calidad, tabla de consulta) con la que enmascarar las celdas no válidas. Véase 'funciones_QC.reglaQC'. Si es 'None', no se aplica
+
+    Salidas:
+    --------
+    tmp:       array (Y, X). Mapa de la variable. Si 'var' es una lista, lista con el mapa de cada variable
+    """
+
+    variables = [var] if isinstance(var, str) else var
+    if ventana is None:
+        ventana = (None, None, None, None)
+    r0, r1, c0, c1 = ventana
+
+    # cargar archivo 'hdf'
+    hdf = Dataset(file, format='hdf4')
+    mapas, validas = [], {}
+    for v in variables:
+        if nativo:
+            hdf[v].set_auto_maskandscale(False)
+        # extraer datos de la variable (sólo la ventana indicada)
+        tmp = hdf[v][r0:r1, c0:c1]
+        if not nativo:
+            tmp = np.ma.filled(tmp.astype(float), np.nan)
+        # enmascarar las celdas que no cumplen la regla de calidad
+        if (calidad is not None) and (calidad.get(v) is not None):
+            capa, tabla = calidad[v]
+            if capa not in validas:
+                hdf[capa].set_auto_maskandscale(False)
+                validas[capa] = mascaraQC(hdf[capa][r0:r1, c0:c1], tabla)
+                hdf[capa].set_auto_maskandscale(not nativo)
+            if nativo:
+                tmp[~validas[capa]] = getattr(hdf[v], '_FillValue', default_fillvals.get(tmp.dtype.str[1:]))
+            else:
+                tmp[~validas[capa]] = np.nan
+        mapas.append(tmp)
+    hdf.close()
+
+    if isinstance(var, str):
+        return mapas[0]
+    return mapas
+
+
+
+
+def leerHojas(files, var, ventanas=None, workers=None, nativo=False, calidad=None):
+    """Generador que lee una serie de archivos 'hdf' y devuelve sus mapas en el mismo orden de 'files'.
+
+    Si se indica 'workers', los archivos se leen en un conjunto de procesos. Para limitar la memoria, sólo hay en curso 2 * 'workers' lecturas a la vez.
+
+    Entradas:
+    ---------
+    files:     list. Rutas de los archivos 'hdf'
+    var:       string o list. Variable (o lista de variables) de interés dentro de los archivos 'hdf'. Véase 'leerHDF'
+    ventanas:  list. Ventana (fila inicial, fila final, columna inicial, columna final) a leer de cada archivo. Si es 'None', se leen las hojas completas
+    workers:   int. Nº de procesos. Si es 'None' o 1, los archivos se leen en serie
+    nativo:    boolean. Si se quieren los valores originales en su tipo de dato. Véase 'leerHDF'
+    calidad:   dict. Capa de calidad y tabla de consulta de cada variable. Véase 'leerHDF'
+
+    Salidas:
+    --------
+    Genera un array (Y, X) por archivo, o una lista de ellos si 'var' es una lista
+    """
+
+    if ventanas is None:
+        ventanas = [None] * len(files)
+
+    if (workers is None) or (workers <= 1):
+        for file, ventana in zip(files, ventanas):
+            yield leerHDF(file, var, ventana, nativo, calidad)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pendientes = deque()
+        for file, ventana in zip(files, ventanas):
+            pendientes.append(pool.submit(leerHDF, file, var, ventana, nativo, calidad))
+            if len(pendientes) >= 2 * workers:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+
+
+
+def precargar(generador, n=1):
+    """Recorre un generador en un hilo en segundo plano, manteniendo preparados hasta 'n' elementos por delante del consumidor. Así la lectura de los siguientes archivos se solapa con el cálculo sobre el elemento actual, con una memoria acotada a 'n' elementos.
+
+    Entradas:
+    ---------
+    generador: iterable. Elementos a recorrer
+    n:         int. Nº máximo de elementos precargados. Si es 0 o 'None', se recorre el generador sin hilo
+
+    Salidas:
+    --------
+    Genera los mismos elementos que 'generador', en el mismo orden
+    """
+
+    if not n:
+        yield from generador
+        return
+
+    cola = Queue(maxsize=n)
+    fin = object()
+    parar = Event()
+
+    def poner(elemento):
+        # esperar a que haya hueco en la cola, salvo que el consumidor haya terminado
+        while not parar.is_set():
+            try:
+                cola.put(elemento, timeout=.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def productor():
+        try:
+            for elemento in generador:
+                if not poner(elemento):
+                    return
+            poner(fin)
+        except Exception as error:
+            poner(error)
+        finally:
+            # liberar los recursos del generador (p.ej. procesos de lectura y archivos abiertos)
+            if hasattr(generador, 'close'):
+                generador.close()
+
+    hilo = Thread(target=productor, daemon=True)
+    hilo.start()
+    try:
+        while True:
+            elemento = cola.get()
+            if elemento is fin:
+                break
+            if isinstance(elemento, Exception):
+                raise elemento
+            yield elemento
+    finally:
+        parar.set()
+
+
+
+
+def recortarMosaico(mosaico, extent=None, verbose=False):
+    """Filas, columnas y coordenadas de la malla total dentro de una extensión y ventana a leer de cada hoja.
+
+    Entradas:
+    ---------
+    mosaico:    class Mosaico. Malla total de las hojas
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', todas las hojas completas
+    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+
+    Salidas:
+    --------
+    Xmodis:     array (X,). Coordenadas X de las columnas del recorte
+    Ymodis:     array (Y,). Coordenadas Y de las filas del recorte
+    rows:       tuple. Filas (inicial, final) del recorte dentro de la malla total
+    cols:       tuple. Columnas (inicial, final) del recorte dentro de la malla total
+    ventanas:   dict. Ventana a leer de cada hoja ('None' si la hoja no interseca con el recorte)
+    """
+
+    Xmodis, Ymodis = mosaico.X, mosaico.Y
+    if extent is not None:
+        if verbose:
+            print('Crear máscaras')
+
+        # crear máscara según la extensión
+        left, right, bottom, top =  extent
+        maskCols = (Xmodis >= left) & (Xmodis <= right)
+        maskRows = (Ymodis >= bottom) & (Ymodis <= top)
+
+        if (not maskCols.any()) | (not maskRows.any()):
+            print('¡ERROR! La extensión no interseca con las hojas')
+            return
+        # rango de filas y columnas de la malla total dentro de la extensión
+        rows = (np.argmax(maskRows), len(maskRows) - np.argmax(maskRows[::-1]))
+        cols = (np.argmax(maskCols), len(maskCols) - np.argmax(maskCols[::-1]))
+
+        # recortar coordenadas
+        Xmodis = Xmodis[maskCols]
+        Ymodis = Ymodis[maskRows]
+
+        if verbose:
+            print('dimensión:\t\t({0:>4}, {1:>4})'.format(len(Ymodis), len(Xmodis)))
+            print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.min(), Ymodis.min()))
+            print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(Xmodis.max(), Ymodis.max()),
+                  end='\n\n')
+    else:
+        rows, cols = (0, mosaico.nrows), (0, mosaico.ncols)
+    # ventana a leer de cada hoja
+    ventanas = mosaico.ventanas(rows, cols)
+
+    return Xmodis, Ymodis, rows, cols, ventanas
+
+
+
+
+def prepararExtraccion(path, product, var, tiles, dateslim=None, extent=None, verbose=True):
+    """Selecciona los archivos de un producto y calcula, sin leer ningún dato, la malla total de las hojas, las coordenadas recortadas a 'extent' y la ventana a leer de cada hoja. Es el paso común a 'extraerMODIS' e 'iterarMODIS'.
+
+    Entradas:
+    ---------
+    path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
+    product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+    var:        string. Variable de interés dentro de los archivos 'hdf'
+    tiles:      list. Hojas del producto MODIS a tratar
+    dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', todas las fechas disponibles
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', todas las hojas completas
+    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+
+    Salidas:
+    --------
+    files:      dict. Para cada hoja, diccionario {fecha: ruta del archivo}
+    dates:      array (dates,). Fechas disponibles
+    mosaico:    class Mosaico. Malla total de las hojas
+    Xmodis:     array (X,). Coordenadas X de las columnas del recorte
+    Ymodis:     array (Y,). Coordenadas Y de las filas del recorte
+    rows:       tuple. Filas (inicial, final) del recorte dentro de la malla total
+    cols:       tuple. Columnas (inicial, final) del recorte dentro de la malla total
+    ventanas:   dict. Ventana a leer de cada hoja ('None' si la hoja no interseca con el recorte)
+    """
+
+    pathProduct = os.path.join(path, product)
+    if os.path.exists(pathProduct) is False:
+        os.makedirs(pathProduct)
+
+    # SELECCIÓN DE ARCHIVOS
+    # ---------------------
+    catalogo = Catalogo(pathProduct)
+    files = seleccionarArchivos(pathProduct, product, tiles, dateslim=dateslim, catalogo=catalogo)
+    dates = np.sort(np.unique(np.array([date for tile in tiles for date in files[tile]])))
+    if len(dates) == 0:
+        print('¡ERROR! No hay archivos para el producto, hojas y fechas indicados')
+        catalogo.cerrar()
+        return
+    # comprobar que el número de archivos es igual en todas las hojas
+    if len(set([len(files[tile]) for tile in tiles])) > 1:
+        print('¡AVISO! Diferente número de fechas en las diferentes hojas. Las hojas sin archivo se rellenan con NaN')
+    if verbose:
+        print('Seleccionar archivos')
+        print('nº de archivos (fechas): {0:>3}'.format(len(dates)), end='\n\n')
+
+    # ATRIBUTOS MODIS
+    # ---------------
+    if verbose:
+        print('Generar atributos globales')
+    mosaico = Mosaico(atributosHojas(files, tiles, product=product, var=var, catalogo=catalogo))
+    catalogo.cerrar()
+    if verbose:
+        print('dimensión:\t\t({0:}, {1:})'.format(mosaico.ncols, mosaico.nrows))
+        print('esquina inf. izqda.:\t({0:>10.2f}, {1:>10.2f})'.format(mosaico.Xo, mosaico.Yo))
+        print('esquina sup. dcha.:\t({0:>10.2f}, {1:>10.2f})'.format(mosaico.Xf, mosaico.Yf), end='\n\n')
+
+    # CREAR MÁSCARAS
+    # --------------
+    recorte = recortarMosaico(mosaico, extent, verbose=verbose)
+    if recorte is None:
+        return
+    Xmodis, Ymodis, rows, cols, ventanas = recorte
+
+    return files, dates, mosaico, Xmodis, Ymodis, rows, cols, ventanas
+
+
+
+
+def extraerMODIS(path, product, var, tiles, factor=None, dateslim=None, extent=None, out=None, workers=None,
+                 nativo=False, qc=None, verbose=True):
+    """Extrae los datos de MODIS para un producto, variable y fechas dadas y los recorta a la extensión de la zona de estudio.
+
+    Las dimensiones del resultado se calculan antes de leer ningún dato a partir de los archivos seleccionados y de los atributos de las hojas, de modo que cada fecha se escribe directamente en su posición de un 'array' (tiempo, Y, X) reservado de antemano. De cada hoja sólo se leen las filas y columnas dentro de 'extent'; las hojas que no intersecan con 'extent' no se abren.
+
+    Entradas:
+    ---------
+    path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
+    product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+    var:        string o list. Variable de interés dentro de los archivos 'hdf'. Si es una lista (p.ej. ['Lai_500m', 'Fpar_500m', 'FparLai_QC']), cada archivo se abre una única vez y se obtiene un 'array' por variable; todas las variables han de compartir la malla de la primera
+    tiles:      list. Hojas del producto MODIS a tratar
+    factor:     float o dict. Factor con el que multiplicar los datos para obtener su valor real (comprobar en la página de MODIS para el producto y variable de interés). Con varias variables, diccionario {var: factor}; las variables que no estén en él no se multiplican
+    dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', se extraen los datos para todas las fechas disponibles
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', se extraen todos los datos
+    out:        array (dates, Y, X). 'Array' (p.ej. un np.memmap) en el que escribir los datos. Con varias variables, diccionario {var: array}. Si es 'None', se crea uno nuevo en memoria
+    workers:    int. Nº de procesos con los que leer los archivos 'hdf' en paralelo. Si es 'None', se leen en serie
+    nativo:     boolean. Si es True, 'data' conserva el tipo de dato original de la variable (p.ej. int16) sin aplicar la escala ni 'factor'; las celdas sin datos toman el valor '_FillValue'. Los datos se decodifican después con 'decodificar' y 'codificacion'
+    qc:         boolean o dict. Si es True, se eliminan las celdas que no cumplen la regla de calidad por defecto del producto (véase 'funciones_QC.CALIDAD'). Un diccionario {campo: valores admitidos} sustituye a la regla por defecto. La capa de calidad se lee en la misma pasada que los datos
+    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+
+    Salidas:
+    --------
+    data:         array (dates, Y, X). Mapas de la variable de interés. Si 'var' es una lista, diccionario {var: array}
+    Xmodis:       array (X,). Coordenadas X de las columnas de 'data'
+    Ymodis:       array (Y,). Coordenadas Y de las filas de 'data'
+    dates:        array (dates,). Fechas a las que corresponde cada uno de los mapas de 'data'
+    codificacion: dict. Atributos de codificación de la variable (véase 'codificacionVariable'), incluido 'factor'. Si 'var' es una lista, diccionario {var: codificacion}. 'None' si 'nativo' es False
+    """
+
+    variables = [var] if isinstance(var, str) else list(var)
+    factores = factor if isinstance(factor, dict) else {v: factor for v in variables}
+    if not isinstance(out, dict):
+        out = {variables[0]: out}
+    calidad = None if not qc else {v: reglaQC(product, v, qc) for v in variables}
+
+    preparacion = prepararExtraccion(path, product, variables[0], tiles, dateslim=dateslim, extent=extent, verbose=verbose)
+    if preparacion is None:
+        return
+    files, dates, mosaico, Xmodis, Ymodis, rows, cols, ventanas = preparacion
+
+    # RESERVAR MEMORIA
+    # ----------------
+    shape = (len(dates), len(Ymodis), len(Xmodis))
+    data, codificacion = {}, {}
+    for v in variables:
+        if nativo:
+            # tipo de dato y codificación de la variable
+            file = [path for tile in tiles for path in files[tile].values()][0]
+            codificacion[v] = codificacionVariable(file, v)
+            codificacion[v]['factor'] = factores.get(v)
+            dtype, nulo = codificacion[v]['dtype'], codificacion[v]['_FillValue']
+        else:
+            codificacion[v] = None
+            dtype, nulo = float, np.nan
+        if out.get(v) is None:
+            data[v] = np.full(shape, nulo, dtype=dtype)
+        elif out[v].shape != shape:
+            print('¡ERROR! Las dimensiones de "out" {0} no coinciden con las de los datos {1}'.format(out[v].shape, shape))
+            return
+        else:
+            data[v] = out[v]
+            data[v][...] = nulo
+
+    # IMPORTAR DATOS
+    # --------------
+    if verbose:
+        print('Importar datos')
+
+    # pares (fecha, hoja) a leer. Se omiten las hojas fuera de la extensión y las fechas sin archivo
+    tareas = [(d, t) for d, date in enumerate(dates) for t, tile in enumerate(tiles)
+              if (ventanas[tile] is not None) & (date in files[tile])]
+    archivos = [files[tiles[t]][dates[d]] for d, t in tareas]
+    for (d, t), mapas in zip(tareas, leerHojas(archivos, variables, ventanas=[ventanas[tiles[t]] for d, t in tareas],
+                                               workers=workers, nativo=nativo, calidad=calidad)):
+        date, tile = dates[d], tiles[t]
+        if verbose:
+            print('Fecha {0:>2} de {1:>2}: {2}\t||\tTile {3:>2} de {4:>2}: {5}'.format(d + 1, len(dates), date,
+                                                                                       t + 1, len(tiles), tile), end='\r')
+        # escribir la hoja directamente en su posición del array total
+        for v, tmp in zip(variables, mapas):
+            mosaico.colocar(data[v][d], tile, tmp, ventanas[tile], rows, cols)
+        del mapas
+    if verbose:
+        print()
+
+    # multiplicar por el factor de escala (si existe)
+    for v in variables:
+        if (factores.get(v) is not None) & (not nativo):
+            data[v] *= factores[v]
+
+    if isinstance(var, str):
+        return data[var], Xmodis, Ymodis, dates, codificacion[var]
+    return data, Xmodis, Ymodis, dates, codificacion
+
+
+
+
+
+def iterarMODIS(path, product, var, tiles, factor=None, dateslim=None, extent=None, workers=None, prefetch=0,
+                qc=None, verbose=False):
+    """Versión en flujo de 'extraerMODIS': en lugar de un 'array' 3D con todas las fechas, genera los mapas de una en una, de modo que la memoria ocupada no depende de la longitud de la serie. Permite aplicar reductores (medias mensuales, sumas anuales...) a archivos de cualquier tamaño.
+
+    Entradas:
+    ---------
+    path:       string. Ruta donde se encuentran los datos de MODIS (ha de haber una subcarpeta para cada producto)
+    product:    string. Nombre del producto MODIS, p.ej. MOD16A2
+    var:        string o list. Variable (o lista de variables) de interés dentro de los archivos 'hdf'. Véase 'extraerMODIS'
+    tiles:      list. Hojas del producto MODIS a tratar
+    factor:     float o dict. Factor con el que multiplicar los datos para obtener su valor real. Con varias variables, diccionario {var: factor}
+    dateslim:   list. Fechas de inicio y fin del periodo de estudio en formato YYYY-MM-DD. Si es 'None', todas las fechas disponibles
+    extent:     list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', las hojas completas
+    workers:    int. Nº de procesos con los que leer los archivos 'hdf' en paralelo. Si es 'None', se leen en serie
+    prefetch:   int. Nº de mapas a preparar en segundo plano por delante del consumidor. Si es 0, no se precargan
+    qc:         boolean o dict. Regla de calidad a aplicar. Véase 'extraerMODIS'
+    verbose:    boolean. Si se quiere mostrar en pantalla el desarrollo de la función
+
+    Salidas:
+    --------
+    Genera tuplas (date, data) con la fecha y el mapa (Y, X) de la variable (o un diccionario {var: mapa} si 'var' es una lista). Las coordenadas del recorte se obtienen con 'prepararExtraccion'
+    """
+
+    variables = [var] if isinstance(var, str) else list(var)
+    factores = factor if isinstance(factor, dict) else {v: factor for v in variables}
+    calidad = None if not qc else {v: reglaQC(product, v, qc) for v in variables}
+
+    preparacion = prepararExtraccion(path, product, variables[0], tiles, dateslim=dateslim, extent=extent, verbose=verbose)
+    if preparacion is None:
+        return
+    files, dates, mosaico, Xmodis, Ymodis, rows, cols, ventanas = preparacion
+
+    # pares (fecha, hoja) a leer, en el mismo orden que las fechas
+    tareas = [(d, tile) for d, date in enumerate(dates) for tile in tiles
+              if (ventanas[tile] is not None) & (date in files[tile])]
+    archivos = [files[tile][dates[d]] for d, tile in tareas]
+
+    def mapas():
+        hojas = zip(tareas, leerHojas(archivos, variables, ventanas=[ventanas[tile] for d, tile in tareas],
+                                      workers=workers, calidad=calidad))
+        siguiente = next(hojas, None)
+        for d, date in enumerate(dates):
+            data = {v: np.full((len(Ymodis), len(Xmodis)), np.nan) for v in variables}
+            # colocar todas las hojas de la fecha
+            while (siguiente is not None) and (siguiente[0][0] == d):
+                (d_, tile), mapas = siguiente
+                for v, tmp in zip(variables, mapas):
+                    mosaico.colocar(data[v], tile, tmp, ventanas[tile], rows, cols)
+                siguiente = next(hojas, None)
+            for v in variables:
+                if factores.get(v) is not None:
+                    data[v] *= factores[v]
+            yield date, data[var] if isinstance(var, str) else data
+
+    for d, (date, data) in enumerate(precargar(mapas(), prefetch)):
+        if verbose:
+            print('Fecha {0:>3} de {1:>3}: {2}'.format(d + 1, len(dates), date), end='\r')
+        yield date, data
+    if verbose:
+        print()
+
+
+
+
+class Ensamblador:
+    def __init__(self, product, var, tiles, extent=None, factor=None, nativo=False, qc=None, catalogo=None):
+        """Mosaico de los gránulos de un producto a medida que van llegando (p.ej. según terminan sus descargas), sin esperar a tener todo el periodo. Cada gránulo se lee y se recorta en cuanto está disponible y se coloca en el mapa de su fecha; cada fecha se entrega en cuanto están todos sus gránulos.
+
+        Los gránulos se anuncian con 'programar' en orden cronológico antes de llegar con 'añadir'. Una fecha está completa cuando han llegado (o fallado) todos sus gránulos programados y ya se ha programado alguno de una fecha posterior, de modo que las fechas se entregan en orden. La malla total se calcula con el primer gránulo que llega.
+
+        Entradas:
+        ---------
+        product:   string. Nombre del producto MODIS, p.ej. MOD16A2
+        var:       string o list. Variable (o lista de variables) de interés dentro de los archivos 'hdf'
+        tiles:     list. Hojas del producto MODIS a tratar. Los gránulos de otras hojas se ignoran
+        extent:    list. Extensión a recortar [left, right, bottom, top] en coordenadas sinusoidales. Si es 'None', las hojas completas
+        factor:    float o dict. Factor con el que multiplicar los datos. Con varias variables, diccionario {var: factor}
+        nativo:    boolean. Si es True, los mapas conservan el tipo de dato original de la variable. Véase 'extraerMODIS'
+        qc:        boolean o dict. Regla de calidad a aplicar. Véase 'extraerMODIS'
+        catalogo:  class Catalogo. Catálogo en el que buscar o guardar los atributos de las hojas
+        """
+
+        self.product, self.var, self.tiles = product, var, list(tiles)
+        self.variables = [var] if isinstance(var, str) else list(var)
+        self.factores = factor if isinstance(factor, dict) else {v: factor for v in self.variables}
+        self.calidad = None if not qc else {v: reglaQC(product, v, qc) for v in self.variables}
+        self.extent, self.nativo, self.catalogo = extent, nativo, catalogo
+        # malla total, recorte y codificación; se definen con el primer gránulo
+        self.mosaico = None
+        self.codificacion = None
+        # nº de gránulos pendientes y mapas ya colocados de cada fecha no entregada
+        self.pendientes = {}
+        self.mapas = {}
+        # última fecha programada
+        self.ultima = None
+
+
+    def clave(self, file):
+        """Hoja y fecha de un gránulo a partir de su nombre. 'None' si no es un gránulo de las hojas de interés."""
+
+        info = analizarNombre(os.path.basename(file))
+        if (info is None) or (info['tile'] not in self.tiles):
+            return None
+        return info['tile'], datetime.strptime(info['fecha'], '%Y-%m-%d').date()
+
+
+    def preparar(self, file, tile, date):
+        """Calcula la malla total, el recorte y (si 'nativo') la codificación de las variables a partir del primer gránulo disponible."""
+
+        files = {t: {} for t in self.tiles}
+        files[tile][date] = file
+        self.mosaico = Mosaico(atributosHojas(files, self.tiles, product=self.product, var=self.variables[0],
+                                              catalogo=self.catalogo))
+        recorte = recortarMosaico(self.mosaico, self.extent)
+        if recorte is None:
+            raise ValueError('La extensión no interseca con las hojas')
+        self.X, self.Y, self.rows, self.cols, self.ventanas = recorte
+        if self.nativo:
+            self.codificacion = {v: codificacionVariable(file, v) for v in self.variables}
+            for v in self.variables:
+                self.codificacion[v]['factor'] = self.factores.get(v)
+
+
+    def programar(self, file):
+        """Anuncia un gránulo que llegará más adelante.
+
+        Entradas:
+        ---------
+        file:      string. Ruta del archivo 'hdf'
+        """
+
+        clave = self.clave(file)
+        if clave is None:
+            return
+        tile, date = clave
+        self.pendientes[date] = self.pendientes.get(date, 0) + 1
+        if (self.ultima is None) or (date > self.ultima):
+            self.ultima = date
+
+
+    def añadir(self, file, disponible=True):
+        """Lee y coloca en el mapa de su fecha un gránulo anunciado con 'programar'.
+
+        Entradas:
+        ---------
+        file:       string. Ruta del archivo 'hdf'
+        disponible: boolean. False si el gránulo no llegó (p.ej. falló su descarga); su hoja queda sin datos
+
+        Salidas:
+        --------
+        Lista de tuplas (date, data) de las fechas completadas. Véase 'completas'
+        """
+
+        clave = self.clave(file)
+        if clave is None:
+            return []
+        tile, date = clave
+        if disponible:
+            if self.mosaico is None:
+                self.preparar(file, tile, date)
+            if self.ventanas[tile] is not None:
+                mapas = leerHDF(file, self.variables, ventana=self.ventanas[tile], nativo=self.nativo,
+                                calidad=self.calidad)
+                if date not in self.mapas:
+                    self.mapas[date] = {v: self.lienzo(v) for v in self.variables}
+                for v, tmp in zip(self.variables, mapas):
+                    self.mosaico.colocar(self.mapas[date][v], tile, tmp, self.ventanas[tile], self.rows, self.cols)
+        self.pendientes[date] -= 1
+
+        return list(self.completas())
+
+
+    def lienzo(self, v):
+        """Mapa vacío del recorte para la variable 'v'."""
+
+        if self.nativo:
+            return np.full((len(self.Y), len(self.X)), self.codificacion[v]['_FillValue'],
+                           dtype=self.codificacion[v]['dtype'])
+        return np.full((len(self.Y), len(self.X)), np.nan)
+
+
+    def completas(self, final=False):
+        """Entrega, en orden cronológico, las fechas cuyos gránulos han llegado todos. Las fechas sin ningún gránulo leído se descartan.
+
+        Entradas:
+        ---------
+        final:     boolean. Si no van a llegar más gránulos. En ese caso se entregan todas las fechas pendientes, aunque les falte alguna hoja
+
+        Salidas:
+        --------
+        Genera tuplas (date, data) con la fecha y el mapa (Y, X) de la variable (o un diccionario {var: mapa} si 'var' es una lista)
+        """
+
+        for date in sorted(self.pendientes):
+            if (not final) and ((self.pendientes[date] > 0) or (date >= self.ultima)):
+                break
+            del self.pendientes[date]
+            data = self.mapas.pop(date, None)
+            if data is None:
+                continue
+            for v in self.variables:
+                if (self.factores.get(v) is not None) & (not self.nativo):
+                    data[v] *= self.factores[v]
+            yield date, data[self.var] if isinstance(self.var, str) else data
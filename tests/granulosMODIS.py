@@ -0,0 +1,72 @@
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Gránulos MODIS sintéticos para las pruebas. Se escriben con 'netCDF4' con la misma estructura que leen 'funciones_extraccion' y 'funciones_catalogo': el atributo 'StructMetadata.0' de HDF-EOS con la malla sinusoidal de la hoja y una variable 'int16' con su factor de escala y su valor nulo.
+#
+# ***
+# INDICE
+# ------
+# granulo
+
+
+
+import os
+import numpy as np
+from netCDF4 import Dataset
+
+
+# lado (m) de una hoja de la malla sinusoidal de MODIS
+LADO = 1111950.519667
+
+STRUCT_METADATA = """GROUP=GridStructure
+\tGROUP=GRID_1
+\t\tGridName="MOD_Grid"
+\t\tXDim={n}
+\t\tYDim={n}
+\t\tUpperLeftPointMtrs=({x0:.6f},{y1:.6f})
+\t\tLowerRightMtrs=({x1:.6f},{y0:.6f})
+\t\tProjection=GCTP_SNSOID
+\t\tProjParams=(6371007.181000,0,0,0,0,0,0,0,0,0,0,0,0)
+\t\tSphereCode=-1
+\t\tGridOrigin=HDFE_GD_UL
+\tEND_GROUP=GRID_1
+END_GROUP=GridStructure
+END
+"""
+
+
+
+
+def granulo(file, var, tile, n=20, seed=0):
+    """Escribe un gránulo sintético de una hoja MODIS.
+
+    Entradas:
+    ---------
+    file:      string. Ruta, nombre y extensión del archivo
+    var:       string. Nombre de la variable
+    tile:      string. Hoja MODIS, formato 'h00v00'
+    n:         int. Nº de filas y columnas
+    seed:      int. Semilla de los valores aleatorios
+
+    Salidas:
+    --------
+    data:      array (n, n). Valores reales (con el factor de escala aplicado) de la variable
+    """
+
+    h, v = int(tile[1:3]), int(tile[4:6])
+    x0, y1 = (h - 18) * LADO, (9 - v) * LADO
+    datos = np.random.default_rng(seed).integers(0, 500, (n, n)).astype('i2')
+
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    nc = Dataset(file, 'w', format='NETCDF4')
+    setattr(nc, 'StructMetadata.0', STRUCT_METADATA.format(n=n, x0=x0, x1=x0 + LADO, y0=y1 - LADO, y1=y1))
+    nc.createDimension('YDim', n)
+    nc.createDimension('XDim', n)
+    variable = nc.createVariable(var, 'i2', ('YDim', 'XDim'), fill_value=32767)
+    variable.scale_factor, variable.add_offset = 0.1, 0.
+    variable.set_auto_maskandscale(False)
+    variable[:] = datos
+    nc.close()
+
+    return datos * .1
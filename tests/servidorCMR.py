@@ -0,0 +1,123 @@
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Servidor HTTP local que imita la búsqueda de gránulos del CMR de Earthdata ('search/granules.umm_json', paginada con 'page_size' y 'page_num') y la descarga de los archivos que enlaza, para probar 'descargarCMR' sin conexión.
+#
+# ***
+# INDICE
+# ------
+# contenido
+# ServidorCMR
+
+
+
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+
+
+def contenido(nombre, size=50000):
+    """Contenido (bytes) reproducible de un archivo a partir de su nombre."""
+
+    bloque = hashlib.sha256(nombre.encode()).digest()
+
+    return (bloque * (size // len(bloque) + 1))[:size]
+
+
+
+
+class ServidorCMR:
+    def __init__(self, granulos, retraso=None, corruptos=()):
+        """Arranca el servidor en un puerto libre de '127.0.0.1', en un hilo en segundo plano.
+
+        Entradas:
+        ---------
+        granulos:  list. Nombres de los archivos que devuelve la búsqueda, en orden. Un nombre repetido aparece en varias páginas, como ocurre en el CMR si cambian los resultados durante la paginación
+        retraso:   callable. Segundos de espera antes de responder a la página 'k' (p.ej. para que las páginas lleguen desordenadas). Si es 'None', sin espera
+        corruptos: list. Archivos que se sirven con el tamaño correcto pero un contenido distinto del de su suma de control MD5
+        """
+
+        self.granulos = list(granulos)
+        self.retraso = retraso
+        self.corruptos = set(corruptos)
+        # estadísticas: páginas pedidas, máximo de páginas simultáneas y archivos servidos
+        self.paginas = []
+        self.maxPaginas = 0
+        self.archivos = []
+        self.activas = 0
+        self.candado = threading.Lock()
+
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def enviar(self, codigo, cuerpo, tipo='application/octet-stream'):
+                self.send_response(codigo)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/search/granules.umm_json':
+                    self.enviar(200, servidor.pagina(parse_qs(url.query)), 'application/json')
+                elif url.path.startswith('/data/'):
+                    nombre = url.path.split('/')[-1]
+                    with servidor.candado:
+                        servidor.archivos.append(nombre)
+                    cuerpo = contenido(nombre)
+                    if nombre in servidor.corruptos:
+                        cuerpo = bytes(reversed(cuerpo))
+                    self.enviar(200, cuerpo)
+                else:
+                    self.enviar(404, b'')
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = 'http://127.0.0.1:{0}'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+    def pagina(self, params):
+        """Respuesta JSON (UMM-G) a una página de la búsqueda."""
+
+        k, size = int(params.get('page_num', ['1'])[0]), int(params['page_size'][0])
+        with self.candado:
+            self.paginas.append(k)
+            self.activas += 1
+            self.maxPaginas = max(self.maxPaginas, self.activas)
+        try:
+            if self.retraso is not None:
+                time.sleep(self.retraso(k))
+            items = []
+            for nombre in self.granulos[(k - 1) * size:k * size]:
+                cuerpo = contenido(nombre)
+                urls = [{'URL': self.url + '/data/' + nombre, 'Type': 'GET DATA'},
+                        {'URL': self.url + '/opendap/' + nombre, 'Type': 'GET DATA'},
+                        {'URL': self.url + '/browse/' + nombre + '.jpg', 'Type': 'GET RELATED VISUALIZATION'}]
+                info = {'Name': nombre, 'SizeInBytes': len(cuerpo),
+                        'Checksum': {'Value': hashlib.md5(cuerpo).hexdigest(), 'Algorithm': 'MD5'}}
+                items.append({'umm': {'RelatedUrls': urls,
+                                      'DataGranule': {'ArchiveAndDistributionInformation': [info]}}})
+        finally:
+            with self.candado:
+                self.activas -= 1
+
+        return json.dumps({'hits': len(self.granulos), 'items': items}).encode()
+
+
+    def cerrar(self):
+        """Detiene el servidor."""
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,207 @@
+# coding: utf-8
+
+# INTRODUCCIÓN
+# ------------
+# Servidor HTTP local que imita la estructura de carpetas de https://e4ftl01.cr.usgs.gov/ (misión / producto / fecha / archivos), para probar 'descargarUSGS' sin conexión. Cada gránulo '.hdf' se sirve junto a su XML de metadatos ('.hdf.xml') con el tamaño y la suma de control 'cksum'. Admite peticiones 'Range' (206 y 416) y permite provocar errores temporales (503), cortes a mitad de descarga y archivos corruptos.
+#
+# ***
+# INDICE
+# ------
+# contenido
+# cksum
+# ServidorUSGS
+
+
+
+import time
+import hashlib
+import socket
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+
+
+def contenido(nombre, size=50000):
+    """Contenido (bytes) reproducible de un archivo a partir de su nombre."""
+
+    bloque = hashlib.sha256(nombre.encode()).digest()
+
+    return (bloque * (size // len(bloque) + 1))[:size]
+
+
+
+
+def cksum(datos):
+    """Suma de control POSIX 'cksum' de unos bytes (implementación independiente de la de 'funciones_descarga')."""
+
+    tabla = []
+    for i in range(256):
+        crc = i << 24
+        for j in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        tabla.append(crc & 0xFFFFFFFF)
+
+    crc = 0
+    for byte in datos + len(datos).to_bytes((len(datos).bit_length() + 7) // 8, 'little'):
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ tabla[(crc >> 24) ^ byte]
+
+    return ~crc & 0xFFFFFFFF
+
+
+
+
+class ServidorUSGS:
+    def __init__(self, productos, fallos=None, cortes=(), corruptos=(), retraso=0, size=50000, contenidos=None):
+        """Arranca el servidor en un puerto libre de '127.0.0.1', en un hilo en segundo plano.
+
+        Entradas:
+        ---------
+        productos: dict. Archivos de cada fecha de cada producto: {'MOLT/MOD16A2.006': {'2001.01.01': [nombres 'hdf']}}
+        fallos:    dict. Nº de peticiones iniciales a una ruta (p.ej. '/MOLT/MOD16A2.006/') que se responden con 503
+        cortes:    list. Archivos cuya primera descarga se corta tras enviar dos tercios de los datos
+        corruptos: list. Archivos que se sirven con un contenido distinto del indicado en su XML
+        retraso:   float. Segundos de espera antes de servir cada archivo
+        size:      int. Tamaño (bytes) de cada archivo. Para que un corte deje datos en el '.part' del cliente ha de superar 1,5 veces su bloque de escritura (1 MB)
+        """
+
+        self.productos = productos
+        self.fallos = dict(fallos or {})
+        self.cortes, self.corruptos = set(cortes), set(corruptos)
+        self.retraso = retraso
+        self.size = size
+        self.contenidos = dict(contenidos or {})
+        self._cksum = {}
+        # estadísticas: peticiones por ruta, inicio de cada petición 'Range' y máximo de descargas simultáneas
+        self.peticiones = Counter()
+        self.rangos = []
+        self.maxActivas = 0
+        self.activas = 0
+        self.candado = threading.Lock()
+
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def enviar(self, codigo, cuerpo, tipo='text/html', cabeceras={}):
+                self.send_response(codigo)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                for clave, valor in cabeceras.items():
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def do_GET(self):
+                with servidor.candado:
+                    servidor.peticiones[self.path] += 1
+                    n = servidor.peticiones[self.path]
+                if n <= servidor.fallos.get(self.path, 0):
+                    return self.enviar(503, b'Service Unavailable')
+                if self.path.endswith('/'):
+                    hrefs = servidor.listado(self.path)
+                    if hrefs is None:
+                        return self.enviar(404, b'')
+                    return self.enviar(200, ''.join('<a href="{0}">{0}</a>\n'.format(h) for h in hrefs).encode())
+                nombre = self.path.split('/')[-1]
+                if nombre.endswith('.hdf.xml'):
+                    return self.enviar(200, servidor.xml(nombre[:-4]), 'text/xml')
+                if nombre.endswith('.hdf'):
+                    with servidor.candado:
+                        servidor.activas += 1
+                        servidor.maxActivas = max(servidor.maxActivas, servidor.activas)
+                    try:
+                        time.sleep(servidor.retraso)
+                        self.archivo(nombre, n)
+                    finally:
+                        with servidor.candado:
+                            servidor.activas -= 1
+                    return
+                self.enviar(404, b'')
+
+            def archivo(self, nombre, n):
+                cuerpo = servidor.cuerpo(nombre)
+                if nombre in servidor.corruptos:
+                    cuerpo = bytes(reversed(cuerpo))
+                rango = self.headers.get('Range')
+                if rango is not None:
+                    inicio = int(rango.split('=')[1].split('-')[0])
+                    with servidor.candado:
+                        servidor.rangos.append((nombre, inicio))
+                    if inicio >= len(cuerpo):
+                        return self.enviar(416, b'', cabeceras={'Content-Range': 'bytes */{0}'.format(len(cuerpo))})
+                    return self.enviar(206, cuerpo[inicio:], 'application/octet-stream',
+                                       {'Content-Range': 'bytes {0}-{1}/{2}'.format(inicio, len(cuerpo) - 1,
+                                                                                   len(cuerpo))})
+                if (nombre in servidor.cortes) and (n == 1):
+                    # se anuncia el archivo completo pero se cierra la conexión tras dos tercios
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(cuerpo)))
+                    self.end_headers()
+                    self.wfile.write(cuerpo[:2 * len(cuerpo) // 3])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                self.enviar(200, cuerpo, 'application/octet-stream')
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = 'http://127.0.0.1:{0}/'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+    def listado(self, ruta):
+        """Enlaces de la página de índice de una carpeta. 'None' si no existe."""
+
+        partes = [p for p in ruta.strip('/').split('/') if p]
+        if len(partes) == 0:
+            return sorted({producto.split('/')[0] + '/' for producto in self.productos})
+        if len(partes) == 1:
+            return sorted(producto.split('/')[1] + '/' for producto in self.productos
+                          if producto.split('/')[0] == partes[0])
+        fechas = self.productos.get('/'.join(partes[:2]))
+        if fechas is None:
+            return None
+        if len(partes) == 2:
+            return ['../'] + sorted(fecha + '/' for fecha in fechas)
+        if partes[2] not in fechas:
+            return None
+        hrefs = []
+        for nombre in fechas[partes[2]]:
+            hrefs += [nombre, nombre + '.xml', nombre.replace('.hdf', '.jpg')]
+        return hrefs
+
+
+    def cuerpo(self, nombre):
+        """Contenido (bytes) de un archivo."""
+
+        if nombre in self.contenidos:
+            return self.contenidos[nombre]
+
+        return contenido(nombre, self.size)
+
+
+    def xml(self, nombre):
+        """XML de metadatos de LP DAAC de un archivo, con su tamaño y su suma de control 'cksum'."""
+
+        cuerpo = self.cuerpo(nombre)
+        if nombre not in self._cksum:
+            self._cksum[nombre] = cksum(cuerpo)
+
+        return ('<GranuleMetaDataFile><GranuleURMetaData><DataFiles><DataFileContainer>'
+                '<DistributedFileName>{0}</DistributedFileName><FileSize>{1}</FileSize>'
+                '<ChecksumType>CKSUM</ChecksumType><Checksum>{2}</Checksum>'
+                '</DataFileContainer></DataFiles></GranuleURMetaData></GranuleMetaDataFile>'
+                ''.format(nombre, len(cuerpo), self._cksum[nombre])).encode()
+
+
+    def cerrar(self):
+        """Detiene el servidor."""
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,127 @@
+# coding: utf-8
+"""Pruebas de 'canalizarMODIS' y de los netCDF que crea, contra el servidor local de 'servidorUSGS.py' con gránulos sintéticos de 'granulosMODIS.py'. Ejecutar con 'python -m pytest tests'.
+
+'funciones_MODIS' importa 'funciones_raster' del repositorio 'Calibrar' (en '../../Calibrar/py' respecto a la carpeta 'py'); si no está disponible, las pruebas se omiten."""
+
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+from datetime import date
+
+RUTA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py')
+sys.path.insert(0, RUTA)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from servidorUSGS import ServidorUSGS
+from granulosMODIS import granulo
+
+try:
+    directorio = os.getcwd()
+    os.chdir(RUTA)
+    try:
+        import funciones_MODIS
+    finally:
+        os.chdir(directorio)
+except Exception as e:
+    pytest.skip('no se puede importar funciones_MODIS: {0}'.format(e), allow_module_level=True)
+
+
+TILES = ['h17v04', 'h18v04']
+FECHAS = {'2001.01.01': 'A2001001', '2001.01.09': 'A2001009', '2001.01.17': 'A2001017'}
+
+
+def servidor(tmp_path):
+    """Servidor con tres fechas de MOD16A2 de dos hojas cada una y los datos de cada fecha."""
+
+    productos, contenidos, datos = {'MOLT/MOD16A2.006': {}}, {}, {}
+    for k, (fecha, juliano) in enumerate(FECHAS.items()):
+        productos['MOLT/MOD16A2.006'][fecha] = []
+        for tile in TILES:
+            nombre = 'MOD16A2.{0}.{1}.006.2019001000000.hdf'.format(juliano, tile)
+            file = str(tmp_path / 'origen' / nombre)
+            datos[(fecha, tile)] = granulo(file, 'ET_500m', tile, seed=10 * k + len(datos))
+            with open(file, 'rb') as f:
+                contenidos[nombre] = f.read()
+            productos['MOLT/MOD16A2.006'][fecha].append(nombre)
+
+    return ServidorUSGS(productos, contenidos=contenidos), datos
+
+
+def test_canalizar_y_leer(tmp_path):
+    usgs, datos = servidor(tmp_path)
+    file = str(tmp_path / 'ET.nc')
+    try:
+        nuevas = funciones_MODIS.canalizarMODIS(file, str(tmp_path / 'datos'), 'MOD16A2.006', 'ET_500m', TILES,
+                                                username='u', password='p', url=usgs.url, inventario=False,
+                                                verbose=False)
+    finally:
+        usgs.cerrar()
+
+    assert nuevas == [date(2001, 1, 1), date(2001, 1, 9), date(2001, 1, 17)]
+    modis = funciones_MODIS.netCDF2MODIS(file)
+    assert modis.crs.equals(funciones_MODIS.sinusoidal)
+    assert list(modis.times) == nuevas
+    assert modis.data.shape == (3, 20, 40)
+    np.testing.assert_allclose(modis.data[1, :, :20], datos[('2001.01.09', 'h17v04')], rtol=1e-6)
+    np.testing.assert_allclose(modis.data[1, :, 20:], datos[('2001.01.09', 'h18v04')], rtol=1e-6)
+
+
+def test_actualizar_y_leer(tmp_path):
+    usgs, datos = servidor(tmp_path)
+    file, path = str(tmp_path / 'ET.nc'), tmp_path / 'datos'
+    try:
+        funciones_MODIS.canalizarMODIS(file, str(path), 'MOD16A2.006', 'ET_500m', TILES, end='2001-01-10',
+                                       username='u', password='p', url=usgs.url, inventario=False, verbose=False)
+    finally:
+        usgs.cerrar()
+    # la última fecha aparece en la carpeta local
+    for tile in TILES:
+        nombre = 'MOD16A2.A2001017.{0}.006.2019001000000.hdf'.format(tile)
+        os.replace(tmp_path / 'origen' / nombre, path / 'MOD16A2' / nombre)
+
+    nuevas = funciones_MODIS.actualizarMODIS(file, str(path), 'MOD16A2', 'ET_500m', TILES, verbose=False)
+
+    assert list(nuevas) == [date(2001, 1, 17)]
+    modis = funciones_MODIS.netCDF2MODIS(file)
+    assert list(modis.times) == [date(2001, 1, 1), date(2001, 1, 9), date(2001, 1, 17)]
+    np.testing.assert_allclose(modis.data[2, :, 20:], datos[('2001.01.17', 'h18v04')], rtol=1e-6)
+
+
+def test_rechazar_netcdf_reproyectado(tmp_path, monkeypatch):
+    file = str(tmp_path / 'ET.nc')
+    nc = funciones_MODIS.crearNetCDF(file, 'ET_500m', 'mm', np.arange(5) * 500. + 4e5, np.arange(5) * -500. + 4.5e6,
+                                     funciones_MODIS.CRS.from_epsg(25830))
+    nc['ET_500m'][0, :, :] = np.zeros((5, 5))
+    nc['time'][0] = (date(2001, 1, 1) - date(1, 1, 1)).days
+    nc.close()
+    usgs, datos = servidor(tmp_path)
+    monkeypatch.setattr(funciones_MODIS, 'extraerMODIS', lambda *args, **kwargs: pytest.fail('no debe extraer'))
+    try:
+        assert funciones_MODIS.actualizarMODIS(file, str(tmp_path / 'origen'), 'MOD16A2', 'ET_500m', TILES,
+                                               verbose=False) is None
+        assert funciones_MODIS.canalizarMODIS(file, str(tmp_path / 'datos'), 'MOD16A2.006', 'ET_500m', TILES,
+                                              username='u', password='p', url=usgs.url, inventario=False,
+                                              verbose=False) is None
+    finally:
+        usgs.cerrar()
+
+    assert sum(usgs.peticiones.values()) == 0
+    assert funciones_MODIS.netCDF2MODIS(file).crs.to_epsg() == 25830
+
+
+def test_credenciales_en_el_hilo_principal(tmp_path, monkeypatch):
+    hilos = []
+    def credenciales(username=None, password=None):
+        hilos.append(threading.current_thread())
+        return 'u', 'p'
+    monkeypatch.setattr(funciones_MODIS, 'credencialesEarthdata', credenciales)
+    usgs, datos = servidor(tmp_path)
+    try:
+        nuevas = funciones_MODIS.canalizarMODIS(str(tmp_path / 'ET.nc'), str(tmp_path / 'datos'), 'MOD16A2.006',
+                                                'ET_500m', TILES, url=usgs.url, inventario=False, verbose=False)
+    finally:
+        usgs.cerrar()
+
+    assert hilos == [threading.main_thread()]
+    assert len(nuevas) == 3
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Pruebas de 'descargarCMR' contra el servidor local de 'servidorCMR.py'. Ejecutar con 'python -m pytest tests'."""
+
+import os
+import sys
+from queue import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from funciones_descarga import descargarCMR
+from servidorCMR import ServidorCMR
+
+
+def nombres(n):
+    return ['MOD10A2.A2001{0:03d}.{1}.006.2016001000000.hdf'.format(1 + 8 * (i // 2), ['h17v04', 'h18v04'][i % 2])
+            for i in range(n)]
+
+
+def vaciar(cola):
+    avisos = []
+    while not cola.empty():
+        avisos.append(cola.get())
+    return avisos
+
+
+def test_orden_de_paginas_y_duplicados(tmp_path):
+    granulos = nombres(10)
+    # el gránulo 3 se repite al principio de la segunda página; las últimas páginas responden antes
+    servidor = ServidorCMR(granulos[:3] + granulos[3:4] + granulos[3:], retraso=lambda k: .2 / k)
+    try:
+        cola = Queue()
+        fallidos = descargarCMR(str(tmp_path), 'MOD10A2', '6', cmr=servidor.url, page_size=3, workers=2, paginas=3,
+                                avisos=cola, verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert fallidos == []
+    avisos = vaciar(cola)
+    programados = [os.path.basename(file) for file, estado in avisos if estado is None]
+    assert programados == granulos
+    assert sorted(os.listdir(tmp_path / 'MOD10A2')) == sorted(granulos)
+    assert sorted(servidor.archivos) == sorted(granulos)
+    assert sorted(servidor.paginas) == [1, 2, 3, 4]
+    assert 1 < servidor.maxPaginas <= 3
+
+
+def test_limite_de_paginas_simultaneas(tmp_path):
+    servidor = ServidorCMR(nombres(8), retraso=lambda k: .05)
+    try:
+        descargarCMR(str(tmp_path), 'MOD10A2', '6', cmr=servidor.url, page_size=2, workers=2, paginas=1,
+                     verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert servidor.maxPaginas == 1
+
+
+def test_suma_de_control(tmp_path):
+    granulos = nombres(4)
+    servidor = ServidorCMR(granulos, corruptos=[granulos[1]])
+    try:
+        cola = Queue()
+        fallidos = descargarCMR(str(tmp_path), 'MOD10A2', '6', cmr=servidor.url, workers=2, avisos=cola,
+                                verbose=False)
+        # sin verificar, el archivo corrupto se acepta
+        sinVerificar = descargarCMR(str(tmp_path / 'b'), 'MOD10A2', '6', cmr=servidor.url, verificar=False,
+                                    verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert [os.path.basename(tarea[1]) for tarea in fallidos] == [granulos[1]]
+    assert sorted(os.listdir(tmp_path / 'MOD10A2')) == sorted(granulos[:1] + granulos[2:])
+    assert (os.path.join(str(tmp_path), 'MOD10A2', granulos[1]), False) in vaciar(cola)
+    assert sinVerificar == []
+    assert sorted(os.listdir(tmp_path / 'b' / 'MOD10A2')) == sorted(granulos)
@@ -0,0 +1,113 @@
+# coding: utf-8
+"""Pruebas de 'descargarUSGS' contra el servidor local de 'servidorUSGS.py'. Ejecutar con 'python -m pytest tests'."""
+
+import os
+import sys
+from queue import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from funciones_descarga import descargarUSGS
+from servidorUSGS import ServidorUSGS, contenido
+
+
+FECHAS = ['2001.01.01', '2001.01.09', '2001.01.17']
+
+
+def productos(tiles=('h17v04', 'h18v04')):
+    return {'MOLT/MOD16A2.006': {fecha: ['MOD16A2.A2001{0:03d}.{1}.006.2019001000000.hdf'.format(1 + 8 * k, tile)
+                                         for tile in tiles] for k, fecha in enumerate(FECHAS)}}
+
+
+def todos(productos):
+    return sorted(nombre for fechas in productos.values() for nombres in fechas.values() for nombre in nombres)
+
+
+def comprobar(carpeta, nombres, size=50000):
+    assert sorted(os.listdir(carpeta)) == sorted(nombres)
+    for nombre in nombres:
+        with open(os.path.join(carpeta, nombre), 'rb') as f:
+            assert f.read() == contenido(nombre, size)
+
+
+def test_descarga_y_avisos_en_orden(tmp_path):
+    servidor = ServidorUSGS(productos())
+    try:
+        cola = Queue()
+        fallidos = descargarUSGS(str(tmp_path), 'MOD16A2.006', url=servidor.url, inventario=False, avisos=cola,
+                                 verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert fallidos == []
+    comprobar(tmp_path / 'MOD16A2', todos(productos()))
+    programados = []
+    while not cola.empty():
+        file, estado = cola.get()
+        if estado is None:
+            programados.append(os.path.basename(file))
+    assert programados == todos(productos())
+
+
+def test_reintentos(tmp_path):
+    nombre = productos()['MOLT/MOD16A2.006']['2001.01.09'][0]
+    fallos = {'/MOLT/MOD16A2.006/': 1, '/MOLT/MOD16A2.006/2001.01.09/' + nombre: 1}
+    servidor = ServidorUSGS(productos(), fallos=fallos)
+    try:
+        fallidos = descargarUSGS(str(tmp_path), 'MOD16A2.006', url=servidor.url, inventario=False, verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert fallidos == []
+    comprobar(tmp_path / 'MOD16A2', todos(productos()))
+    for ruta in fallos:
+        assert servidor.peticiones[ruta] == 2
+
+
+def test_limite_por_servidor(tmp_path):
+    servidor = ServidorUSGS(productos(), retraso=.1)
+    try:
+        descargarUSGS(str(tmp_path), 'MOD16A2.006', url=servidor.url, workers=8, porHost=2, inventario=False,
+                      verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert servidor.maxActivas == 2
+
+
+def test_reanudar(tmp_path):
+    # archivos mayores que el bloque de escritura (1 MB), para que el corte deje datos en el '.part'
+    size = 2 * 2**20
+    archivos = productos(tiles=['h17v04'])
+    cortado, parcial, completo = [archivos['MOLT/MOD16A2.006'][fecha][0] for fecha in FECHAS]
+    # restos de una ejecución anterior: un '.part' a medias y otro completo
+    carpeta = tmp_path / 'MOD16A2'
+    os.makedirs(carpeta)
+    with open(carpeta / (parcial + '.part'), 'wb') as f:
+        f.write(contenido(parcial, size)[:1000])
+    with open(carpeta / (completo + '.part'), 'wb') as f:
+        f.write(contenido(completo, size))
+    servidor = ServidorUSGS(archivos, cortes=[cortado], size=size)
+    try:
+        fallidos = descargarUSGS(str(tmp_path), 'MOD16A2.006', url=servidor.url, inventario=False, verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert fallidos == []
+    comprobar(carpeta, todos(archivos), size)
+    inicios = dict(servidor.rangos)
+    assert inicios[cortado] == 2**20
+    assert inicios[parcial] == 1000
+    assert inicios[completo] == size
+
+
+def test_suma_de_control(tmp_path):
+    corrupto = productos()['MOLT/MOD16A2.006']['2001.01.09'][1]
+    servidor = ServidorUSGS(productos(), corruptos=[corrupto])
+    try:
+        fallidos = descargarUSGS(str(tmp_path), 'MOD16A2.006', url=servidor.url, inventario=False, verbose=False)
+    finally:
+        servidor.cerrar()
+
+    assert [os.path.basename(tarea[1]) for tarea in fallidos] == [corrupto]
+    comprobar(tmp_path / 'MOD16A2', [nombre for nombre in todos(productos()) if nombre != corrupto])